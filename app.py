@@ -2,7 +2,7 @@ import os
 import sys
 import psycopg2
 
-from flask import Flask, jsonify, request, Request
+from flask import Flask, jsonify, request, Request, current_app
 from flask_restx import Api, Resource
 from flask_cors import CORS
 
@@ -16,11 +16,18 @@ sys.path.insert(0, project_root)
 from src.nbs import api as nbs_api
 from src.supermarkets import api as supermarkets_api
 from src.news import api as news_api
+from src.catalog import api as catalog_api
+from src.series import api as series_api
+from src.compare import api as compare_api
+from src.price_index import api as price_index_api
+from src.monitoring import api as monitoring_api
+from src.sketches import api as distribution_api
+from src.access_log import init_access_log
+from src.compression import init_compression
+from src.resilience import init_resilience
+from src.batch import parse_batch, run_batch, BATCH_MAX_REQUESTS
 
 
-app = Flask(__name__)
-CORS(app)
-
 api = Api(
     version="1.0",
     title="Food Price Prediction API",
@@ -32,7 +39,48 @@ api = Api(
 api.add_namespace(nbs_api, "/nbs")
 api.add_namespace(supermarkets_api, "/supermarkets")
 api.add_namespace(news_api, "/news")
-api.init_app(app)
+api.add_namespace(catalog_api, "/catalog")
+api.add_namespace(series_api, "/series")
+api.add_namespace(compare_api, "/compare")
+api.add_namespace(price_index_api, "/price-index")
+api.add_namespace(monitoring_api)
+api.add_namespace(distribution_api, "/distribution")
+
+
+@api.route("/batch")
+@api.doc(
+    description="Runs several GET requests concurrently and returns all their "
+    f"results in one response. At most {BATCH_MAX_REQUESTS} requests per batch.",
+)
+class Batch(Resource):
+    """
+    Runs several GET requests concurrently and returns all their results in one
+    response, e.g.
+    {"requests": [{"path": "/nbs/year/", "params": {"food_item": "oil", ...}}]}
+    """
+
+    def post(self):
+        sub_requests = parse_batch(request.get_json(silent=True))
+        results, elapsed = run_batch(current_app._get_current_object(), sub_requests)
+        return jsonify({"data": results, "elapsed": round(elapsed, 3)})
+
+
+def create_app():
+    """
+    Builds the Flask app. Module state (the price store, catalog and caches) is
+    created lazily and shared by every app in the process, so under a
+    preloading server it is warmed once and inherited by the forked workers.
+    """
+    app = Flask(__name__)
+    CORS(app)
+    init_access_log(app)
+    init_compression(app)
+    init_resilience(app)
+    api.init_app(app)
+    return app
+
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,11 @@
+# Entry point for the cooperative (gevent) serving mode, see src/green.py.
+# Patching has to happen before anything else imports socket or threading.
+from gevent import monkey
+
+monkey.patch_all()
+
+from src.green import make_psycopg2_green
+
+make_psycopg2_green()
+
+from app import app
@@ -0,0 +1,51 @@
+# Production settings, used with `gunicorn` from the project root:
+#
+#     WORKER_CLASS=gthread gunicorn
+#
+# The app is loaded and warmed once in the master, then forked, so workers
+# share the price store, snapshot pages and caches copy-on-write and take
+# traffic warm. For a zero-downtime code reload send USR2 to the master (a new
+# master loads and warms the new code, then forks its workers) and TERM the old
+# master once the new workers are up. HUP re-forks workers from the warm master.
+import os
+import multiprocessing
+
+# sync: one request per worker. gthread: `threads` requests per worker.
+# async: gevent greenlets, for many slow DB and LLM waits (see src/green.py).
+WORKER_CLASSES = {"sync": "sync", "gthread": "gthread", "async": "gevent"}
+worker_mode = os.getenv("WORKER_CLASS", "gthread").lower().strip()
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = WORKER_CLASSES[worker_mode]
+threads = int(os.getenv("THREADS", "4"))
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", "1000"))
+timeout = int(os.getenv("TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# gevent has to patch the process before the app is imported, so the async mode
+# loads the app in each worker instead of preloading it.
+preload_app = worker_mode != "async"
+wsgi_app = "green_app:app" if worker_mode == "async" else "app:app"
+
+
+def when_ready(server):
+    if preload_app:
+        from src.warmup import warm, prepare_fork
+
+        warm(server.app.wsgi())
+        prepare_fork()
+
+
+def post_fork(server, worker):
+    from src.warmup import after_fork
+
+    after_fork()
+
+
+def post_worker_init(worker):
+    if not preload_app:
+        from src.warmup import warm
+
+        warm(worker.wsgi)
@@ -0,0 +1,74 @@
+"""
+A TCP proxy adding a fixed delay to every reply, to load test against a
+database that is as far away as in production (see src/loadtest.py):
+
+    python scripts/latency_proxy.py --listen 127.0.0.2:5432 \\
+        --target 127.0.0.1:5432 --delay-ms 20
+
+Point HOST at the listening address. Each chunk the target sends is forwarded
+`--delay-ms` after it arrived, so the delay is added once per round trip and
+doesn't throttle large results.
+"""
+
+import time
+import queue
+import socket
+import argparse
+import threading
+
+
+def address(value):
+    host, port = value.rsplit(":", 1)
+    return host, int(port)
+
+
+def pump(source, destination, delay):
+    """Copies `source` to `destination`, each chunk `delay` seconds after it arrived."""
+    chunks = queue.Queue()
+
+    def send():
+        while True:
+            due, data = chunks.get()
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            if not data:
+                break
+            try:
+                destination.sendall(data)
+            except OSError:
+                break
+        destination.close()
+
+    threading.Thread(target=send, daemon=True).start()
+    while True:
+        try:
+            data = source.recv(65536)
+        except OSError:
+            data = b""
+        chunks.put((time.monotonic() + delay, data))
+        if not data:
+            break
+
+
+def serve(listen, target, delay):
+    server = socket.create_server(listen)
+    while True:
+        client, _ = server.accept()
+        upstream = socket.create_connection(target)
+        for sock in (client, upstream):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(target=pump, args=(client, upstream, 0), daemon=True).start()
+        threading.Thread(
+            target=pump, args=(upstream, client, delay), daemon=True
+        ).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add latency to a TCP service.")
+    parser.add_argument("--listen", type=address, required=True, help="host:port")
+    parser.add_argument("--target", type=address, required=True, help="host:port")
+    parser.add_argument("--delay-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    serve(args.listen, args.target, args.delay_ms / 1000)
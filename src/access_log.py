@@ -0,0 +1,126 @@
+"""
+Sampled request capture for traffic replay (see src/replay.py).
+
+When ACCESS_LOG_PATH is set, a share (ACCESS_LOG_SAMPLE_RATE) of GET requests
+is appended to it as one compact JSON line each:
+
+    {"t": 1718000000.123, "p": "/nbs/year/", "q": {"food_item": ["oil"], ...},
+     "a": "application/json", "s": 200, "ms": 12.4}
+
+with the time, path, query arguments (every value of a repeated one, e.g.
+`series` for /compare), Accept header, status and server-side latency. Nothing identifying the client (address, cookies, other headers) is
+kept, and the values of free-text parameters (ACCESS_LOG_REDACT, e.g. the
+typeahead `q`) are cut to their first few characters. Requests the app makes
+to itself (background revalidations and POST /batch sub-requests) are not
+captured. Lines are written by a background thread so requests never wait on
+the disk, each in one O_APPEND write so workers sharing the file never
+interleave partial lines.
+"""
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+
+from flask import g, request
+
+from src.batch import BATCH_SUB_REQUEST
+from src.resilience import REVALIDATING
+
+
+logger = logging.getLogger(__name__)
+
+ACCESS_LOG_PATH = os.getenv("ACCESS_LOG_PATH", "")
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "0.1"))
+ACCESS_LOG_REDACT = {
+    name.strip()
+    for name in os.getenv("ACCESS_LOG_REDACT", "q").split(",")
+    if name.strip()
+}
+REDACTED_LENGTH = 3
+
+# The API docs aren't traffic worth replaying.
+IGNORED_PATHS = ("/swagger", "/swaggerui")
+
+_lines = queue.SimpleQueue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def write_lines(path):
+    """Appends queued lines to the log, one unbuffered write per line."""
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    while True:
+        os.write(fd, _lines.get())
+
+
+def start_writer():
+    """Starts the writer thread, once per process (and again after a fork)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(
+                target=write_lines,
+                args=(ACCESS_LOG_PATH,),
+                name="access-log",
+                daemon=True,
+            )
+            _writer.start()
+
+
+def anonymized_args():
+    return {
+        name: [
+            value[:REDACTED_LENGTH] if name in ACCESS_LOG_REDACT else value
+            for value in values
+        ]
+        for name, values in request.args.lists()
+    }
+
+
+def start_capture():
+    if (
+        request.method == "GET"
+        and not request.path.startswith(IGNORED_PATHS)
+        and not request.environ.get(REVALIDATING)
+        and not request.environ.get(BATCH_SUB_REQUEST)
+        and random.random() < ACCESS_LOG_SAMPLE_RATE
+    ):
+        g.access_log_started = time.perf_counter()
+
+
+def capture(response):
+    started = g.pop("access_log_started", None)
+    if started is None:
+        return response
+
+    line = {
+        "t": round(time.time(), 3),
+        "p": request.path,
+        "q": anonymized_args(),
+        "a": request.headers.get("Accept", ""),
+        "s": response.status_code,
+        "ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    start_writer()
+    _lines.put((json.dumps(line, separators=(",", ":")) + "\n").encode("utf-8"))
+    return response
+
+
+def init_access_log(app):
+    """
+    Registers request capture on a Flask app when ACCESS_LOG_PATH is set. Call
+    it before the other hooks so the latency covers them and the status is the
+    one sent.
+    """
+    if not ACCESS_LOG_PATH:
+        return
+    app.before_request(start_capture)
+    app.after_request(capture)
+    logger.info(
+        "Capturing %.0f%% of requests to %s",
+        ACCESS_LOG_SAMPLE_RATE * 100,
+        ACCESS_LOG_PATH,
+    )
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from flask import abort
+
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+BATCH_TIMEOUT_SECONDS = float(os.getenv("BATCH_TIMEOUT_SECONDS", "10"))
+
+# Shared by every batch, so concurrent batches can't use more than this many
+# threads (and, at most, as many pooled database connections).
+executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BATCH_WORKERS", "8")), thread_name_prefix="batch"
+)
+
+# Sub-responses are embedded in the batch, so they must be plain JSON.
+SUB_REQUEST_HEADERS = {"Accept": "application/json", "Accept-Encoding": "identity"}
+
+# Set on sub-requests, so the access log doesn't record them as client traffic.
+BATCH_SUB_REQUEST = "batch.sub_request"
+
+
+def parse_batch(payload):
+    """
+    Validates a `{"requests": [{"path": ..., "params": {...}}, ...]}` payload and
+    returns the (path, query string) of every sub-request. Parameters may be
+    given in the path, in `params` (a list value repeats the parameter) or in
+    both, as long as no name appears in both.
+    """
+    items = payload.get("requests") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        return abort(400, "Expected a JSON body with a non-empty 'requests' list")
+    if len(items) > BATCH_MAX_REQUESTS:
+        return abort(400, f"A batch can hold at most {BATCH_MAX_REQUESTS} requests")
+
+    sub_requests = []
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("path"), str):
+            return abort(400, "Every request needs a 'path'")
+
+        params = item.get("params") or {}
+        if not isinstance(params, dict):
+            return abort(400, "'params' must be an object")
+
+        path = urlsplit(item["path"])
+        if path.scheme or path.netloc or not path.path.startswith("/"):
+            return abort(400, "Paths must be relative to the API, e.g. /nbs/year/")
+        if path.path.rstrip("/") == "/batch":
+            return abort(400, "Batches can't be nested")
+
+        query = parse_qsl(path.query, keep_blank_values=True)
+        repeated = sorted({name for name, _ in query} & set(params))
+        if repeated:
+            return abort(
+                400,
+                "Parameters can't be given both in the path and in 'params': "
+                + ", ".join(repeated),
+            )
+        for name, value in params.items():
+            values = value if isinstance(value, list) else [value]
+            query += [(name, str(value)) for value in values]
+
+        sub_requests.append((path.path, urlencode(query)))
+    return sub_requests
+
+
+def dispatch(app, path, query_string):
+    """
+    Runs one GET sub-request through the app in its own request context and
+    returns its {"status", "data"} result.
+    """
+    with app.test_request_context(
+        path,
+        method="GET",
+        query_string=query_string,
+        headers=SUB_REQUEST_HEADERS,
+        environ_base={BATCH_SUB_REQUEST: True},
+    ):
+        response = app.full_dispatch_request()
+        body = response.get_data()
+        # Releases what a streamed response holds, e.g. a pooled connection.
+        response.close()
+
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        data = body.decode("utf-8", "replace")
+    return {"status": response.status_code, "data": data}
+
+
+def run_batch(app, sub_requests):
+    """
+    Runs the sub-requests concurrently on the shared pool and returns their
+    results in order. Sub-requests still running after BATCH_TIMEOUT_SECONDS
+    are reported with status 504.
+    """
+    started = time.monotonic()
+    futures = [
+        executor.submit(dispatch, app, path, query_string)
+        for path, query_string in sub_requests
+    ]
+    wait(futures, timeout=BATCH_TIMEOUT_SECONDS)
+
+    results = []
+    for future in futures:
+        if not future.done():
+            future.cancel()
+            results.append({"status": 504, "data": {"message": "Timed out"}})
+        elif future.exception() is not None:
+            results.append({"status": 500, "data": {"message": "Internal error"}})
+        else:
+            results.append(future.result())
+    return results, time.monotonic() - started
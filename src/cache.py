@@ -0,0 +1,65 @@
+import os
+import time
+import threading
+
+from collections import OrderedDict
+
+
+class TTLCache:
+    """A small thread-safe LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value for `key`, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def get_with_age(self, key):
+        """
+        Returns the (age in seconds, value) of `key`, or None if it is missing or
+        expired. Doesn't count as a use for the LRU order.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            age = time.monotonic() - entry[0]
+            if age > self.ttl:
+                del self._entries[key]
+                return None
+            return age, entry[1]
+
+    def set(self, key, value):
+        """Stores `value` under `key`, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drops every entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = TTLCache(
+    maxsize=int(os.getenv("CACHE_MAX_ENTRIES", "1024")),
+    ttl=int(os.getenv("CACHE_TTL_SECONDS", "300")),
+)
@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+import psycopg2
+
+from flask import jsonify, request, abort
+from flask_restx import Resource, Namespace
+
+from src.db import pooled_cursor
+from src.engine import get_store, NBS, SUPERMARKET
+
+
+api = Namespace(
+    "Catalog", description="Valid food items, item types and categories"
+)
+
+# How often (in seconds) the catalog is re-read from the database when the
+# in-memory price store is disabled.
+CATALOG_REFRESH_SECONDS = int(os.getenv("CATALOG_REFRESH_SECONDS", "300"))
+
+CATALOG_QUERY = """
+    SELECT DISTINCT
+        CASE WHEN source = 'NBS' THEN 'NBS' ELSE 'Supermarket' END,
+        food_item,
+        item_type,
+        category
+    FROM "Cleaned-Food-Prices"
+    WHERE (source = 'NBS' OR vendor_type = 'Supermarket')
+        AND price IS NOT NULL
+        AND LENGTH(category) > 0
+"""
+
+# Used until the database has been reached once.
+FALLBACK_FILES = {
+    NBS: "dashboard_items/nbs_dashboard.json",
+    SUPERMARKET: "dashboard_items/supermarkets_dashboard.json",
+}
+
+SOURCES = {"nbs": NBS, "supermarkets": SUPERMARKET}
+
+
+class PrefixTrie:
+    """A character trie mapping name prefixes to the entries stored under them."""
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, name, entry):
+        node = self.root
+        for char in name:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(entry)
+
+    def search(self, prefix, limit=10):
+        """Returns up to `limit` entries whose name starts with `prefix`, sorted."""
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+
+        results, stack = [], [node]
+        while stack and len(results) < limit:
+            node = stack.pop()
+            results.extend(node.get(None, []))
+            # Reversed so the alphabetically first branch is popped first.
+            branches = sorted(filter(None, node), reverse=True)
+            stack.extend(node[char] for char in branches)
+        return results[:limit]
+
+
+class Catalog:
+    """
+    The valid (food_item, item_type, category) triples of one source, as a
+    {food_item: {item_type: [categories]}} mapping shaped like the dashboard
+    files, plus a hashed set of triples and a prefix trie for typeahead.
+    """
+
+    def __init__(self, triples):
+        self.triples = frozenset(triples)
+        self.tree = {}
+        for food_item, item_type, category in sorted(self.triples):
+            self.tree.setdefault(food_item, {}).setdefault(item_type, []).append(
+                category
+            )
+
+        self.trie = PrefixTrie()
+        for food_item, item_types in self.tree.items():
+            self.trie.add(food_item, {"food_item": food_item})
+            for item_type in item_types:
+                entry = {"food_item": food_item, "item_type": item_type}
+                self.trie.add(item_type, entry)
+
+        self.valid_items = ", ".join(self.tree)
+        self.etag = hashlib.blake2b(
+            json.dumps(self.tree, sort_keys=True).encode(), digest_size=16
+        ).hexdigest()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r") as file:
+            tree = json.load(file)
+        return cls(
+            (food_item, item_type, category)
+            for food_item, item_types in tree.items()
+            for item_type, categories in item_types.items()
+            for category in categories
+        )
+
+    def __contains__(self, food_item):
+        return food_item in self.tree
+
+    def __getitem__(self, food_item):
+        return self.tree[food_item]
+
+    def keys(self):
+        return self.tree.keys()
+
+    def items(self):
+        return self.tree.items()
+
+    def has_series(self, food_item, item_type, category):
+        return (food_item, item_type, category) in self.triples
+
+
+_catalogs = {}
+_version = None
+_checked_at = 0.0
+_catalog_lock = threading.Lock()
+
+
+def load_catalogs():
+    """
+    Derives the catalogs of both sources from the in-memory store when it is
+    loaded, and from the database otherwise. Returns them with the version they
+    were built from, or None if the database can't be reached.
+    """
+    store = get_store()
+    if store is not None:
+        version, keys = store.watermark, list(store.series)
+    else:
+        try:
+            with pooled_cursor() as cur:
+                cur.execute(CATALOG_QUERY)
+                keys = cur.fetchall()
+        except psycopg2.Error:
+            return None
+        version = time.monotonic()
+
+    triples = {NBS: [], SUPERMARKET: []}
+    for source, food_item, item_type, category in keys:
+        if category:
+            triples[source].append((food_item, item_type, category))
+    return version, {source: Catalog(items) for source, items in triples.items()}
+
+
+def get_catalog(source):
+    """
+    Returns the catalog of `source` ("NBS" or "Supermarket"). It follows the
+    store's watermark, or is re-read every CATALOG_REFRESH_SECONDS without one,
+    and falls back to the dashboard files until the database is reachable.
+    """
+    global _catalogs, _version, _checked_at
+
+    now = time.monotonic()
+    store = get_store()
+    stale = (
+        store.watermark != _version
+        if store is not None
+        else now - _checked_at > CATALOG_REFRESH_SECONDS
+    )
+    if (stale or not _catalogs) and _catalog_lock.acquire(blocking=not _catalogs):
+        try:
+            _checked_at = now
+            loaded = load_catalogs()
+            if loaded is not None:
+                _version, _catalogs = loaded
+            elif not _catalogs:
+                _catalogs = {
+                    source: Catalog.from_file(path)
+                    for source, path in FALLBACK_FILES.items()
+                }
+        finally:
+            _catalog_lock.release()
+    return _catalogs[source]
+
+
+def parse_source():
+    source = request.args.get("source", "").lower().strip()
+    if source and source not in SOURCES:
+        return abort(400, f"Invalid source. Choose from: {', '.join(SOURCES)}")
+    return [SOURCES[source]] if source else list(SOURCES.values())
+
+
+# http://127.0.0.1:5000/catalog/?source=nbs
+@api.route("/")
+@api.doc(
+    description="Returns the valid food items, item types and categories.",
+    params={"source": "nbs or supermarkets. Default is both."},
+)
+class CatalogTree(Resource):
+    """Returns the valid food items, item types and categories."""
+
+    def get(self):
+        sources = parse_source()
+        catalogs = {
+            name: get_catalog(source)
+            for name, source in SOURCES.items()
+            if source in sources
+        }
+
+        etag = "-".join(catalog.etag for catalog in catalogs.values())
+        if request.if_none_match.contains(etag):
+            return "", 304, {"ETag": f'"{etag}"'}
+
+        response = jsonify(
+            {"data": {name: catalog.tree for name, catalog in catalogs.items()}}
+        )
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+
+
+# http://127.0.0.1:5000/catalog/search/?q=ric&source=supermarkets
+@api.route("/search/")
+@api.doc(
+    description="Typeahead search over food items and item types.",
+    params={
+        "q": "The start of a food item or item type e.g. ric",
+        "source": "nbs or supermarkets. Default is both.",
+        "limit": "The maximum number of matches per source. Default is 10.",
+    },
+)
+class CatalogSearch(Resource):
+    """Typeahead search over food items and item types."""
+
+    def get(self):
+        query = request.args.get("q", "").lower().strip()
+        limit = request.args.get("limit", "10").strip()
+
+        if not query:
+            return abort(400, "Missing required parameters")
+        if not limit.isdigit() or not 0 < int(limit) <= 100:
+            return abort(400, "Invalid limit. Use a number between 1 and 100.")
+
+        sources = parse_source()
+        data = {
+            name: get_catalog(source).trie.search(query, int(limit))
+            for name, source in SOURCES.items()
+            if source in sources
+        }
+        return jsonify({"data": data})
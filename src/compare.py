@@ -0,0 +1,183 @@
+import datetime
+
+import numpy as np
+import psycopg2
+
+from flask import request, abort
+from flask_restx import Resource, Namespace
+
+from src.cache import response_cache
+from src.catalog import SOURCES
+from src.db import pooled_cursor
+from src.engine import get_store
+from src.queries import execute
+from src.serializers import render
+from src.series import parse_series_key
+from src.timeseries import GRANULARITIES, calendar, align
+from src.units import standard_unit_scale
+from src.utils import parse_date_range
+
+
+api = Namespace("Compare", description="Several price series aligned side by side")
+
+MAX_COMPARE_SERIES = 10
+
+SOURCE_NAMES = {source: name for name, source in SOURCES.items()}
+
+
+def parse_series_list():
+    """
+    Reads the repeated `series` parameter, each `source|food_item|item_type|category`,
+    and returns the store keys.
+    """
+    values = request.args.getlist("series")
+    if not 2 <= len(values) <= MAX_COMPARE_SERIES:
+        return abort(
+            400, f"Pass between 2 and {MAX_COMPARE_SERIES} series parameters."
+        )
+
+    keys = []
+    for value in values:
+        parts = [part.lower().strip() for part in value.split("|")]
+        if len(parts) != 4:
+            return abort(
+                400, "Each series must be source|food_item|item_type|category."
+            )
+        keys.append(parse_series_key(*parts))
+    return keys
+
+
+def period_means(keys, start, end, granularity):
+    """
+    The (periods, means) of every series, read from the in-memory store when it is
+    loaded and with a single query over all series otherwise.
+    """
+    store = get_store()
+    if store is not None:
+        means = []
+        for key in keys:
+            periods, averages, *_ = store.period_stats(key, start, end, granularity)
+            means.append((periods, averages))
+        return means
+
+    sources, food_items, item_types, categories = (list(part) for part in zip(*keys))
+    with pooled_cursor() as cur:
+        execute(
+            cur,
+            "compare_period_means",
+            {
+                "sources": sources,
+                "food_items": food_items,
+                "item_types": item_types,
+                "categories": categories,
+                "start": start or datetime.date.min,
+                "end": end or datetime.date.max,
+                "granularity": granularity,
+            },
+        )
+        records = cur.fetchall()
+
+    rows = {position: [] for position in range(1, len(keys) + 1)}
+    for position, period, mean in records:
+        rows[position].append((str(period), mean))
+    means = []
+    for position in sorted(rows):
+        periods, averages = zip(*rows[position]) if rows[position] else ((), ())
+        means.append(
+            (
+                np.array(periods, dtype="datetime64[D]"),
+                np.array(averages, dtype="float64"),
+            )
+        )
+    return means
+
+
+def compare(keys, start, end, granularity, normalize):
+    """
+    Aligns the series on one calendar covering all of them, forward-filling gaps,
+    and adds each series' spread and ratio against the first one. Returns a
+    JSON-ready matrix, or None when no series has data in the range.
+    """
+    means = period_means(keys, start, end, granularity)
+    firsts = [periods[0] for periods, _ in means if len(periods)]
+    if not firsts:
+        return None
+    lasts = [periods[-1] for periods, _ in means if len(periods)]
+    periods = calendar(start or min(firsts), end or max(lasts), granularity)
+
+    matrix = np.column_stack([align(periods, *series) for series in means])
+    units = [""] * len(keys)
+    if normalize:
+        scales, units = standard_unit_scale([key[3] for key in keys])
+        matrix = matrix * scales
+        units = units.tolist()
+
+    base = matrix[:, :1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spread = matrix[:, 1:] - base
+        ratio = np.where(base != 0, matrix[:, 1:] / base, np.nan)
+
+    def to_rows(values, decimals=2):
+        rounded = np.round(values, decimals).astype(object)
+        rounded[np.isnan(values)] = None
+        return rounded.tolist()
+
+    return {
+        "series": ["|".join((SOURCE_NAMES[key[0]], *key[1:])) for key in keys],
+        "units": units,
+        "periods": np.datetime_as_string(periods).tolist(),
+        "values": to_rows(matrix),
+        "spread": to_rows(spread),
+        "ratio": to_rows(ratio, 4),
+    }
+
+
+# http://127.0.0.1:5000/compare/?series=nbs|rice|local|1000%20g&series=supermarkets|rice|basmati|5000%20g&granularity=month&normalize=true
+@api.route("/")
+@api.doc(
+    description="Returns several series aligned on one calendar, with the spread "
+    "and ratio of each series against the first one.",
+    params={
+        "series": f"Repeat 2 to {MAX_COMPARE_SERIES} times, as "
+        "source|food_item|item_type|category e.g. nbs|rice|local|1000 g",
+        "from": "First day, YYYY-MM-DD. Default is the start of the earliest series.",
+        "to": "Last day, YYYY-MM-DD. Default is the end of the latest series.",
+        "granularity": f"One of {', '.join(GRANULARITIES)}. Default is month.",
+        "normalize": "Compare prices per standard unit (e.g. per kg). Default is "
+        "false.",
+    },
+)
+class Compare(Resource):
+    """Returns several series aligned on one calendar."""
+
+    def get(self):
+        try:
+            granularity = request.args.get("granularity", "month").lower().strip()
+            normalize = request.args.get("normalize", "false").lower().strip()
+
+            if granularity not in GRANULARITIES:
+                return abort(
+                    400, f"Invalid granularity. Choose from: {', '.join(GRANULARITIES)}"
+                )
+
+            keys = parse_series_list()
+            start, end = parse_date_range()
+            normalize = normalize == "true"
+
+            store = get_store()
+            version = store.watermark if store else None
+            cache_key = (
+                "compare", tuple(keys), start, end, granularity, normalize, version
+            )
+            data = response_cache.get(cache_key)
+            if data is None:
+                data = compare(keys, start, end, granularity, normalize)
+                response_cache.set(cache_key, data)
+
+            if data is None:
+                return abort(404, "No records found. Confirm query parameters.")
+
+        except psycopg2.Error as e:
+            return abort(500, f"Database error: {str(e)}")
+
+        return render({"data": data})
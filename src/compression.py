@@ -0,0 +1,139 @@
+import os
+import zlib
+import hashlib
+
+from flask import request
+
+from src.cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Bodies smaller than this are not worth the CPU (or the extra headers).
+MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/msgpack",
+    "application/javascript",
+    "text/html",
+    "text/plain",
+    "text/css",
+}
+
+# Compressed bodies keyed by (digest of the uncompressed body, encoding), so hot
+# responses served from the response cache are not recompressed on every hit.
+compressed_cache = TTLCache(
+    maxsize=int(os.getenv("COMPRESSION_CACHE_MAX_ENTRIES", "512")),
+    ttl=int(os.getenv("CACHE_TTL_SECONDS", "300")),
+)
+
+
+def available_encodings():
+    """
+    Returns the supported content encodings, most preferred first.
+    """
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def compress(body, encoding):
+    """
+    Compresses a complete body with the given encoding.
+    """
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor().compress(body)
+    if encoding == "br":
+        return brotli.compress(body)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    """
+    Compresses a streamed body chunk by chunk, flushing after every chunk so the
+    client can start decoding before the whole response has been produced.
+    """
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor().compressobj()
+        process = compressor.compress
+        flush = lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        finish = compressor.flush
+    elif encoding == "br":
+        compressor = brotli.Compressor()
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        process = compressor.compress
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = process(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def compress_response(response):
+    """
+    Compresses a response with the best encoding the client accepts.
+    """
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    encoding = request.accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < MIN_SIZE:
+            return response
+
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        compressed = compressed_cache.get(key)
+        if compressed is None:
+            compressed = compress(body, encoding)
+            compressed_cache.set(key, compressed)
+        response.set_data(compressed)
+
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_compression(app):
+    """
+    Registers response compression on a Flask app.
+    """
+    app.after_request(compress_response)
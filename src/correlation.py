@@ -0,0 +1,310 @@
+"""
+Lagged correlation between news volume and price moves.
+
+A daily batch job counts the articles in `articles_summaries` per topic and
+day, and correlates each topic's article counts `lag` periods earlier with
+the log returns of every price series: daily for supermarkets (lags of 0 to
+30 days), monthly for NBS (lags of 0 to 6 months). The correlations of all
+series, topics and lags are computed together as a few matrix products.
+
+Only the running sums behind each correlation are stored (observations and
+the sums of x, x², y, y² and xy), so each run only adds the periods since the
+previous one:
+
+    python -m src.correlation            # daily, e.g. from cron
+    python -m src.correlation --rebuild  # after a backfill of prices or news
+
+Run `python -m src.init_db` once beforehand to create the tables. The results
+are served from /news/price-correlation/.
+"""
+import time
+import datetime
+import argparse
+
+import numpy as np
+
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+from src.db import get_db_connection
+from src.engine import NBS, SUPERMARKET, current_resolution, open_store
+from src.timeseries import calendar
+
+
+# Topics are matched case-insensitively against the article summaries; "all"
+# counts every article.
+TOPICS = {
+    "all": "",
+    "fuel": r"fuel|petrol|diesel|\mpms\M|kerosene|filling station",
+    "insecurity": r"insecurity|bandit|kidnap|insurgen|boko haram|herders|attack",
+}
+
+LAGS = {"day": np.arange(31), "month": np.arange(7)}
+
+TOPIC_COUNTS_QUERY = """
+    SELECT CAST(articles.date AS DATE) AS day, topics.topic, COUNT(*)
+    FROM articles_summaries articles
+    JOIN unnest(%(topics)s::text[], %(patterns)s::text[]) AS topics(topic, pattern)
+        ON articles.article_summary ~* topics.pattern
+    WHERE CAST(articles.date AS DATE) >= %(since)s
+    GROUP BY 1, 2
+"""
+
+SUM_COLUMNS = ["observations", "sum_x", "sum_xx", "sum_y", "sum_yy", "sum_xy"]
+
+# The correlation of news counts (x) with returns (y) from the stored sums.
+CORRELATION = """
+    (observations * sum_xy - sum_x * sum_y) / NULLIF(
+        SQRT(
+            GREATEST(observations * sum_xx - sum_x * sum_x, 0)
+            * GREATEST(observations * sum_yy - sum_y * sum_y, 0)
+        ),
+        0
+    )
+"""
+
+# The strongest correlations of a source, optionally of one topic, food item or
+# lag, with at least `min_observations` periods behind them.
+CORRELATION_QUERY = f"""
+    SELECT food_item, item_type, category, topic, lag, correlation, observations,
+        through
+    FROM (
+        SELECT *, {CORRELATION} AS correlation
+        FROM news_price_correlations
+        WHERE source = %(source)s
+            AND (%(topic)s IS NULL OR topic = %(topic)s)
+            AND (%(food_item)s IS NULL OR food_item = %(food_item)s)
+            AND (%(lag)s IS NULL OR lag = %(lag)s)
+            AND observations >= %(min_observations)s
+    ) correlations
+    WHERE correlation IS NOT NULL
+    ORDER BY ABS(correlation) DESC
+    LIMIT %(limit)s
+"""
+
+
+def update_topic_counts(cur, since):
+    """Recounts the articles per topic and day from `since` onwards."""
+    cur.execute("DELETE FROM news_topic_counts WHERE day >= %s", (since,))
+    cur.execute(
+        f"INSERT INTO news_topic_counts (day, topic, articles) {TOPIC_COUNTS_QUERY}",
+        {"topics": list(TOPICS), "patterns": list(TOPICS.values()), "since": since},
+    )
+
+
+def topic_counts(cur, resolution):
+    """
+    The article count of every topic in every period from the first to the
+    last day with news, as (periods, {topic: counts}).
+    """
+    cur.execute("SELECT day, topic, articles FROM news_topic_counts ORDER BY day")
+    rows = cur.fetchall()
+    if not rows:
+        return None
+
+    days = np.array([row[0] for row in rows], dtype="datetime64[D]")
+    periods = calendar(days[0], days[-1], resolution)
+    buckets = np.searchsorted(periods, days, side="right") - 1
+    counts = {topic: np.zeros(len(periods)) for topic in TOPICS}
+    for bucket, (_, topic, articles) in zip(buckets, rows):
+        if topic in counts:
+            counts[topic][bucket] += articles
+    return periods, counts
+
+
+def series_returns(series, resolution, periods):
+    """
+    The log return of a series into each of `periods`, from its previous
+    period with data, NaN where it has no price.
+    """
+    if resolution == "day":
+        dates, prices = series.dates, series.prices
+    else:
+        dates, prices = series.period_means(resolution)
+    returns = np.diff(np.log(prices))
+
+    values = np.full(len(periods), np.nan)
+    positions = np.searchsorted(periods, dates[1:])
+    inside = (positions < len(periods)) & (
+        periods[np.minimum(positions, len(periods) - 1)] == dates[1:]
+    )
+    values[positions[inside]] = returns[inside]
+    return values
+
+
+def lagged_news(news_periods, counts, periods, lags):
+    """
+    A (topics × lags, periods) matrix of each topic's article count `lag`
+    periods before each period, NaN outside the news coverage.
+    """
+    index = np.searchsorted(news_periods, periods)
+    covered = (index < len(news_periods)) & (
+        news_periods[np.minimum(index, len(news_periods) - 1)] == periods
+    )
+    rows = []
+    for topic in TOPICS:
+        for lag in lags:
+            earlier = index - lag
+            rows.append(
+                np.where(
+                    covered & (earlier >= 0),
+                    counts[topic][np.clip(earlier, 0, len(news_periods) - 1)],
+                    np.nan,
+                )
+            )
+    return np.array(rows).reshape(len(rows), len(periods))
+
+
+def shift_period(period, resolution, steps):
+    """The start of the day or month `steps` periods after `period`."""
+    if resolution == "month":
+        return (np.datetime64(period, "M") + steps).astype("datetime64[D]")
+    return np.datetime64(period, "D") + steps
+
+
+def correlation_sums(returns, news):
+    """
+    The observations, sum_x, sum_xx, sum_y, sum_yy and sum_xy of every (series,
+    topic × lag) pair over the periods where both are known, x being the news
+    counts and y the returns. Each is a (series, topics × lags) matrix.
+    """
+    has_return = ~np.isnan(returns)
+    has_news = ~np.isnan(news)
+    y = np.where(has_return, returns, 0.0)
+    x = np.where(has_news, news, 0.0)
+    both = has_return.astype("float64")
+    known = has_news.astype("float64").T
+
+    return [
+        both @ known,
+        both @ x.T,
+        both @ (x**2).T,
+        y @ known,
+        (y**2) @ known,
+        y @ x.T,
+    ]
+
+
+def update_correlations(cur, store, source, news_periods, counts, rebuild=False):
+    """
+    Adds the periods since the last run to the stored sums of every series of
+    `source` (all periods for new series, or with `rebuild`). Returns the number
+    of series updated.
+    """
+    resolution = current_resolution(source)
+    lags = LAGS[resolution]
+    keys = [
+        key
+        for key, series in store.series.items()
+        if key[0] == source and key[3] and len(series.dates) > 1
+    ]
+    if not keys:
+        return 0
+
+    cur.execute(
+        f"""
+        SELECT food_item, item_type, category, topic, lag, through,
+            {", ".join(SUM_COLUMNS)}
+        FROM news_price_correlations
+        WHERE source = %s
+        """,
+        (source,),
+    )
+    stored = {} if rebuild else {tuple(row[:5]): row[5:] for row in cur.fetchall()}
+    cur.execute("DELETE FROM news_price_correlations WHERE source = %s", (source,))
+
+    # Series fitted up to the same period are updated together.
+    through = {}
+    for key in keys:
+        previous = stored.get((*key[1:], "all", 0))
+        through.setdefault(previous[0] if previous else None, []).append(key)
+
+    # Only complete periods are added: the latest one may still be filling up.
+    latest = min(
+        news_periods[-1],
+        max(store.series[key].dates[-1] for key in keys),
+    )
+    last = shift_period(calendar(latest, latest, resolution)[0], resolution, -1)
+    pairs = [(topic, int(lag)) for topic in TOPICS for lag in lags]
+    rows = []
+    for since, group in through.items():
+        first = (
+            shift_period(since, resolution, 1)
+            if since is not None
+            else min(store.series[key].dates[0] for key in group)
+        )
+        periods = (
+            calendar(first, last, resolution)
+            if first <= last
+            else np.array([], dtype="datetime64[D]")
+        )
+
+        returns = np.array(
+            [series_returns(store.series[key], resolution, periods) for key in group]
+        ).reshape(len(group), len(periods))
+        news = lagged_news(news_periods, counts, periods, lags)
+        sums = correlation_sums(returns, news)
+
+        for row, key in enumerate(group):
+            for column, (topic, lag) in enumerate(pairs):
+                added = [float(matrix[row, column]) for matrix in sums]
+                previous = stored.get((*key[1:], topic, lag))
+                if previous is not None:
+                    added = [a + b for a, b in zip(added, previous[1:])]
+                rows.append((*key, topic, lag, last.astype(datetime.date), *added))
+
+    execute_values(
+        cur,
+        f"""
+        INSERT INTO news_price_correlations
+            (source, food_item, item_type, category, topic, lag, through,
+            {", ".join(SUM_COLUMNS)})
+        VALUES %s
+        """,
+        rows,
+        page_size=1000,
+    )
+    return len(keys)
+
+
+def run(conn, store, rebuild=False):
+    """Refreshes the topic counts and the correlation sums of both sources."""
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT MAX(day) FROM news_topic_counts")
+        latest = cur.fetchone()[0]
+        since = datetime.date.min if rebuild or latest is None else latest
+        update_topic_counts(cur, since)
+
+        updated = {}
+        for source in (NBS, SUPERMARKET):
+            news = topic_counts(cur, current_resolution(source))
+            if news is None:
+                break
+            updated[source] = update_correlations(cur, store, source, *news, rebuild)
+    return updated
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Update the news-to-price lagged correlations."
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Recompute everything instead of adding the periods since the last run",
+    )
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    store = open_store()
+    conn = get_db_connection()
+    try:
+        updated = run(conn, store, args.rebuild)
+    finally:
+        conn.close()
+
+    for source, count in updated.items():
+        print(f"{source}: {count} series updated")
+    print(f"Done in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,150 @@
+import os
+import threading
+
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+from psycopg2.pool import ThreadedConnectionPool
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """A connection that remembers which named statements it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class KeepingConnectionPool(ThreadedConnectionPool):
+    """
+    A pool that keeps every returned connection open, up to `maxconn`.
+
+    psycopg2 closes returned connections once `minconn` are idle, so under
+    concurrent requests most would reconnect, one at a time as connecting holds
+    the pool lock, and lose their prepared statements.
+    """
+
+    def _putconn(self, conn, key=None, close=False):
+        # Called with the pool lock held.
+        minconn, self.minconn = self.minconn, self.maxconn
+        try:
+            super()._putconn(conn, key, close)
+        finally:
+            self.minconn = minconn
+
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+
+# Queries on pooled connections are cancelled after this many milliseconds, so
+# a slow database fails fast and stale responses can be served instead (see
+# src/resilience.py). Loading the price store may take longer. 0 disables.
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+DB_LOAD_TIMEOUT_MS = int(os.getenv("DB_LOAD_TIMEOUT_MS", "120000"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# One slot per pooled connection, so callers wait for a connection to be
+# returned instead of failing when every connection is in use. This matters
+# once requests outnumber connections, e.g. under gevent (see src/green.py).
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+
+def connection_params():
+    return dict(
+        host=os.getenv("HOST"),
+        database=os.getenv("DATABASE"),
+        user=os.getenv("USER_NAME"),
+        password=os.getenv("PASSWORD"),
+    )
+
+
+def get_db_connection():
+    """
+    Opens a new, unpooled connection. Prefer `pooled_connection` in request handlers.
+    """
+    return psycopg2.connect(**connection_params())
+
+
+def get_pool():
+    """
+    Returns the process-wide connection pool, creating it on first use.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = KeepingConnectionPool(
+                    DB_POOL_MIN,
+                    DB_POOL_MAX,
+                    connection_factory=PreparingConnection,
+                    options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+                    **connection_params(),
+                )
+    return _pool
+
+
+def reset_pool():
+    """
+    Closes every pooled connection. The next `get_pool` call opens a fresh pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+        _pool = None
+
+
+def borrow_connection():
+    """
+    Takes a connection from the pool, waiting for one to be returned if they
+    are all in use. Hand it back with `return_connection`.
+    """
+    _slots.acquire()
+    try:
+        return get_pool().getconn()
+    except Exception:
+        _slots.release()
+        raise
+
+
+def return_connection(conn, close=False):
+    """Returns a connection taken with `borrow_connection` to the pool."""
+    try:
+        get_pool().putconn(conn, close=close)
+    finally:
+        _slots.release()
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Borrows a connection from the pool for the duration of the block, committing
+    on success and rolling back on error.
+    """
+    conn = borrow_connection()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        return_connection(conn, close=bool(conn.closed))
+
+
+@contextmanager
+def pooled_cursor(statement_timeout=None):
+    """
+    Borrows a pooled connection and yields a cursor on it. `statement_timeout`
+    (in ms, 0 for none) overrides DB_STATEMENT_TIMEOUT_MS for the block.
+    """
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            if statement_timeout is not None:
+                cur.execute("SET LOCAL statement_timeout = %s", (statement_timeout,))
+            yield cur
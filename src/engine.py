@@ -0,0 +1,715 @@
+import os
+import time
+import logging
+import datetime
+import itertools
+import threading
+
+from collections import defaultdict
+
+import numpy as np
+import psycopg2
+
+from src.db import DB_LOAD_TIMEOUT_MS, pooled_cursor
+from src.timeseries import bucket_start, period_runs
+from src.units import standard_unit_scale
+
+
+logger = logging.getLogger(__name__)
+
+NBS = "NBS"
+SUPERMARKET = "Supermarket"
+
+# "memory" answers the price endpoints from the in-process store below,
+# "sql" sends every request to Postgres as before.
+PRICE_ENGINE = os.getenv("PRICE_ENGINE", "memory").lower().strip()
+
+# How often (in seconds) a request may check the watermark for new data.
+REFRESH_SECONDS = int(os.getenv("ENGINE_REFRESH_SECONDS", "60"))
+
+# The watermark is the id of the latest write logged in `price_changes`, which
+# init_db's triggers fill on every insert, update and delete of a price.
+WATERMARK_QUERY = "SELECT COALESCE(MAX(id), 0) FROM price_changes"
+
+# The latest id and the oldest one still in the log, which is pruned (see
+# `prune_changes`); a store older than that reloads everything.
+CHANGE_LOG_QUERY = """
+    SELECT COALESCE(MAX(id), 0), COALESCE(MIN(id), 1) FROM price_changes
+"""
+
+# Entries older than this are dropped when the log is pruned, except the latest,
+# which holds the current watermark.
+PRICE_CHANGES_KEEP_DAYS = int(os.getenv("PRICE_CHANGES_KEEP_DAYS", "7"))
+
+PRUNE_CHANGES_QUERY = """
+    DELETE FROM price_changes
+    WHERE changed_at < now() - make_interval(days => %(days)s)
+        AND id < (SELECT MAX(id) FROM price_changes)
+"""
+
+# The series written between two watermarks, each from the first day written.
+CHANGES_QUERY = """
+    SELECT source, food_item, item_type, category, MIN(since)
+    FROM price_changes
+    WHERE id > %(after)s AND id <= %(through)s
+    GROUP BY 1, 2, 3, 4
+"""
+
+LOAD_QUERY = """
+    SELECT
+        CASE WHEN source = 'NBS' THEN 'NBS' ELSE 'Supermarket' END AS source,
+        food_item,
+        item_type,
+        category,
+        CAST(date AS DATE) AS day,
+        SUM(price) AS total,
+        COUNT(price) AS count
+    FROM "Cleaned-Food-Prices"
+    WHERE (source = 'NBS' OR vendor_type = 'Supermarket')
+        AND price IS NOT NULL
+        AND CAST(date AS DATE) >= %(since)s
+    GROUP BY 1, 2, 3, 4, 5
+    ORDER BY 5
+"""
+
+# LOAD_QUERY restricted to the given series, each from its own first day.
+SERIES_LOAD_QUERY = """
+    SELECT
+        CASE WHEN prices.source = 'NBS' THEN 'NBS' ELSE 'Supermarket' END AS source,
+        prices.food_item,
+        prices.item_type,
+        prices.category,
+        CAST(prices.date AS DATE) AS day,
+        SUM(prices.price) AS total,
+        COUNT(prices.price) AS count
+    FROM "Cleaned-Food-Prices" prices
+    JOIN unnest(
+        %(food_items)s::text[],
+        %(item_types)s::text[],
+        %(categories)s::text[],
+        %(since)s::date[]
+    ) AS changed(food_item, item_type, category, since)
+        ON prices.food_item = changed.food_item
+        AND prices.item_type = changed.item_type
+        AND prices.category = changed.category
+    WHERE (prices.source = 'NBS' OR prices.vendor_type = 'Supermarket')
+        AND prices.price IS NOT NULL
+        AND CAST(prices.date AS DATE) >= changed.since
+    GROUP BY 1, 2, 3, 4, 5
+    ORDER BY 5
+"""
+
+
+# How many of its past revisions a series remembers (see `first_difference`).
+SERIES_REVISIONS = 16
+
+_serials = itertools.count()
+
+
+class Series:
+    """Daily price aggregates of one (source, food_item, item_type, category) series."""
+
+    __slots__ = ("key", "dates", "sums", "counts", "scale", "unit", "serial", "revisions")
+
+    def __init__(self, key, dates, sums, counts, scale=np.nan, unit="", revisions=()):
+        self.key = key
+        self.dates = dates
+        self.sums = sums
+        self.counts = counts
+        # Multiplier from a price of this category to a price per standard unit
+        # (see src/units.py), and that unit. Set for all series at once by
+        # `PriceStore.replace_series`.
+        self.scale = scale
+        self.unit = unit
+        # The (serial of the version revised, first day rewritten) of the latest
+        # revisions that led to this version, oldest first.
+        self.serial = next(_serials)
+        self.revisions = revisions
+
+    def revised(self, dates, sums, counts, since):
+        """A new version of this series holding the given arrays, rewritten from `since`."""
+        revisions = self.revisions[-(SERIES_REVISIONS - 1) :] + ((self.serial, since),)
+        return Series(
+            self.key, dates, sums, counts, self.scale, self.unit, revisions
+        )
+
+    def rewritten_since(self, older):
+        """
+        The first day rewritten in the versions between `older` and this one, or
+        None when `older` isn't among the versions this one remembers.
+        """
+        for index, (serial, _) in enumerate(self.revisions):
+            if serial == older.serial:
+                return min(since for _, since in self.revisions[index:])
+        return None
+
+    @property
+    def prices(self):
+        """The average price of each day."""
+        return self.sums / self.counts
+
+    @property
+    def standard_unit_sums(self):
+        """The daily price totals expressed per standard unit, e.g. per kg."""
+        return self.sums * self.scale
+
+    def truncated(self, since):
+        """Returns a new series without the days from `since` onwards."""
+        since = np.datetime64(since, "D")
+        keep = self.dates < since
+        return self.revised(
+            self.dates[keep], self.sums[keep], self.counts[keep], since
+        )
+
+    def merged(self, dates, sums, counts):
+        """
+        Returns a new series where the given days, and any day after the first of
+        them, replace what this series held.
+        """
+        keep = self.dates < dates[0]
+        return self.revised(
+            np.concatenate([self.dates[keep], dates]),
+            np.concatenate([self.sums[keep], sums]),
+            np.concatenate([self.counts[keep], counts]),
+            dates[0],
+        )
+
+    def last_periods(self, resolution):
+        """
+        The (period start, price total, rows) of the last two periods with data
+        at `resolution` ("day" or "month"), newest first.
+        """
+        periods, end = [], len(self.dates)
+        while end and len(periods) < 2:
+            period = bucket_start(self.dates[end - 1 : end], resolution)[0]
+            start = int(np.searchsorted(self.dates, period))
+            periods.append(
+                (period, self.sums[start:end].sum(), self.counts[start:end].sum())
+            )
+            end = start
+        return periods
+
+    def period_means(self, resolution, mask=None):
+        """
+        Averages the raw prices into week, month or year buckets. Buckets are
+        weighted by the number of rows in each day, so the result matches
+        `AVG(price) ... GROUP BY period` in SQL.
+        """
+        dates, sums, counts = self.dates, self.sums, self.counts
+        if mask is not None:
+            dates, sums, counts = dates[mask], sums[mask], counts[mask]
+
+        buckets, inverse = np.unique(
+            bucket_start(dates, resolution), return_inverse=True
+        )
+        totals = np.bincount(inverse, weights=sums, minlength=len(buckets))
+        rows = np.bincount(inverse, weights=counts, minlength=len(buckets))
+        return buckets, totals / rows
+
+    def filled_daily(self, mask=None):
+        """
+        Returns one price per calendar day from the first selected day to the last
+        day of the series, carrying the last known price over days without data.
+        """
+        dates, prices = self.dates, self.prices
+        if mask is not None:
+            dates, prices = dates[mask], prices[mask]
+        if len(dates) == 0:
+            return dates, prices
+
+        days = np.arange(dates[0], self.dates[-1] + np.timedelta64(1, "D"))
+        return days, prices[np.searchsorted(dates, days, side="right") - 1]
+
+
+def first_difference(old, new):
+    """
+    The first day on which two versions of a series differ, or None if they are
+    the same. When `new` was revised from `old` in the store, only the days from
+    the first one rewritten are compared, so new days cost nothing to find.
+    """
+    start = 0
+    since = new.rewritten_since(old)
+    if since is not None:
+        start = int(np.searchsorted(old.dates, since))
+
+    size = min(len(old.dates), len(new.dates))
+    old_dates, new_dates = old.dates[start:size], new.dates[start:size]
+    differs = (
+        (old_dates != new_dates)
+        | (old.sums[start:size] != new.sums[start:size])
+        | (old.counts[start:size] != new.counts[start:size])
+    )
+    if differs.any():
+        first = differs.argmax()
+        return min(old_dates[first], new_dates[first])
+    if len(old.dates) != len(new.dates):
+        longer = old if len(old.dates) > len(new.dates) else new
+        return longer.dates[size]
+    return None
+
+
+def years_of(dates):
+    return dates.astype("datetime64[Y]").astype("int64") + 1970
+
+
+def current_resolution(source):
+    """The period "current" prices cover: the latest month for NBS, day otherwise."""
+    return "month" if source == NBS else "day"
+
+
+class LatestState:
+    """
+    The latest and previous period of a food item and, for each of its series,
+    the (price total, rows) in both periods. Only series with a category count,
+    as unit prices can't be computed for the others.
+    """
+
+    __slots__ = ("period", "previous", "series")
+
+    def __init__(self, items, tails):
+        self.period = max(tails[item.key][0][0] for item in items)
+        previous = [
+            period
+            for item in items
+            for period, _, _ in tails[item.key]
+            if period < self.period
+        ]
+        self.previous = max(previous) if previous else None
+
+        self.series = {}
+        for item in items:
+            periods = {period: (total, rows) for period, total, rows in tails[item.key]}
+            self.series[item.key] = (
+                periods.get(self.period, (0.0, 0.0)),
+                periods.get(self.previous, (0.0, 0.0)),
+            )
+
+
+class PriceStore:
+    """
+    Every price series held in memory, indexed by (source, food_item, item_type,
+    category), and the computations behind the NBS and supermarket endpoints.
+    """
+
+    def __init__(self):
+        self.series = {}
+        self.food_items = {}
+        # Latest-period state per (source, food_item) and the last two periods
+        # of every series it is built from, kept up to date on every load.
+        self.latest = {}
+        self.tails = {}
+        self.watermark = None
+        self.checked_at = 0.0
+        self.refresh_lock = threading.Lock()
+        # Path of the snapshot this store was mapped from, if any.
+        self.snapshot = None
+        # True while the database is unreachable and only snapshot data is served.
+        self.degraded = False
+
+    def load(self):
+        """
+        Loads every daily aggregate from Postgres. Returns the keys of the series
+        that changed.
+        """
+        with pooled_cursor(DB_LOAD_TIMEOUT_MS) as cur:
+            cur.execute(WATERMARK_QUERY)
+            watermark = cur.fetchone()[0]
+            cur.execute(LOAD_QUERY, {"since": datetime.date.min})
+            rows = cur.fetchall()
+
+        changed = self.apply_rows(rows, replace=True)
+        self.watermark = watermark
+        self.checked_at = time.monotonic()
+        self.degraded = False
+        return changed
+
+    def refresh(self):
+        """
+        Checks the watermark and reloads only the series written since the last
+        load, each from the first day that was written, so backfills, edits and
+        deletes are picked up as well as new days. Reloads everything when the
+        log no longer goes back to the store's watermark.
+        """
+        changes = None
+        with pooled_cursor() as cur:
+            cur.execute(CHANGE_LOG_QUERY)
+            watermark, oldest = cur.fetchone()
+            if self.watermark is not None and self.watermark + 1 >= oldest:
+                cur.execute(
+                    CHANGES_QUERY, {"after": self.watermark, "through": watermark}
+                )
+                changes = cur.fetchall()
+
+        self.checked_at = time.monotonic()
+        self.degraded = False
+        if watermark == self.watermark:
+            return []
+        if changes is None:
+            return self.load()
+        return self.reload(changes, watermark)
+
+    def reload(self, changes, watermark=None):
+        """
+        Reloads only the given series from the first changed day onwards, e.g.
+        after an ingest. `changes` are (source, food_item, item_type, category,
+        since) keys. The store is then at `watermark`, by default the latest
+        one. Returns the keys of the series that changed.
+        """
+        since = {}
+        for source, food_item, item_type, category, day in changes:
+            key = (food_item, item_type, category)
+            since[key] = min(day, since.get(key, day))
+
+        with pooled_cursor(DB_LOAD_TIMEOUT_MS) as cur:
+            if watermark is None:
+                cur.execute(WATERMARK_QUERY)
+                watermark = cur.fetchone()[0]
+            rows = []
+            if since:
+                food_items, item_types, categories = zip(*since)
+                cur.execute(
+                    SERIES_LOAD_QUERY,
+                    {
+                        "food_items": list(food_items),
+                        "item_types": list(item_types),
+                        "categories": list(categories),
+                        "since": list(since.values()),
+                    },
+                )
+                rows = cur.fetchall()
+
+        changed = self.apply_rows(rows, since=since) if since else []
+        self.watermark = watermark
+        self.checked_at = time.monotonic()
+        return changed
+
+    def apply_rows(self, rows, replace=False, since=None):
+        """
+        Merges (source, food_item, item_type, category, day, total, count) rows into
+        the store, ordered by day. `since` maps the (food_item, item_type,
+        category) of reloaded series to the first reloaded day: their days from
+        then on are dropped first, so deleted rows go too. The new index is built
+        aside and swapped in, so readers never see a half-applied update.
+        """
+        grouped = defaultdict(list)
+        for source, food_item, item_type, category, day, total, count in rows:
+            key = (source, food_item, item_type, category)
+            grouped[key].append((day, total, count))
+
+        series = {} if replace else dict(self.series)
+        changed = set(grouped)
+        for key, item in list(series.items()):
+            day = since.get(key[1:]) if since else None
+            if day is None:
+                continue
+            changed.add(key)
+            series[key] = item.truncated(day)
+            if not len(series[key].dates) and key not in grouped:
+                del series[key]
+
+        for key, days in grouped.items():
+            days.sort(key=lambda day: day[0])
+            dates = np.array([str(day[0])[:10] for day in days], dtype="datetime64[D]")
+            sums = np.array([day[1] for day in days], dtype="float64")
+            counts = np.array([day[2] for day in days], dtype="float64")
+
+            existing = series.get(key)
+            series[key] = (
+                existing.merged(dates, sums, counts)
+                if existing is not None
+                else Series(key, dates, sums, counts)
+            )
+
+        self.replace_series(series)
+        return list(changed)
+
+    def replace_series(self, series):
+        """
+        Swaps in a new {key: Series} index and updates the latest-period state
+        of the food items whose series changed.
+        """
+        scales, units = standard_unit_scale([key[3] for key in series])
+        food_items = defaultdict(list)
+        for (key, item), scale, unit in zip(series.items(), scales, units):
+            item.scale, item.unit = scale, unit
+            food_items[key[:2]].append(item)
+
+        tails, latest, changed = {}, {}, set()
+        for key, item in series.items():
+            if self.series.get(key) is item and key in self.tails:
+                tails[key] = self.tails[key]
+            else:
+                tails[key] = item.last_periods(current_resolution(key[0]))
+                changed.add(key[:2])
+
+        for food_item, items in food_items.items():
+            items = [item for item in items if item.key[3] and tails[item.key]]
+            if not items:
+                continue
+            if food_item in changed or food_item not in self.latest:
+                latest[food_item] = LatestState(items, tails)
+            else:
+                latest[food_item] = self.latest[food_item]
+
+        self.series, self.food_items = series, dict(food_items)
+        self.tails, self.latest = tails, latest
+
+    def get(self, source, food_item, item_type, category):
+        return self.series.get((source, food_item, item_type, category))
+
+    def year_prices(self, key, year):
+        """Daily prices over `year` and the year before."""
+        series = self.series.get(key)
+        if series is None:
+            return None
+        mask = np.isin(years_of(series.dates), [year - 1, year])
+        return series.dates[mask], series.prices[mask]
+
+    def yearly_averages(self, key):
+        """The average price of every year, oldest first."""
+        series = self.series.get(key)
+        if series is None:
+            return None
+        years, averages = series.period_means("year")
+        return years_of(years), averages
+
+    def monthly_averages(self, key, months=12):
+        """The average price of the last `months` months with data, oldest first."""
+        series = self.series.get(key)
+        if series is None:
+            return None
+        buckets, averages = series.period_means("month")
+        return buckets[-months:], averages[-months:]
+
+    def last_two(self, key, resolution):
+        """
+        The two most recent (period, average price) pairs, newest first, at the
+        given resolution ("day", "month" or "year"), or the raw observations.
+        """
+        series = self.series.get(key)
+        if series is None:
+            return []
+        if resolution == "day":
+            periods, averages = series.dates, series.prices
+        else:
+            periods, averages = series.period_means(resolution)
+        return list(zip(periods[-2:][::-1].tolist(), averages[-2:][::-1].tolist()))
+
+    def period_stats(self, key, start=None, end=None, granularity="day"):
+        """
+        The mean, min, max and row count of a series per day, week, month or year
+        between the `start` and `end` dates (inclusive). The mean is weighted by
+        rows, like `AVG(price)`; min and max are over daily average prices.
+        Returns (periods, means, minimums, maximums, counts) or None.
+        """
+        series = self.series.get(key)
+        if series is None:
+            return None
+
+        # Dates are sorted, so the range is two binary searches.
+        first, last = 0, len(series.dates)
+        if start is not None:
+            first = np.searchsorted(series.dates, np.datetime64(start, "D"))
+        if end is not None:
+            last = np.searchsorted(
+                series.dates, np.datetime64(end, "D"), side="right"
+            )
+        dates = series.dates[first:last]
+        sums, counts = series.sums[first:last], series.counts[first:last]
+        if len(dates) == 0:
+            return dates, sums, sums, sums, counts
+
+        periods = bucket_start(dates, granularity)
+        runs = period_runs(periods)
+        prices = sums / counts
+        rows = np.add.reduceat(counts, runs)
+        return (
+            periods[runs],
+            np.add.reduceat(sums, runs) / rows,
+            np.minimum.reduceat(prices, runs),
+            np.maximum.reduceat(prices, runs),
+            rows,
+        )
+
+    def filled_daily(
+        self, key, current_year=False, current_month=False, current_week=False
+    ):
+        """
+        The gap-filled daily series, optionally restricted to days in the current
+        year, month and/or week.
+        """
+        series = self.series.get(key)
+        if series is None:
+            return None
+
+        mask = None
+        if current_year:
+            today = np.datetime64(datetime.date.today(), "D")
+            mask = years_of(series.dates) == years_of(today)
+            filters = ((current_month, "month"), (current_week, "week"))
+            for enabled, resolution in filters:
+                if enabled:
+                    mask &= bucket_start(series.dates, resolution) == bucket_start(
+                        today, resolution
+                    )
+        return series.filled_daily(mask)
+
+    def latest_unit_prices(self, source, food_item, item_types, categories=None):
+        """
+        The average price per standard unit (e.g. per kg) of each (item_type, unit)
+        of a food item in its latest period: the latest month for NBS, the latest
+        day for supermarkets. Returns (item_type, average_price, unit) records.
+        """
+        state = self.latest.get((source, food_item))
+        if state is None:
+            return []
+
+        pairs = set(zip(item_types, categories)) if categories is not None else None
+        item_types = set(item_types)
+
+        totals, rows = {}, {}
+        for key, ((total, count), _) in state.series.items():
+            item_type = key[2]
+            if not count or item_type not in item_types or (
+                pairs is not None and key[2:] not in pairs
+            ):
+                continue
+
+            series = self.series[key]
+            group = (item_type, series.unit)
+            totals.setdefault(group, 0.0)
+            rows.setdefault(group, 0.0)
+            # Like AVG() over NULL unit prices, unparseable quantities are skipped.
+            if not np.isnan(series.scale):
+                totals[group] += total * series.scale
+                rows[group] += count
+
+        # Ordered like the SQL fallback, as series load in no particular order.
+        records = []
+        for (item_type, unit), total in sorted(
+            totals.items(), key=lambda item: (item[0][0], item[0][1] or "")
+        ):
+            count = rows[(item_type, unit)]
+            # A category without a unit has a NULL one in SQL.
+            average = total / count if count else None
+            records.append((item_type, average, unit or None))
+        return records
+
+    def overview(self, source, food_items, item_types, categories):
+        """
+        The average price per standard unit of every (food_item, item_type, unit)
+        among the given series in the latest and previous month of its food
+        item. Returns (food_item, item_type, unit, price, previous_price) records.
+        """
+        month_tails = self.tails if current_resolution(source) == "month" else {}
+        by_food_item = defaultdict(list)
+        for key in zip(food_items, item_types, categories):
+            series = self.series.get((source, *key))
+            if series is not None and len(series.dates) and key[2]:
+                by_food_item[key[0]].append(series)
+
+        records = []
+        for food_item, items in by_food_item.items():
+            tails = {
+                item.key: month_tails.get(item.key) or item.last_periods("month")
+                for item in items
+            }
+            state = LatestState(items, tails)
+
+            totals = defaultdict(lambda: [0.0, 0.0, 0.0, 0.0])
+            for key, periods in state.series.items():
+                series = self.series[key]
+                if np.isnan(series.scale):
+                    continue
+                group = totals[(key[2], series.unit)]
+                for index, (total, count) in enumerate(periods):
+                    group[2 * index] += total * series.scale
+                    group[2 * index + 1] += count
+
+            for (item_type, unit), (total, count, previous, previous_count) in (
+                totals.items()
+            ):
+                if count:
+                    records.append(
+                        (
+                            food_item,
+                            item_type,
+                            unit or None,
+                            total / count,
+                            previous / previous_count if previous_count else None,
+                        )
+                    )
+        return records
+
+
+def prune_changes(cur, days=PRICE_CHANGES_KEEP_DAYS):
+    """Drops price change log entries older than `days`. Returns how many."""
+    cur.execute(PRUNE_CHANGES_QUERY, {"days": days})
+    return cur.rowcount
+
+
+_store = None
+_store_lock = threading.Lock()
+_failed_at = None
+
+
+def open_store():
+    """
+    Builds a store, starting from the latest snapshot when there is one and
+    catching up with the database from the snapshot's watermark. If the
+    database is unreachable the snapshot is served as-is, in degraded mode.
+    """
+    # Imported here because the snapshot module builds on PriceStore.
+    from src.snapshot import latest_snapshot_path, load_snapshot
+
+    path = latest_snapshot_path()
+    store = load_snapshot(path) if path else None
+
+    try:
+        if store is None:
+            store = PriceStore()
+            store.load()
+        else:
+            store.refresh()
+    except psycopg2.Error:
+        if store is None or store.snapshot is None:
+            raise
+        store.degraded = True
+        store.checked_at = time.monotonic()
+        logger.warning("Database unavailable, serving snapshot %s", store.snapshot)
+    return store
+
+
+def get_store():
+    """
+    Returns the shared price store, loading it on first use and refreshing it
+    when the watermark moves. Returns None when the in-memory engine is
+    disabled or has never loaded, in which case callers fall back to SQL.
+    """
+    global _store, _failed_at
+    if PRICE_ENGINE != "memory":
+        return None
+
+    now = time.monotonic()
+    if _store is None:
+        if _failed_at is not None and now - _failed_at < REFRESH_SECONDS:
+            return None
+        with _store_lock:
+            if _store is None:
+                try:
+                    _store = open_store()
+                except psycopg2.Error:
+                    _failed_at = now
+        return _store
+
+    if now - _store.checked_at > REFRESH_SECONDS and _store.refresh_lock.acquire(
+        blocking=False
+    ):
+        try:
+            _store.refresh()
+        except psycopg2.Error:
+            # Keep serving the data we have; the next check will try again.
+            _store.checked_at = now
+        finally:
+            _store.refresh_lock.release()
+    return _store
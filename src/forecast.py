@@ -0,0 +1,296 @@
+"""
+Batched price forecasting.
+
+Every series of a source is resampled to a regular grid (months for NBS, days
+for supermarkets), stacked into one matrix and fitted in a single pass:
+
+- simple exponential smoothing, with the smoothing factor picked per series
+  from a grid by one-step-ahead squared error, all series and factors at once;
+- seasonal naive (same month last year, same weekday last week).
+
+Each series keeps whichever model has the lower one-step error and gets 80% and
+95% prediction intervals. Fits are cached per series and redone only for the
+series that changed since the last fit. Measure fit time across all series with
+
+    python -m src.forecast bench
+    python -m src.forecast bench --synthetic 20000
+"""
+import sys
+import time
+import argparse
+import threading
+
+import numpy as np
+
+from dotenv import load_dotenv
+from flask import request, abort
+
+
+from src.engine import PriceStore, Series, current_resolution, get_store, open_store
+from src.serializers import render
+from src.timeseries import align, calendar
+
+
+# Points of history fitted, and the default and longest horizons served, per
+# resolution.
+HISTORY = {"month": 60, "day": 365}
+DEFAULT_HORIZON = {"month": 6, "day": 30}
+MAX_HORIZON = {"month": 24, "day": 90}
+SEASON = {"month": 12, "day": 7}
+
+ALPHAS = np.linspace(0.05, 1.0, 20)
+Z_SCORES = {80: 1.2816, 95: 1.96}
+
+
+def history_matrix(all_series, resolution):
+    """
+    Resamples every series onto its own regular grid, forward-filled, and stacks
+    the last HISTORY points of each into a (series, time) matrix, right-aligned
+    and NaN-padded on the left. Returns the matrix and each series' last period.
+    """
+    size = HISTORY[resolution]
+    matrix = np.full((len(all_series), size), np.nan)
+    ends = []
+    for row, series in enumerate(all_series):
+        if resolution == "day":
+            periods, values = series.dates, series.prices
+        else:
+            periods, values = series.period_means(resolution)
+        grid = calendar(periods[0], periods[-1], resolution)[-size:]
+        matrix[row, size - len(grid) :] = align(grid, periods, values)
+        ends.append(grid[-1])
+    return matrix, np.array(ends, dtype="datetime64[D]")
+
+
+def fit_exponential_smoothing(matrix, alphas=ALPHAS):
+    """
+    Fits simple exponential smoothing to every row for every smoothing factor at
+    once and keeps the best factor per row. Returns (level, alpha, rmse).
+    """
+    rows = np.arange(len(matrix))
+    valid = ~np.isnan(matrix)
+    first = matrix[rows, valid.argmax(axis=1)]
+
+    level = np.tile(first, (len(alphas), 1))
+    squared_errors = np.zeros_like(level)
+    for column in matrix.T:
+        error = np.where(np.isnan(column), 0.0, column - level)
+        squared_errors += error**2
+        level += alphas[:, None] * error
+
+    best = squared_errors.argmin(axis=0)
+    observations = np.maximum(valid.sum(axis=1) - 1, 1)
+    rmse = np.sqrt(squared_errors[best, rows] / observations)
+    return level[best, rows], alphas[best], rmse
+
+
+def fit_seasonal_naive(matrix, season):
+    """
+    One-step errors of the seasonal naive model for every row. Rows with less
+    than two seasons of data get an infinite error.
+    """
+    errors = matrix[:, season:] - matrix[:, :-season]
+    counts = (~np.isnan(errors)).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rmse = np.sqrt(np.nansum(errors**2, axis=1) / counts)
+    rmse[counts < season] = np.inf
+    return rmse
+
+
+def forecast_matrix(matrix, resolution):
+    """
+    Fits both models to every row and forecasts MAX_HORIZON steps ahead.
+    Returns (model names, means, {level: (lower, upper)}), each (series, horizon).
+    """
+    horizon, season = MAX_HORIZON[resolution], SEASON[resolution]
+    steps = np.arange(1, horizon + 1)
+
+    level, alpha, ses_rmse = fit_exponential_smoothing(matrix)
+    naive_rmse = fit_seasonal_naive(matrix, season)
+    seasonal = naive_rmse < ses_rmse
+
+    means = np.repeat(level[:, None], horizon, axis=1)
+    spread = ses_rmse[:, None] * np.sqrt(1 + (steps - 1) * alpha[:, None] ** 2)
+
+    # Seasonal naive repeats the last season, widening once per season ahead.
+    last_season = matrix[:, -season:][:, (steps - 1) % season]
+    means[seasonal] = last_season[seasonal]
+    seasons_ahead = np.sqrt((steps - 1) // season + 1)
+    spread[seasonal] = naive_rmse[seasonal, None] * seasons_ahead
+
+    intervals = {
+        level: (means - z * spread, means + z * spread)
+        for level, z in Z_SCORES.items()
+    }
+    models = np.where(seasonal, "seasonal_naive", "exponential_smoothing")
+    return models, means, intervals
+
+
+def future_periods(end, resolution, horizon):
+    if resolution == "month":
+        months = np.arange(1, horizon + 1) + end.astype("datetime64[M]")
+        return months.astype("datetime64[D]")
+    return end + np.arange(1, horizon + 1)
+
+
+class Forecaster:
+    """Cached forecasts of every series of one source."""
+
+    def __init__(self, source):
+        self.source = source
+        self.resolution = current_resolution(source)
+        self.fitted = {}
+        self.watermark = None
+        self.lock = threading.Lock()
+
+    def update(self, store):
+        """
+        Refits, in one batch, the series that changed since they were last fitted.
+        Returns the number of series fitted.
+        """
+        if store.watermark == self.watermark and self.fitted:
+            return 0
+
+        current = {
+            key: series
+            for key, series in store.series.items()
+            if key[0] == self.source and len(series.dates)
+        }
+        stale = [
+            series
+            for key, series in current.items()
+            if key not in self.fitted or self.fitted[key][0] is not series
+        ]
+
+        fitted = {key: self.fitted[key] for key in current if key in self.fitted}
+        if stale:
+            matrix, ends = history_matrix(stale, self.resolution)
+            models, means, intervals = forecast_matrix(matrix, self.resolution)
+            for row, series in enumerate(stale):
+                bounds = {
+                    level: (lower[row], upper[row])
+                    for level, (lower, upper) in intervals.items()
+                }
+                fitted[series.key] = (
+                    series, ends[row], models[row], means[row], bounds
+                )
+
+        self.fitted, self.watermark = fitted, store.watermark
+        return len(stale)
+
+    def forecast(self, key, horizon):
+        """
+        The model name and (date, forecast, lower/upper 80%, lower/upper 95%) rows
+        of a series, or None if the series is unknown.
+        """
+        if key not in self.fitted:
+            return None
+        _, end, model, means, bounds = self.fitted[key]
+        periods = future_periods(end, self.resolution, horizon)
+        rows = [
+            {
+                "date": str(period),
+                "forecast": round(float(mean), 2),
+                **{
+                    f"{side}_{level}": round(float(bound[index]), 2)
+                    for level, (lower, upper) in bounds.items()
+                    for side, bound in (("lower", lower), ("upper", upper))
+                },
+            }
+            for index, (period, mean) in enumerate(zip(periods, means[:horizon]))
+        ]
+        return str(model), rows
+
+
+_forecasters = {}
+_forecasters_lock = threading.Lock()
+
+
+def get_forecaster(source):
+    """
+    Returns the up-to-date forecaster of `source`, or None when the in-memory
+    store isn't available.
+    """
+    store = get_store()
+    if store is None:
+        return None
+
+    with _forecasters_lock:
+        forecaster = _forecasters.setdefault(source, Forecaster(source))
+    with forecaster.lock:
+        forecaster.update(store)
+    return forecaster
+
+
+def forecast_response(source, food_item, item_type, category):
+    """
+    Reads the `horizon` parameter and returns the forecast of a series, the body
+    of the /nbs/forecast/ and /supermarkets/forecast/ endpoints.
+    """
+    resolution = current_resolution(source)
+    horizon = request.args.get("horizon", "").strip()
+    if horizon and (
+        not horizon.isdigit() or not 0 < int(horizon) <= MAX_HORIZON[resolution]
+    ):
+        return abort(
+            400,
+            "Invalid horizon. Use a number of "
+            f"{resolution}s between 1 and {MAX_HORIZON[resolution]}.",
+        )
+
+    forecaster = get_forecaster(source)
+    if forecaster is None:
+        return abort(503, "Forecasts are not available yet. Try again later.")
+
+    result = forecaster.forecast(
+        (source, food_item, item_type, category),
+        int(horizon) if horizon else DEFAULT_HORIZON[resolution],
+    )
+    if result is None:
+        return abort(404, "No records found. Confirm query parameters.")
+
+    model, rows = result
+    return render({"model": model, "resolution": resolution, "data": rows})
+
+
+def synthetic_store(count, days=1000, seed=0):
+    """A store of `count` random-walk daily supermarket series, for benchmarks."""
+    random = np.random.default_rng(seed)
+    dates = np.datetime64("2022-01-01") + np.arange(days)
+    series = {}
+    for index in range(count):
+        key = ("Supermarket", f"item {index}", "type", "1000 g")
+        prices = 1000 + np.cumsum(random.normal(0, 10, days))
+        series[key] = Series(key, dates, prices, np.ones(days))
+    store = PriceStore()
+    store.replace_series(series)
+    store.watermark = 0
+    return store
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Benchmark forecast fitting.")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=0,
+        help="Fit this many synthetic daily series instead of the loaded store",
+    )
+    args = parser.parse_args()
+
+    store = synthetic_store(args.synthetic) if args.synthetic else open_store()
+
+    for source in ("NBS", "Supermarket"):
+        forecaster = Forecaster(source)
+        started = time.perf_counter()
+        fitted = forecaster.update(store)
+        elapsed = time.perf_counter() - started
+        if fitted:
+            print(
+                f"{source}: fitted {fitted} series in {elapsed:.3f}s "
+                f"({elapsed / fitted * 1e6:.0f} µs/series)"
+            )
+    sys.exit(0)
@@ -0,0 +1,40 @@
+"""
+Cooperative serving mode.
+
+Under gevent every request runs in a greenlet instead of an OS thread. With the
+wait callback below, psycopg2 yields to other greenlets while Postgres works,
+and the OpenAI client's sockets are patched by gevent, so requests waiting on
+the database or the LLM hold no OS thread. Serve with
+
+    gunicorn -k gevent --worker-connections 1000 green_app:app
+
+The routes are the Flask ones, so responses are identical to the threaded mode;
+`python -m src.parity` checks that on two running instances, and
+`python -m src.loadtest` compares their throughput (see the README).
+"""
+import psycopg2
+import psycopg2.extensions
+
+from gevent.socket import wait_read, wait_write
+
+
+def gevent_wait_callback(conn, timeout=None):
+    """Waits for a non-blocking psycopg2 connection without blocking the hub."""
+    while True:
+        state = conn.poll()
+        if state == psycopg2.extensions.POLL_OK:
+            break
+        elif state == psycopg2.extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == psycopg2.extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state}")
+
+
+def make_psycopg2_green():
+    """
+    Makes every psycopg2 connection cooperative. COPY is not supported in this
+    mode, so run `src.ingest` outside of it.
+    """
+    psycopg2.extensions.set_wait_callback(gevent_wait_callback)
@@ -0,0 +1,247 @@
+"""
+Bulk loading of price batches into "Cleaned-Food-Prices".
+
+Batches are CSV files with a header row, or JSON Lines files with one object
+per row, holding the columns in `COLUMNS`. Every batch is streamed through
+COPY into a temporary staging table, deduplicated, and upserted in two
+set-based statements. The (source, food_item, item_type, category, month)
+keys that changed are reported so rollups, caches and snapshots only refresh
+what changed:
+
+    python -m src.ingest prices.csv more_prices.jsonl
+    python -m src.ingest prices.csv --changes changes.jsonl --snapshot
+
+Run `python -m src.init_db` once beforehand to set up the table. Its triggers
+log every write in `price_changes`, which running workers poll to reload the
+changed series (see src/engine.py).
+"""
+import io
+import csv
+import sys
+import json
+import time
+import argparse
+
+from dotenv import load_dotenv
+
+from src.db import get_db_connection
+
+
+COLUMNS = [
+    "date",
+    "food_item",
+    "item_type",
+    "category",
+    "price",
+    "source",
+    "vendor_type",
+]
+
+# The columns identifying a price; a batch row matching an existing row on all
+# of them replaces its price. All but vendor_type (unset for NBS rows) are
+# required, so they are matched with `=`, which Postgres can hash-join on.
+KEY = ["date", "food_item", "item_type", "category", "source"]
+IDENTITY = KEY + ["vendor_type"]
+
+STAGING_TABLE = """
+    CREATE TEMP TABLE price_staging ON COMMIT DROP AS
+    SELECT date, food_item, item_type, category, price, source, vendor_type
+    FROM "Cleaned-Food-Prices"
+    WITH NO DATA
+"""
+
+COPY_STAGING = f"""
+    COPY price_staging ({", ".join(COLUMNS)})
+    FROM STDIN WITH (FORMAT csv, HEADER true)
+"""
+
+IDENTITY_MATCH = " AND ".join(
+    [f"prices.{column} = batch.{column}" for column in KEY]
+    + ["prices.vendor_type IS NOT DISTINCT FROM batch.vendor_type"]
+)
+
+# Rows are normalized the way the endpoints expect them (lower-cased and trimmed)
+# and collapsed to one row per identity. Rows without a price or a key are
+# skipped.
+DEDUPED_BATCH = f"""
+    SELECT DISTINCT ON ({", ".join(IDENTITY)}) *
+    FROM (
+        SELECT
+            date,
+            LOWER(TRIM(food_item)) AS food_item,
+            LOWER(TRIM(item_type)) AS item_type,
+            LOWER(TRIM(category)) AS category,
+            price,
+            source,
+            vendor_type
+        FROM price_staging
+        WHERE price IS NOT NULL
+    ) AS rows
+    WHERE {" AND ".join(f"{column} IS NOT NULL" for column in KEY)}
+"""
+
+CHANGED_KEY = """
+    CASE WHEN source = 'NBS' THEN 'NBS' ELSE 'Supermarket' END,
+    food_item,
+    item_type,
+    category,
+    CAST(DATE_TRUNC('month', CAST(date AS DATE)) AS DATE)
+"""
+
+UPSERT = f"""
+    WITH batch AS ({DEDUPED_BATCH}),
+    updated AS (
+        UPDATE "Cleaned-Food-Prices" prices
+        SET price = batch.price
+        FROM batch
+        WHERE {IDENTITY_MATCH} AND prices.price IS DISTINCT FROM batch.price
+        RETURNING prices.*
+    ),
+    inserted AS (
+        INSERT INTO "Cleaned-Food-Prices" ({", ".join(COLUMNS)})
+        SELECT {", ".join(COLUMNS)}
+        FROM batch
+        WHERE NOT EXISTS (
+            SELECT 1 FROM "Cleaned-Food-Prices" prices WHERE {IDENTITY_MATCH}
+        )
+        RETURNING *
+    )
+    SELECT {CHANGED_KEY}, COUNT(*)
+    FROM (
+        SELECT source, vendor_type, food_item, item_type, category, date
+        FROM updated
+        UNION ALL
+        SELECT source, vendor_type, food_item, item_type, category, date
+        FROM inserted
+    ) AS changed
+    WHERE source = 'NBS' OR vendor_type = 'Supermarket'
+    GROUP BY 1, 2, 3, 4, 5
+"""
+
+
+class JsonLinesAsCsv:
+    """
+    A read-only file turning JSON Lines rows into CSV on the fly, so COPY can
+    stream a JSON Lines file without it ever being held in memory.
+    """
+
+    def __init__(self, lines):
+        self.lines = (line for line in lines if line.strip())
+        self.buffer = self.to_csv(COLUMNS)
+
+    def to_csv(self, values):
+        text = io.StringIO()
+        csv.writer(text).writerow(values)
+        return text.getvalue().encode("utf-8")
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            row = json.loads(line)
+            self.buffer += self.to_csv([row.get(column) for column in COLUMNS])
+
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+
+def copy_batch(cur, path):
+    """Streams one CSV or JSON Lines file into the staging table."""
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        if path.endswith((".jsonl", ".ndjson")):
+            cur.copy_expert(COPY_STAGING, JsonLinesAsCsv(file))
+        else:
+            cur.copy_expert(COPY_STAGING, file)
+
+
+def ingest(conn, paths):
+    """
+    Loads the given batch files in one transaction. Returns the number of rows
+    staged and the (source, food_item, item_type, category, month, rows) keys
+    of the NBS and supermarket series that changed.
+    """
+    with conn, conn.cursor() as cur:
+        cur.execute(STAGING_TABLE)
+        for path in paths:
+            copy_batch(cur, path)
+
+        cur.execute("SELECT COUNT(*) FROM price_staging")
+        staged = cur.fetchone()[0]
+
+        cur.execute(UPSERT)
+        changes = cur.fetchall()
+    return staged, changes
+
+
+def refresh_snapshot(changes):
+    """
+    Applies the changed series to the latest snapshot and writes a new one,
+    reloading only those series from the database.
+    """
+    # Imported here so plain loads don't need NumPy.
+    from src.engine import PriceStore
+    from src.snapshot import build_snapshot, latest_snapshot_path, load_snapshot
+
+    path = latest_snapshot_path()
+    store = load_snapshot(path) if path else None
+    if store is None:
+        store = PriceStore()
+        store.load()
+    else:
+        store.reload(change[:5] for change in changes)
+    return build_snapshot(store)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Bulk load CSV or JSON Lines price batches."
+    )
+    parser.add_argument("paths", nargs="+", help="CSV or .jsonl files to load")
+    parser.add_argument(
+        "--changes", help="Write the changed series/month keys to this JSONL file"
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Refresh the store snapshot with the changed series",
+    )
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        staged, changes = ingest(conn, args.paths)
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - started
+
+    changed_rows = sum(change[5] for change in changes)
+    print(
+        f"Staged {staged} rows, changed {changed_rows} in {elapsed:.2f}s "
+        f"({staged / elapsed if elapsed else 0:.0f} rows/sec), "
+        f"{len(changes)} series/months changed"
+    )
+
+    output = open(args.changes, "w") if args.changes else None
+    for source, food_item, item_type, category, month, rows in changes:
+        line = json.dumps(
+            {
+                "source": source,
+                "food_item": food_item,
+                "item_type": item_type,
+                "category": category,
+                "month": month.isoformat(),
+                "rows": rows,
+            }
+        )
+        print(line, file=output or sys.stdout)
+    if output:
+        output.close()
+
+    if args.snapshot and changes:
+        print("Snapshot written to", refresh_snapshot(changes))
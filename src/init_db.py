@@ -1,16 +1,139 @@
-import os
-import psycopg2
-from sqlalchemy import create_engine
+from dotenv import load_dotenv
 
+from src.db import get_db_connection
+from src.units import UNIT_NORMALIZATION
 
-conn = psycopg2.connect(
-    host=os.getenv("HOST"),
-    database=os.getenv("DATABASE"),
-    user=os.getenv("USER_NAME"),
-    password=os.getenv("PASSWORD"),
-)
 
-with conn.cursor() as cur:
+# A category such as "1000 g" holds the quantity and the unit a price is for.
+QUANTITY = """
+    CASE WHEN SPLIT_PART(category, ' ', 1) ~ '^[0-9]+(\\.[0-9]+)?$'
+        THEN CAST(SPLIT_PART(category, ' ', 1) AS NUMERIC)
+    END
+"""
+
+# Parsed once per row by Postgres, so queries read plain columns instead of
+# splitting and casting the category on every request.
+PARSED_COLUMNS = f"""
+    ALTER TABLE "Cleaned-Food-Prices"
+        ADD COLUMN IF NOT EXISTS quantity NUMERIC
+            GENERATED ALWAYS AS ({QUANTITY}) STORED,
+        ADD COLUMN IF NOT EXISTS unit TEXT
+            GENERATED ALWAYS AS (NULLIF(SPLIT_PART(category, ' ', 2), '')) STORED,
+        ADD COLUMN IF NOT EXISTS unit_price NUMERIC
+            GENERATED ALWAYS AS (CAST(price AS NUMERIC) / NULLIF({QUANTITY}, 0)) STORED
+"""
+
+UNIT_NORMALIZATION_TABLE = """
+    CREATE TABLE IF NOT EXISTS unit_normalization (
+        unit TEXT PRIMARY KEY,
+        factor NUMERIC NOT NULL,
+        standard_unit TEXT NOT NULL
+    )
+"""
+
+DATE_COLUMN_TYPE = """
+    SELECT data_type
+    FROM information_schema.columns
+    WHERE table_name = 'Cleaned-Food-Prices' AND column_name = 'date'
+"""
+
+# Every query filters a series by day, i.e. on `CAST(date AS DATE)`. That cast
+# can only be indexed when it is immutable, which is the case for a timestamp
+# column; on a date column it is a no-op and the column itself serves. A text or
+# timestamptz cast depends on session settings, so only the series columns of
+# the index help there.
+SERIES_INDEX = """
+    CREATE INDEX IF NOT EXISTS cleaned_food_prices_series_day_idx
+    ON "Cleaned-Food-Prices" (food_item, item_type, category, {day})
+"""
+
+# The earlier index on the raw column, superseded by the one above.
+DROP_OLD_SERIES_INDEX = "DROP INDEX IF EXISTS cleaned_food_prices_series_idx"
+
+# Every write to the prices is logged, per series, with the first day it touched,
+# by the statement-level triggers below. Workers poll the latest id and reload
+# only the series logged since the one they last saw (see src/engine.py).
+PRICE_CHANGES_TABLE = """
+    CREATE TABLE IF NOT EXISTS price_changes (
+        id BIGSERIAL PRIMARY KEY,
+        source TEXT NOT NULL,
+        food_item TEXT,
+        item_type TEXT,
+        category TEXT,
+        since DATE NOT NULL,
+        changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+LOGGED_CHANGES = """
+    INSERT INTO price_changes (source, food_item, item_type, category, since)
+    SELECT
+        CASE WHEN source = 'NBS' THEN 'NBS' ELSE 'Supermarket' END,
+        food_item,
+        item_type,
+        category,
+        MIN(CAST(date AS DATE))
+    FROM {rows}
+    WHERE (source = 'NBS' OR vendor_type = 'Supermarket') AND date IS NOT NULL
+    GROUP BY 1, 2, 3, 4;
+"""
+
+RECORD_PRICE_CHANGES = f"""
+    CREATE OR REPLACE FUNCTION record_price_changes() RETURNS trigger AS $$
+    BEGIN
+        -- Held until commit, so ids become visible in the order they were
+        -- given out and a worker that has seen id n has seen every id before.
+        LOCK TABLE price_changes IN SHARE ROW EXCLUSIVE MODE;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            {LOGGED_CHANGES.format(rows="new_rows")}
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            {LOGGED_CHANGES.format(rows="old_rows")}
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+# Transition tables allow a single event per trigger.
+PRICE_CHANGE_TRIGGERS = {
+    "insert": "REFERENCING NEW TABLE AS new_rows",
+    "update": "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "delete": "REFERENCING OLD TABLE AS old_rows",
+}
+
+# Filled by `python -m src.correlation`: articles per topic and day, and the
+# running sums behind each (series, topic, lag) news-to-price correlation.
+NEWS_TOPIC_COUNTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS news_topic_counts (
+        day DATE NOT NULL,
+        topic TEXT NOT NULL,
+        articles INTEGER NOT NULL,
+        PRIMARY KEY (day, topic)
+    )
+"""
+
+NEWS_PRICE_CORRELATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS news_price_correlations (
+        source TEXT NOT NULL,
+        food_item TEXT NOT NULL,
+        item_type TEXT NOT NULL,
+        category TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        lag INTEGER NOT NULL,
+        through DATE NOT NULL,
+        observations DOUBLE PRECISION NOT NULL,
+        sum_x DOUBLE PRECISION NOT NULL,
+        sum_xx DOUBLE PRECISION NOT NULL,
+        sum_y DOUBLE PRECISION NOT NULL,
+        sum_yy DOUBLE PRECISION NOT NULL,
+        sum_xy DOUBLE PRECISION NOT NULL,
+        PRIMARY KEY (source, food_item, item_type, category, topic, lag)
+    )
+"""
+
+
+def list_tables(cur):
     cur.execute(
         """
         SELECT table_name
@@ -18,8 +141,59 @@ with conn.cursor() as cur:
         WHERE table_schema = 'public'
         """
     )
-    print("Tables in public schema:", [row[0] for row in cur])
-conn.close()
+    return [row[0] for row in cur]
+
+
+def migrate(cur):
+    """
+    Adds the parsed quantity, unit and unit price columns, the unit
+    normalization table, the series index, the price change log and the news
+    correlation tables. Safe to run more than once.
+    """
+    cur.execute(PARSED_COLUMNS)
+    cur.execute(UNIT_NORMALIZATION_TABLE)
+    for unit, (factor, standard_unit) in UNIT_NORMALIZATION.items():
+        cur.execute(
+            """
+            INSERT INTO unit_normalization (unit, factor, standard_unit)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (unit) DO UPDATE
+            SET factor = EXCLUDED.factor, standard_unit = EXCLUDED.standard_unit
+            """,
+            (unit, factor, standard_unit),
+        )
+    cur.execute(DATE_COLUMN_TYPE)
+    date_type = cur.fetchone()[0]
+    day = "CAST(date AS DATE)" if date_type == "timestamp without time zone" else "date"
+    cur.execute(SERIES_INDEX.format(day=day))
+    cur.execute(DROP_OLD_SERIES_INDEX)
+    cur.execute(PRICE_CHANGES_TABLE)
+    cur.execute(RECORD_PRICE_CHANGES)
+    for event, transition in PRICE_CHANGE_TRIGGERS.items():
+        cur.execute(
+            f'DROP TRIGGER IF EXISTS price_changes_{event} ON "Cleaned-Food-Prices"'
+        )
+        cur.execute(
+            f"""
+            CREATE TRIGGER price_changes_{event}
+            AFTER {event.upper()} ON "Cleaned-Food-Prices"
+            {transition}
+            FOR EACH STATEMENT EXECUTE FUNCTION record_price_changes()
+            """
+        )
+    cur.execute(NEWS_TOPIC_COUNTS_TABLE)
+    cur.execute(NEWS_PRICE_CORRELATIONS_TABLE)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    conn = get_db_connection()
+
+    with conn, conn.cursor() as cur:
+        migrate(cur)
+        print("Tables in public schema:", list_tables(cur))
+    conn.close()
 
 
 # """
@@ -0,0 +1,196 @@
+"""
+Closed-loop load test of a running instance, used to compare the threaded and
+the gevent serving modes (see src/green.py) on the same requests:
+
+    python -m src.loadtest --base-url http://127.0.0.1:8000
+    python -m src.loadtest --base-url http://127.0.0.1:8000 \\
+        --concurrency 16 64 256 --duration 30 --log access.log
+
+Without --log, the requests are a fixed mix of the price routes over the series
+in the instance's /catalog/, shuffled with --seed, so every run and every mode
+gets the same ones. Each concurrency level keeps that many requests in flight
+for --duration seconds, then reports throughput, failures and latency
+percentiles.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import threading
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+from src.replay import PERCENTILES, percentiles, read_log, send
+
+# Routes taking a (food_item, item_type, category) series of their source.
+SERIES_ROUTES = {
+    "nbs": [
+        "/nbs/year/",
+        "/nbs/average-price-over-years/",
+        "/nbs/mom-percentage/",
+        "/nbs/yoy-percentage/",
+    ],
+    "supermarkets": [
+        "/supermarkets/all-time/",
+        "/supermarkets/year/",
+        "/supermarkets/monthly-average-price/",
+        "/supermarkets/mom-percentage/",
+        "/supermarkets/dod-percentage/",
+    ],
+}
+
+# Routes taking a food item of their source.
+FOOD_ITEM_ROUTES = {
+    "nbs": ["/nbs/average-item-types-price/"],
+    "supermarkets": ["/supermarkets/average-item-types-price/"],
+}
+
+FIXED_REQUESTS = [
+    ("/nbs/overview/", {}),
+    ("/supermarkets/overview/", {}),
+    ("/price-index/", {"source": "nbs"}),
+    ("/anomalies/", {}),
+    ("/volatility/", {}),
+    ("/catalog/search/", {"q": "ri"}),
+]
+
+NBS_YEARS = range(2016, 2025)
+
+
+def catalog_series(base_url, timeout):
+    """Returns {source: [(food_item, item_type, category), ...]} from /catalog/."""
+    with urlopen(base_url.rstrip("/") + "/catalog/", timeout=timeout) as response:
+        catalog = json.load(response)["data"]
+    return {
+        source: [
+            (food_item, item_type, category)
+            for food_item, item_types in sorted(items.items())
+            for item_type, categories in sorted(item_types.items())
+            for category in sorted(categories)
+        ]
+        for source, items in catalog.items()
+    }
+
+
+def build_requests(base_url, count, seed, timeout=30.0):
+    """
+    Returns `count` requests, in the access log format src.replay sends, drawn
+    from the price routes over the catalog's series.
+    """
+    sources = catalog_series(base_url, timeout)
+    candidates = [{"p": path, "q": params} for path, params in FIXED_REQUESTS]
+    for source, series in sources.items():
+        for food_item, item_type, category in series:
+            params = {
+                "food_item": food_item,
+                "item_type": item_type,
+                "category": category,
+            }
+            for path in SERIES_ROUTES.get(source, []):
+                candidates.append({"p": path, "q": dict(params)})
+        for food_item in sorted({food_item for food_item, _, _ in series}):
+            for path in FOOD_ITEM_ROUTES.get(source, []):
+                candidates.append({"p": path, "q": {"food_item": food_item}})
+
+    # /compare takes a repeated parameter: each NBS series against the
+    # supermarket one with the same food item, item type and category.
+    nbs, supermarkets = set(sources.get("nbs", [])), set(
+        sources.get("supermarkets", [])
+    )
+    for key in sorted(nbs & supermarkets):
+        series = ["|".join((source, *key)) for source in ("nbs", "supermarkets")]
+        candidates.append({"p": "/compare/", "q": {"series": series}})
+
+    rng = random.Random(seed)
+    requests = [dict(rng.choice(candidates)) for _ in range(count)]
+    for entry in requests:
+        if entry["p"] == "/nbs/year/":
+            entry["q"] = dict(entry["q"], year=str(rng.choice(NBS_YEARS)))
+    return requests
+
+
+def run_load(entries, base_url, concurrency, duration, timeout):
+    """
+    Keeps `concurrency` requests in flight, cycling through `entries`, for
+    `duration` seconds. Returns the (status, latency) of each and the wall time.
+    """
+    results = []
+    lock = threading.Lock()
+    upcoming = itertools.cycle(entries)
+    deadline = time.perf_counter() + duration
+
+    def run():
+        while time.perf_counter() < deadline:
+            with lock:
+                entry = next(upcoming)
+            status, latency = send(base_url, entry, timeout)
+            with lock:
+                results.append((status, latency))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(run)
+    return results, time.perf_counter() - started
+
+
+def report_row(concurrency, results, elapsed):
+    """Prints one line of the results table."""
+    statuses = Counter(status for status, _ in results)
+    failed = sum(n for status, n in statuses.items() if status == 0 or status >= 500)
+    latencies = [latency for _, latency in results] or [0.0]
+    cuts = percentiles(latencies)
+    print(
+        f"{concurrency:>11}{len(results):>9}"
+        f"{len(results) / elapsed if elapsed else 0:>9.1f}{failed:>8}"
+        + "".join(f"{cuts[percentile]:9.1f}" for percentile in PERCENTILES)
+        + f"{max(latencies):9.1f}",
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test a running instance.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[16, 64, 256],
+        help="Requests kept in flight, one run per value",
+    )
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unreported seconds")
+    parser.add_argument("--log", help="Send the requests of this access log instead")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    if args.log:
+        entries = read_log(args.log, args.requests)
+    else:
+        entries = build_requests(args.base_url, args.requests, args.seed, args.timeout)
+    if not entries:
+        print("No requests to send", file=sys.stderr)
+        sys.exit(1)
+
+    if args.warmup:
+        run_load(
+            entries, args.base_url, min(args.concurrency), args.warmup, args.timeout
+        )
+
+    header = "".join(f"{f'p{percentile}':>9}" for percentile in PERCENTILES)
+    print(
+        f"{'concurrency':>11}{'requests':>9}{'req/s':>9}{'failed':>8}{header}{'max':>9}"
+    )
+    for concurrency in args.concurrency:
+        results, elapsed = run_load(
+            entries, args.base_url, concurrency, args.duration, args.timeout
+        )
+        report_row(concurrency, results, elapsed)
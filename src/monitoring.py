@@ -0,0 +1,355 @@
+"""
+Rolling price statistics and anomaly alerts.
+
+Every series keeps a small rolling state (count, all-time mean and variance,
+EWMA mean and variance of the price, EWMA variance of the period-on-period
+change) that is updated in O(1) per new observation. When the store picks up
+new rows, only the observations after the last one seen are fed in, so no
+history is rescanned. An observation is flagged when it is more than
+ANOMALY_Z_SCORE EWMA standard deviations from the EWMA mean, or moves more than
+ANOMALY_CHANGE_PERCENT from the previous observation.
+"""
+import os
+import math
+import datetime
+import threading
+
+from collections import deque
+
+import numpy as np
+
+from flask import jsonify, request, abort
+from flask_restx import Resource, Namespace
+
+from src.cache import response_cache
+from src.catalog import SOURCES
+from src.engine import get_store, current_resolution, first_difference
+from src.utils import parse_date_range
+
+
+api = Namespace(
+    "Monitoring", description="Price anomalies and volatility", path="/"
+)
+
+ANOMALY_Z_SCORE = float(os.getenv("ANOMALY_Z_SCORE", "3"))
+ANOMALY_CHANGE_PERCENT = float(os.getenv("ANOMALY_CHANGE_PERCENT", "20"))
+
+# EWMA span in observations per resolution, and how many observations a series
+# needs before it can be flagged.
+EWMA_SPAN = {"month": 12, "day": 30}
+MIN_OBSERVATIONS = 10
+# Observations replayed one by one when a series is (re)built; older history
+# only seeds the state.
+WARMUP_OBSERVATIONS = 4
+ANOMALIES_PER_SERIES = 20
+
+
+class RollingStats:
+    """The rolling state of one series, updated one observation at a time."""
+
+    __slots__ = (
+        "alpha", "count", "mean", "m2", "ewma", "ewma_var", "change_var",
+        "last_date", "last_price",
+    )
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = self.m2 = self.ewma = self.ewma_var = self.change_var = 0.0
+        self.last_date = None
+        self.last_price = None
+
+    def copy(self):
+        stats = RollingStats(self.alpha)
+        for name in self.__slots__:
+            setattr(stats, name, getattr(self, name))
+        return stats
+
+    def seed(self, dates, prices):
+        """Initializes the state from a block of history in one vectorized pass."""
+        changes = np.diff(prices) / prices[:-1] * 100
+        self.count = len(prices)
+        self.mean = self.ewma = float(prices.mean())
+        self.m2 = float(((prices - self.mean) ** 2).sum())
+        self.ewma_var = float(prices.var())
+        self.change_var = float((changes**2).mean()) if len(changes) else 0.0
+        self.last_date, self.last_price = dates[-1], float(prices[-1])
+
+    def update(self, date, price):
+        """
+        Adds one observation and returns its (z-score, change percentage), each
+        None when there isn't enough history to compute it.
+        """
+        z_score = change = None
+        if self.count >= MIN_OBSERVATIONS and self.ewma_var > 0:
+            z_score = (price - self.ewma) / math.sqrt(self.ewma_var)
+        if self.last_price:
+            change = (price - self.last_price) / self.last_price * 100
+            self.change_var += self.alpha * (change**2 - self.change_var)
+
+        # Welford's all-time mean and variance.
+        self.count += 1
+        delta = price - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (price - self.mean)
+
+        # Exponentially weighted mean and variance.
+        difference = price - self.ewma if self.count > 1 else 0.0
+        increment = self.alpha * difference
+        self.ewma = self.ewma + increment if self.count > 1 else price
+        self.ewma_var = (1 - self.alpha) * (self.ewma_var + difference * increment)
+
+        self.last_date, self.last_price = date, price
+        return z_score, change
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    @property
+    def volatility(self):
+        """EWMA standard deviation of the period-on-period change, in percent."""
+        return math.sqrt(self.change_var)
+
+
+def is_anomaly(z_score, change):
+    return (z_score is not None and abs(z_score) >= ANOMALY_Z_SCORE) or (
+        change is not None and abs(change) >= ANOMALY_CHANGE_PERCENT
+    )
+
+
+class SeriesMonitor:
+    """Rolling state and recent anomalies of one series."""
+
+    __slots__ = ("series", "stats", "before_last", "anomalies")
+
+    def __init__(self, series, span):
+        self.series = series
+        self.stats = RollingStats(2 / (span + 1))
+        self.before_last = None
+        self.anomalies = deque(maxlen=ANOMALIES_PER_SERIES)
+
+        dates, prices = series.dates, series.prices
+        seed = max(len(dates) - WARMUP_OBSERVATIONS * span, 1)
+        self.stats.seed(dates[:seed], prices[:seed])
+        self.feed(dates[seed:], prices[seed:])
+
+    def feed(self, dates, prices):
+        """Adds observations newer than the last one seen."""
+        for date, price in zip(dates, prices.tolist()):
+            self.before_last = self.stats.copy()
+            previous, expected = self.stats.last_price, self.stats.ewma
+            z_score, change = self.stats.update(date, price)
+            if is_anomaly(z_score, change):
+                self.anomalies.append(
+                    (date, price, previous, expected, z_score, change)
+                )
+
+    def advance(self, series):
+        """
+        Catches up with a new version of the series. New observations are fed
+        in and a revised last observation is replayed; a change further back
+        (a backfill) returns False so the caller rebuilds the series.
+        """
+        changed_from = first_difference(self.series, series)
+        last = self.stats.last_date
+        if changed_from is not None and changed_from <= last:
+            if changed_from < last or self.before_last is None:
+                return False
+            self.stats, self.before_last = self.before_last, None
+            while self.anomalies and self.anomalies[-1][0] >= last:
+                self.anomalies.pop()
+
+        new = series.dates > self.stats.last_date
+        self.feed(series.dates[new], series.prices[new])
+        self.series = series
+        return True
+
+
+class Monitor:
+    """The rolling state of every series of one source."""
+
+    def __init__(self, source):
+        self.source = source
+        self.span = EWMA_SPAN[current_resolution(source)]
+        self.monitors = {}
+        self.watermark = None
+        self.lock = threading.Lock()
+
+    def update(self, store):
+        """
+        Brings every series up to date with the store, touching only the series
+        that changed. Returns the number of series updated or rebuilt.
+        """
+        if store.watermark == self.watermark and self.monitors:
+            return 0
+
+        monitors, updated = {}, 0
+        for key, series in store.series.items():
+            if key[0] != self.source or not len(series.dates):
+                continue
+            monitor = self.monitors.get(key)
+            if monitor is None or monitor.series is not series:
+                updated += 1
+                if monitor is None or not monitor.advance(series):
+                    monitor = SeriesMonitor(series, self.span)
+            monitors[key] = monitor
+
+        self.monitors, self.watermark = monitors, store.watermark
+        return updated
+
+    def select(self, food_item=None):
+        """
+        A consistent copy of the (key, stats, anomalies) of every series, or of
+        the series of one food item, taken while no update is running.
+        """
+        with self.lock:
+            return [
+                (key, monitor.stats.copy(), list(monitor.anomalies))
+                for key, monitor in self.monitors.items()
+                if food_item is None or key[1] == food_item
+            ]
+
+
+_monitors = {}
+_monitors_lock = threading.Lock()
+
+
+def get_monitor(source):
+    """
+    Returns the up-to-date monitor of `source`, or None when the in-memory store
+    isn't available.
+    """
+    store = get_store()
+    if store is None:
+        return None
+
+    with _monitors_lock:
+        monitor = _monitors.setdefault(source, Monitor(source))
+    with monitor.lock:
+        monitor.update(store)
+    return monitor
+
+
+def parse_monitoring_args(default_limit):
+    """Reads the `source`, `food_item` and `limit` query parameters."""
+    source = request.args.get("source", "supermarkets").lower().strip()
+    food_item = request.args.get("food_item", "").lower().strip() or None
+    limit = request.args.get("limit", str(default_limit)).strip()
+
+    if source not in SOURCES:
+        return abort(400, f"Invalid source. Choose from: {', '.join(SOURCES)}")
+    if not limit.isdigit() or not 0 < int(limit) <= 500:
+        return abort(400, "Invalid limit. Use a number between 1 and 500.")
+
+    monitor = get_monitor(SOURCES[source])
+    if monitor is None:
+        return abort(503, "Monitoring is not available yet. Try again later.")
+    return monitor, food_item, int(limit)
+
+
+def round_or_none(value, digits=2):
+    return round(float(value), digits) if value is not None else None
+
+
+# http://127.0.0.1:5000/anomalies/?source=supermarkets&from=2024-06-01
+@api.route("/anomalies/")
+@api.doc(
+    description="Returns the most recent abnormal price moves, newest first: prices "
+    f"more than {ANOMALY_Z_SCORE:g} rolling standard deviations from the rolling "
+    f"mean, or more than {ANOMALY_CHANGE_PERCENT:g}% from the previous price.",
+    params={
+        "source": "nbs or supermarkets. Default is supermarkets.",
+        "food_item": "Only this food item e.g. tomato. Default is every item.",
+        "from": "Earliest day, YYYY-MM-DD.",
+        "to": "Latest day, YYYY-MM-DD.",
+        "limit": "The maximum number of anomalies. Default is 50.",
+    },
+)
+class Anomalies(Resource):
+    """Returns the most recent abnormal price moves."""
+
+    def get(self):
+        monitor, food_item, limit = parse_monitoring_args(50)
+        start, end = parse_date_range()
+
+        cache_key = (
+            "anomalies", monitor.source, food_item, start, end, limit,
+            monitor.watermark,
+        )
+        data = response_cache.get(cache_key)
+        if data is None:
+            start = np.datetime64(start or datetime.date.min, "D")
+            end = np.datetime64(end or datetime.date.max, "D")
+            records = [
+                (key, anomaly)
+                for key, _, anomalies in monitor.select(food_item)
+                for anomaly in anomalies
+                if start <= anomaly[0] <= end
+            ]
+            records.sort(key=lambda record: record[1][0], reverse=True)
+            data = [
+                {
+                    "date": str(date),
+                    "food_item": key[1],
+                    "item_type": key[2],
+                    "category": key[3],
+                    "price": round(price, 2),
+                    "previous_price": round_or_none(previous),
+                    "expected_price": round(expected, 2),
+                    "z_score": round_or_none(z_score),
+                    "change_percentage": round_or_none(change),
+                }
+                for key, (date, price, previous, expected, z_score, change) in (
+                    records[:limit]
+                )
+            ]
+            response_cache.set(cache_key, data)
+
+        return jsonify({"data": data})
+
+
+# http://127.0.0.1:5000/volatility/?source=supermarkets&food_item=tomato
+@api.route("/volatility/")
+@api.doc(
+    description="Returns the most volatile series, ranked by the rolling standard "
+    "deviation of their day-on-day (NBS: month-on-month) percentage change.",
+    params={
+        "source": "nbs or supermarkets. Default is supermarkets.",
+        "food_item": "Only this food item e.g. tomato. Default is every item.",
+        "limit": "The maximum number of series. Default is 20.",
+    },
+)
+class Volatility(Resource):
+    """Returns the most volatile series."""
+
+    def get(self):
+        monitor, food_item, limit = parse_monitoring_args(20)
+
+        cache_key = ("volatility", monitor.source, food_item, limit, monitor.watermark)
+        data = response_cache.get(cache_key)
+        if data is None:
+            ranked = sorted(
+                monitor.select(food_item),
+                key=lambda item: item[1].volatility,
+                reverse=True,
+            )
+            data = [
+                {
+                    "food_item": key[1],
+                    "item_type": key[2],
+                    "category": key[3],
+                    "volatility": round(stats.volatility, 2),
+                    "rolling_mean": round(stats.ewma, 2),
+                    "rolling_std": round(math.sqrt(stats.ewma_var), 2),
+                    "mean": round(stats.mean, 2),
+                    "std": round(stats.std, 2),
+                    "observations": stats.count,
+                    "last_date": str(stats.last_date),
+                    "last_price": round(stats.last_price, 2),
+                }
+                for key, stats, _ in ranked[:limit]
+            ]
+            response_cache.set(cache_key, data)
+
+        return jsonify({"data": data})
@@ -1,31 +1,28 @@
-import os
 import psycopg2
-import json
+import datetime
 
 from flask import jsonify, request, abort
 from flask_restx import Resource, Namespace
-from .utils import validate_nbs_food_item
-
-
-def get_db_connection():
-    conn = psycopg2.connect(
-        host=os.getenv("HOST"),
-        database=os.getenv("DATABASE"),
-        user=os.getenv("USER_NAME"),
-        password=os.getenv("PASSWORD"),
-    )
-    return conn
+from .cache import response_cache
+from .catalog import get_catalog
+from .db import pooled_cursor
+from .engine import get_store, NBS
+from .forecast import forecast_response
+from .queries import execute
+from .timeseries import to_arrays, downsample
+from .serializers import render_series, format_dates
+from .utils import (
+    validate_nbs_food_item,
+    parse_downsampling_args,
+    catalog_series,
+    format_overview,
+)
 
 
 api = Namespace("NBS", description="NBS food price data operations")
 
-conversion_dictionary = {"g": [1000, "kg"], "ml": [1000, "L"], "pcs": [1, "pcs"]}
-
 # http://127.0.0.1:5000/nbs/year/?food_item=oil&item_type=vegetable&category=1000%20ml&year=2017
 
-with open("dashboard_items/nbs_dashboard.json", "r") as file:
-    nbs_dashboard_file = json.load(file)
-
 
 # http://127.0.0.1:5000/nbs/year/?food_item=oil&item_type=vegetable&category=1%20ltr&year=2017
 @api.route("/year/")
@@ -36,6 +33,9 @@ with open("dashboard_items/nbs_dashboard.json", "r") as file:
         "item_type": "Item type e.g. Local",
         "category": "Category e.g. 1000 g",
         "year": "Year (starting from 2016) e.g. 2017",
+        "resolution": "Aggregate the series by day, week or month. Default is day.",
+        "max_points": "Downsample the series to at most this many points (LTTB).",
+        "format": "Response layout, rows or columnar. Default is rows.",
     },
 )
 class FilterByYear(Resource):
@@ -57,32 +57,58 @@ class FilterByYear(Resource):
             if int(year) < 2016:
                 return abort(400, "Invalid year. The earliest year is 2016.")
 
-            check = validate_nbs_food_item(food_item, nbs_dashboard_file)
+            check = validate_nbs_food_item(food_item, get_catalog(NBS))
             if check is not None:
                 return check
 
-            with get_db_connection().cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT date, price
-                    FROM "Cleaned-Food-Prices"
-                    WHERE food_item = %s AND item_type = %s AND category = %s 
-                    AND source = 'NBS' AND (EXTRACT(YEAR FROM CAST(date AS DATE)) = %s OR
-                                            EXTRACT(YEAR FROM CAST(date AS DATE)) = %s);
-                """,
-                    (food_item, item_type, category, year, previous_year),
+            resolution, max_points = parse_downsampling_args()
+            downsampling = resolution != "day" or max_points is not None
+            store = get_store()
+            cache_key = (
+                "nbs/year",
+                food_item,
+                item_type,
+                category,
+                year,
+                resolution,
+                max_points,
+                store.watermark if store else None,
+            )
+
+            if downsampling:
+                series = response_cache.get(cache_key)
+                if series is not None:
+                    return render_series(*series, "value")
+
+            if store is not None:
+                prices = store.year_prices(
+                    (NBS, food_item, item_type, category), int(year)
                 )
+                dates, values = prices if prices is not None else to_arrays([])
+            else:
+                with pooled_cursor() as cur:
+                    cur.execute(
+                        """
+                        SELECT date, price
+                        FROM "Cleaned-Food-Prices"
+                        WHERE food_item = %s AND item_type = %s AND category = %s 
+                        AND source = 'NBS' AND (EXTRACT(YEAR FROM CAST(date AS DATE)) = %s OR
+                                                EXTRACT(YEAR FROM CAST(date AS DATE)) = %s);
+                    """,
+                        (food_item, item_type, category, year, previous_year),
+                    )
 
-                # Fetch all results
-                records = cur.fetchall()
+                    # Fetch all results
+                    dates, values = to_arrays(cur.fetchall())
 
-                if not records:
-                    return abort(404, "No records found. Confirm query parameters.")
+            if not len(dates):
+                return abort(404, "No records found. Confirm query parameters.")
 
-                data = [
-                    {"date": record[0], "value": float("{:.2f}".format(record[1]))}
-                    for record in records
-                ]
+            if downsampling:
+                dates, values = downsample(dates, values, resolution, max_points)
+            series = (format_dates(dates.astype(object)), values)
+            if downsampling:
+                response_cache.set(cache_key, series)
 
         except psycopg2.Error as e:
             return abort(500, f"Database error: {str(e)}")
@@ -90,7 +116,7 @@ class FilterByYear(Resource):
         # except Exception as e:
         #     return abort(500, f"An unexpected error occurred: {str(e)}")
 
-        return jsonify({"data": data})
+        return render_series(*series, "value")
 
 
 # http://127.0.0.1:5000/nbs/average-item-types-price/?food_item=oil&year=2018
@@ -109,66 +135,43 @@ class AverageItemTypesPrice(Resource):
             if not all([food_item]):
                 return abort(400, "Missing required parameters")
 
-            check = validate_nbs_food_item(food_item, nbs_dashboard_file)
+            check = validate_nbs_food_item(food_item, get_catalog(NBS))
             if check is not None:
                 return check
 
-            item_type_filter = ",".join(
-                f"'{item_type}'" for item_type in nbs_dashboard_file[food_item]
-            )
-
-            with get_db_connection().cursor() as cur:
-                cur.execute(
-                    f"""
-                    WITH latest AS (
-                        SELECT *, DATE_TRUNC('month', MAX(CAST(date AS TIMESTAMP)) OVER()) AS max_date
-                        FROM "Cleaned-Food-Prices" 
-                        WHERE category IS NOT NULL AND LENGTH(category) > 0
-                        AND food_item = %s AND source = 'NBS'
-                    ), datapoints AS (
-                        SELECT 
-                            item_type, 
-                            category, 
-                            price, 
-                            SPLIT_PART(category, ' ', 1) AS numeric_part,
-                            SPLIT_PART(category, ' ', 2) AS unit,
-                            price / NULLIF(CAST(SPLIT_PART(category, ' ', 1) AS numeric), 0) AS unit_price
-                        FROM latest
-                        WHERE DATE_TRUNC('month', CAST(date AS TIMESTAMP)) = max_date  AND item_type in ({item_type_filter})
-                    ) 
-                    SELECT item_type, AVG(unit_price) AS average_price, unit, MIN(numeric_part) AS min_numeric_part, MAX(price) AS max_price
-                    FROM datapoints 
-                    GROUP BY item_type, unit;
-                    """,
-                    (food_item,),
+            store = get_store()
+            if store is not None:
+                records = store.latest_unit_prices(
+                    NBS, food_item, list(get_catalog(NBS)[food_item])
                 )
+            else:
+                with pooled_cursor() as cur:
+                    execute(
+                        cur,
+                        "nbs_average_item_types_price",
+                        {
+                            "food_item": food_item,
+                            "item_types": list(get_catalog(NBS)[food_item]),
+                        },
+                    )
+
+                    records = cur.fetchall()
+
+            if not records:
+                return abort(404, "No records found. Confirm query parameters.")
 
-                records = cur.fetchall()
-
-                if not records:
-                    return abort(404, "No records found. Confirm query parameters.")
-
-                data = []
-                for record in records:
-                    item_type, average_price, unit, min_numeric_part, max_price = record
-                    if unit in conversion_dictionary:
-                        conversion_factor, new_unit = conversion_dictionary[unit]
-                        converted_price = average_price * conversion_factor
-                        data.append(
-                            {
-                                "item_type": item_type,
-                                "average_price": round(converted_price, 2),
-                                "unit": new_unit,
-                            }
-                        )
-                    else:
-                        data.append(
-                            {
-                                "item_type": item_type,
-                                "average_price": round(average_price, 2),
-                                "unit": unit,
-                            }
-                        )
+            data = []
+            for item_type, average_price, unit in records:
+                if average_price is None:
+                    continue  # no usable quantity in the category
+
+                data.append(
+                    {
+                        "item_type": item_type,
+                        "average_price": round(float(average_price), 2),
+                        "unit": unit,
+                    }
+                )
 
         except psycopg2.Error as e:
             return abort(500, f"Database error: {str(e)}")
@@ -179,6 +182,85 @@ class AverageItemTypesPrice(Resource):
         return jsonify({"data": data})
 
 
+# http://127.0.0.1:5000/nbs/overview/
+@api.route("/overview/")
+@api.doc(
+    description="Returns the latest average unit price and month-on-month change of "
+    "every item_type of every food_item on the dashboard.",
+)
+class Overview(Resource):
+    """
+    Returns the latest average unit price and month-on-month change of every
+    item_type of every food_item on the dashboard, in one request.
+    """
+
+    def get(self):
+        try:
+            store = get_store()
+            cache_key = ("nbs/overview", store.watermark if store else None)
+            data = response_cache.get(cache_key)
+            if data is not None:
+                return jsonify({"data": data})
+
+            food_items, item_types, categories = catalog_series(get_catalog(NBS))
+            if store is not None:
+                records = store.overview(NBS, food_items, item_types, categories)
+            else:
+                with pooled_cursor() as cur:
+                    execute(
+                        cur,
+                        "nbs_overview",
+                        {
+                            "food_items": food_items,
+                            "item_types": item_types,
+                            "categories": categories,
+                        },
+                    )
+
+                    records = cur.fetchall()
+
+            if not records:
+                return abort(404, "No records found.")
+
+            data = format_overview(records)
+            response_cache.set(cache_key, data)
+
+        except psycopg2.Error as e:
+            return abort(500, f"Database error: {str(e)}")
+
+        return jsonify({"data": data})
+
+
+# http://127.0.0.1:5000/nbs/forecast/?food_item=rice&item_type=local&category=1000%20g&horizon=6
+@api.route("/forecast/")
+@api.doc(
+    description="Returns the forecast monthly average price of a food item, item type "
+    "and category with 80% and 95% prediction intervals.",
+    params={
+        "food_item": "Specify the food item e.g. rice",
+        "item_type": "Specify its item_type e.g. local",
+        "category": "Specify the category e.g. 1000 g",
+        "horizon": "Months ahead, between 1 and 24. Default is 6.",
+    },
+)
+class Forecast(Resource):
+    """Returns the forecast monthly average price of a food item, item type and category."""
+
+    def get(self):
+        food_item = request.args.get("food_item", "").lower().strip()
+        item_type = request.args.get("item_type", "").lower().strip()
+        category = request.args.get("category", "").lower().strip()
+
+        if not all([food_item, item_type, category]):
+            return abort(400, "Missing required parameters")
+
+        check = validate_nbs_food_item(food_item, get_catalog(NBS))
+        if check is not None:
+            return check
+
+        return forecast_response(NBS, food_item, item_type, category)
+
+
 # http://127.0.0.1:5000/nbs/average-price-over-years/?food_item=oil&item_type=vegetable&category=1000%20ml
 @api.route("/average-price-over-years/")
 @api.doc(
@@ -187,6 +269,7 @@ class AverageItemTypesPrice(Resource):
         "food_item": "Specify the food item e.g. potato",
         "item_type": "Specify its item_type e.g. irish",
         "category": "Specify the category e.g. 1000 g",
+        "format": "Response layout, rows or columnar. Default is rows.",
     },
 )
 class AveragePriceOverYears(Resource):
@@ -201,33 +284,34 @@ class AveragePriceOverYears(Resource):
             if not all([food_item, item_type, category]):
                 return abort(400, "Missing required parameters")
 
-            check = validate_nbs_food_item(food_item, nbs_dashboard_file)
+            check = validate_nbs_food_item(food_item, get_catalog(NBS))
             if check is not None:
                 return check
 
-            with get_db_connection().cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT EXTRACT(YEAR FROM CAST(date AS DATE)) AS year,
-                        AVG(price) AS average_price
-                    FROM "Cleaned-Food-Prices"
-                    WHERE food_item = %s AND item_type = %s AND category = %s AND source = 'NBS'
-                    GROUP BY EXTRACT(YEAR FROM CAST(date AS DATE))
-                    ORDER BY year;
-
-                    """,
-                    (food_item, item_type, category),
-                )
-
-                records = cur.fetchall()
+            store = get_store()
+            if store is not None:
+                averages = store.yearly_averages((NBS, food_item, item_type, category))
+                years, average_prices = averages if averages is not None else ((), ())
+            else:
+                with pooled_cursor() as cur:
+                    cur.execute(
+                        """
+                        SELECT EXTRACT(YEAR FROM CAST(date AS DATE)) AS year,
+                            AVG(price) AS average_price
+                        FROM "Cleaned-Food-Prices"
+                        WHERE food_item = %s AND item_type = %s AND category = %s AND source = 'NBS'
+                        GROUP BY EXTRACT(YEAR FROM CAST(date AS DATE))
+                        ORDER BY year;
+
+                        """,
+                        (food_item, item_type, category),
+                    )
 
-                if not records:
-                    return abort(404, "No records found. Confirm query parameters.")
+                    records = cur.fetchall()
+                years, average_prices = zip(*records) if records else ((), ())
 
-                data = [
-                    {"year": int(year), "average_price": float(f"{average_price:.2f}")}
-                    for year, average_price in records
-                ]
+            if not len(years):
+                return abort(404, "No records found. Confirm query parameters.")
 
         except psycopg2.Error as e:
             return abort(500, f"Database error: {str(e)}")
@@ -235,7 +319,9 @@ class AveragePriceOverYears(Resource):
         # except Exception as e:
         #     return abort(500, f"An unexpected error occurred: {str(e)}")
 
-        return jsonify({"data": data})
+        return render_series(
+            [int(year) for year in years], average_prices, "average_price", "year"
+        )
 
 
 # http://127.0.0.1:5000/nbs/mom-percentage/?food_item=oil&item_type=vegetable&category=1000%20ml
@@ -260,50 +346,61 @@ class MonthOnMonthPercentage(Resource):
             if not all([food_item, item_type, category]):
                 return abort(400, "Missing required parameters")
 
-            check = validate_nbs_food_item(food_item, nbs_dashboard_file)
+            check = validate_nbs_food_item(food_item, get_catalog(NBS))
             if check is not None:
                 return check
 
-            with get_db_connection().cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT
-                        EXTRACT(MONTH FROM CURRENT_DATE) AS month,
-                        price AS current_month_price,
-                        LAG(price) OVER (ORDER BY EXTRACT(MONTH FROM CURRENT_DATE)) AS previous_month_price
-                    FROM "Cleaned-Food-Prices"
-                    WHERE food_item = %s
-                        AND item_type = %s
-                        AND category = %s
-                        AND source = 'NBS'
-                    ORDER BY date DESC
-                    LIMIT 2;
-                    """,
-                    (food_item, item_type, category),
-                )
+            store = get_store()
+            if store is not None:
+                latest = store.last_two((NBS, food_item, item_type, category), "day")
+                records = None
+                if latest:
+                    previous_price = latest[1][1] if len(latest) > 1 else None
+                    # As a string, the way the numeric EXTRACT of the SQL path is
+                    # rendered.
+                    month = str(datetime.date.today().month)
+                    records = (month, latest[0][1], previous_price)
+            else:
+                with pooled_cursor() as cur:
+                    cur.execute(
+                        """
+                        SELECT
+                            EXTRACT(MONTH FROM CURRENT_DATE) AS month,
+                            price AS current_month_price,
+                            LAG(price) OVER (ORDER BY EXTRACT(MONTH FROM CURRENT_DATE)) AS previous_month_price
+                        FROM "Cleaned-Food-Prices"
+                        WHERE food_item = %s
+                            AND item_type = %s
+                            AND category = %s
+                            AND source = 'NBS'
+                        ORDER BY date DESC
+                        LIMIT 2;
+                        """,
+                        (food_item, item_type, category),
+                    )
 
-                records = cur.fetchone()
-
-                if not records:
-                    return abort(404, "No records found. Confirm query parameters.")
-
-                if records:
-                    month, current_month_price, previous_month_price = records
-                    percentage_change = (
-                        (
-                            (current_month_price - previous_month_price)
-                            * 100
-                            / previous_month_price
-                        )
-                        if previous_month_price
-                        else 0
+                    records = cur.fetchone()
+
+            if not records:
+                return abort(404, "No records found. Confirm query parameters.")
+
+            if records:
+                month, current_month_price, previous_month_price = records
+                percentage_change = (
+                    (
+                        (current_month_price - previous_month_price)
+                        * 100
+                        / previous_month_price
                     )
-                    data = {
-                        "month": month,
-                        "current_month_price": float(f"{current_month_price:.2f}"),
-                        "previous_month_price": float(f"{previous_month_price:.2f}"),
-                        "percentage_change": float(f"{percentage_change:.2f}"),
-                    }
+                    if previous_month_price
+                    else 0
+                )
+                data = {
+                    "month": month,
+                    "current_month_price": float(f"{current_month_price:.2f}"),
+                    "previous_month_price": float(f"{previous_month_price:.2f}"),
+                    "percentage_change": float(f"{percentage_change:.2f}"),
+                }
 
         except psycopg2.Error as e:
             return abort(500, f"Database error: {str(e)}")
@@ -336,46 +433,55 @@ class YearOnYearPercentage(Resource):
             if not all([food_item, item_type, category]):
                 return abort(400, "Missing required parameters")
 
-            check = validate_nbs_food_item(food_item, nbs_dashboard_file)
+            check = validate_nbs_food_item(food_item, get_catalog(NBS))
             if check is not None:
                 return check
 
-            with get_db_connection().cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT EXTRACT(YEAR FROM CAST(date AS DATE)) AS year,
-                        AVG(price) AS average_price
-                    FROM "Cleaned-Food-Prices"
-                    WHERE food_item = %s AND item_type = %s AND category = %s AND source = 'NBS'
-                    GROUP BY EXTRACT(YEAR FROM CAST(date AS DATE))
-                    ORDER BY year DESC
-                    LIMIT 2;
-                    """,
-                    (food_item, item_type, category),
-                )
+            store = get_store()
+            if store is not None:
+                records = [
+                    (str(period.year), average_price)
+                    for period, average_price in store.last_two(
+                        (NBS, food_item, item_type, category), "year"
+                    )
+                ]
+            else:
+                with pooled_cursor() as cur:
+                    cur.execute(
+                        """
+                        SELECT EXTRACT(YEAR FROM CAST(date AS DATE)) AS year,
+                            AVG(price) AS average_price
+                        FROM "Cleaned-Food-Prices"
+                        WHERE food_item = %s AND item_type = %s AND category = %s AND source = 'NBS'
+                        GROUP BY EXTRACT(YEAR FROM CAST(date AS DATE))
+                        ORDER BY year DESC
+                        LIMIT 2;
+                        """,
+                        (food_item, item_type, category),
+                    )
 
-                records = cur.fetchall()
-
-                if not records:
-                    return abort(404, "No records found. Confirm query parameters.")
-
-                if records:
-                    (year, current_year_price), (_, previous_year_price) = records
-                    percentage_change = (
-                        (
-                            (current_year_price - previous_year_price)
-                            * 100
-                            / previous_year_price
-                        )
-                        if previous_year_price
-                        else 0
+                    records = cur.fetchall()
+
+            if not records:
+                return abort(404, "No records found. Confirm query parameters.")
+
+            if records:
+                (year, current_year_price), (_, previous_year_price) = records
+                percentage_change = (
+                    (
+                        (current_year_price - previous_year_price)
+                        * 100
+                        / previous_year_price
                     )
-                    data = {
-                        "year": year,
-                        "current_year_price": float(f"{current_year_price:.2f}"),
-                        "previous_year_price": float(f"{previous_year_price:.2f}"),
-                        "percentage_change": float(f"{percentage_change:.2f}"),
-                    }
+                    if previous_year_price
+                    else 0
+                )
+                data = {
+                    "year": year,
+                    "current_year_price": float(f"{current_year_price:.2f}"),
+                    "previous_year_price": float(f"{previous_year_price:.2f}"),
+                    "percentage_change": float(f"{percentage_change:.2f}"),
+                }
 
         except psycopg2.Error as e:
             return abort(500, f"Database error: {str(e)}")
@@ -1,24 +1,28 @@
 import os
 import json
 import psycopg2
-import pandas as pd
 
 from flask import jsonify, request, abort
 from flask_restx import Resource, Namespace
 
+from src.catalog import SOURCES
+from src.correlation import CORRELATION_QUERY, LAGS, TOPICS
+from src.db import pooled_connection, pooled_cursor
+from src.engine import current_resolution
 from src.summary_levels import summarize
 
 from datetime import datetime, timedelta
 
 
-def get_db_connection():
-    conn = psycopg2.connect(
-        host=os.getenv("HOST"),
-        database=os.getenv("DATABASE"),
-        user=os.getenv("USER_NAME"),
-        password=os.getenv("PASSWORD"),
-    )
-    return conn
+def read_sql(query, conn, params=None):
+    """
+    Reads a query into a DataFrame. pandas is imported on first use as only the
+    news endpoints need it.
+    """
+    import pandas as pd
+
+    return pd.read_sql_query(query, conn, params=params)
+
 
 api = Namespace("News", description="News summmary as related to real-world influence on food prices")
 
@@ -31,13 +35,13 @@ class DayLevelSummary(Resource):
 
     def get(self):
         try:
-            with get_db_connection() as conn:
+            with pooled_connection() as conn:
                 # Get yesterday's date in YYYY-MM-DD format
                 yesterday = datetime.today() - timedelta(days=1)
 
                 # Format the date as YYYY-MM-DD
                 yesterday_str = yesterday.strftime('%Y-%m-%d')
-                sub = pd.read_sql_query(f"""SELECT date, article_summary FROM articles_summaries WHERE DATE(date) = '{yesterday_str}';""", conn)
+                sub = read_sql("""SELECT date, article_summary FROM articles_summaries WHERE DATE(date) = %s;""", conn, params=(yesterday_str,))
                 
                 sub['date'] = sub['date'].apply(lambda x:f"Date News was published: {str(x)}\n\nNews Summary:\n")
                 sub['dated_summary'] = sub['date'] + sub['article_summary']
@@ -46,8 +50,8 @@ class DayLevelSummary(Resource):
                     "summary": summarize("\n".join(summaries))
                         }
             return jsonify({"summary": result["summary"]})
-        except:
-            return abort(400, "Error processing request")
+        except Exception:
+            return abort(503, "Error processing request")
 
 @api.route("/week-level-summary/")
 @api.doc(
@@ -58,7 +62,7 @@ class WeekLevelSummary(Resource):
 
     def get(self):
         try:
-            with get_db_connection() as conn:
+            with pooled_connection() as conn:
                 # Get last week's range date in YYYY-MM-DD format
                 yesterday = datetime.today() - timedelta(days=1)
                 # Format the date as YYYY-MM-DD
@@ -66,7 +70,7 @@ class WeekLevelSummary(Resource):
 
                 last_week = datetime.today() - timedelta(days=8)
                 last_week_str = last_week.strftime('%Y-%m-%d')
-                sub = pd.read_sql_query(f"""SELECT date, article_summary FROM articles_summaries WHERE DATE(date) BETWEEN '{yesterday_str}' AND '{last_week_str}';""", conn)
+                sub = read_sql("""SELECT date, article_summary FROM articles_summaries WHERE DATE(date) BETWEEN %s AND %s;""", conn, params=(yesterday_str, last_week_str))
                 sub['date'] = sub['date'].apply(lambda x:f"Date News was published: {str(x)}\n\nNews Summary:\n")
                 sub['dated_summary'] = sub['date'] + sub['article_summary']
                 summaries = sub['dated_summary'].tolist()
@@ -74,8 +78,8 @@ class WeekLevelSummary(Resource):
                     "summary": summarize("\n".join(summaries))
                         }
             return jsonify({"summary": result["summary"]})
-        except:
-            return abort(400, "Error processing request")
+        except Exception:
+            return abort(503, "Error processing request")
         
 
 @api.route("/month-level-summary/")
@@ -87,7 +91,7 @@ class MonthLevelSummary(Resource):
 
     def get(self):
         try:
-            with get_db_connection() as conn:
+            with pooled_connection() as conn:
                 # Get last week's range date in YYYY-MM-DD format
                 yesterday = datetime.today() - timedelta(days=1)
                 # Format the date as YYYY-MM-DD
@@ -95,7 +99,7 @@ class MonthLevelSummary(Resource):
 
                 last_month = datetime.today() - timedelta(days=31)
                 last_month_str = last_month.strftime('%Y-%m-%d')
-                sub = pd.read_sql_query(f"""SELECT date, article_summary FROM articles_summaries WHERE DATE(date) BETWEEN '{yesterday_str}' AND '{last_month_str}';""", conn)
+                sub = read_sql("""SELECT date, article_summary FROM articles_summaries WHERE DATE(date) BETWEEN %s AND %s;""", conn, params=(yesterday_str, last_month_str))
                 
                 sub['date'] = sub['date'].apply(lambda x:f"Date News was published: {str(x)}\n\nNews Summary:\n")
                 sub['dated_summary'] = sub['date'] + sub['article_summary']
@@ -104,5 +108,90 @@ class MonthLevelSummary(Resource):
                     "summary": summarize("\n".join(summaries))
                         }
             return jsonify({"summary": result["summary"]})
-        except:
-            return abort(400, "Error processing request")
\ No newline at end of file
+        except Exception:
+            return abort(503, "Error processing request")
+
+
+# http://127.0.0.1:5000/news/price-correlation/?source=supermarkets&topic=fuel&food_item=tomato
+@api.route("/price-correlation/")
+@api.doc(
+    description="Returns the strongest correlations between the number of news "
+    "articles on a topic and the price moves of each series that many days "
+    "(NBS: months) later, strongest first. Updated daily by python -m "
+    "src.correlation.",
+    params={
+        "source": "nbs or supermarkets. Default is supermarkets.",
+        "topic": f"One of {', '.join(TOPICS)}. Default is every topic.",
+        "food_item": "Only this food item e.g. tomato. Default is every item.",
+        "lag": "Only this lag, in days for supermarkets and months for NBS.",
+        "min_observations": "Ignore correlations over fewer periods. Default is 30.",
+        "limit": "The maximum number of correlations. Default is 50.",
+    },
+)
+class NewsPriceCorrelation(Resource):
+    """Returns the strongest lagged correlations between news topics and prices."""
+
+    def get(self):
+        try:
+            source = request.args.get("source", "supermarkets").lower().strip()
+            topic = request.args.get("topic", "").lower().strip() or None
+            food_item = request.args.get("food_item", "").lower().strip() or None
+            lag = request.args.get("lag", "").strip()
+            min_observations = request.args.get("min_observations", "30").strip()
+            limit = request.args.get("limit", "50").strip()
+
+            if source not in SOURCES:
+                return abort(400, f"Invalid source. Choose from: {', '.join(SOURCES)}")
+            if topic is not None and topic not in TOPICS:
+                return abort(400, f"Invalid topic. Choose from: {', '.join(TOPICS)}")
+
+            lags = LAGS[current_resolution(SOURCES[source])]
+            if lag and (not lag.isdigit() or int(lag) not in lags):
+                return abort(
+                    400, f"Invalid lag. Use a number between 0 and {lags[-1]}."
+                )
+            if not min_observations.isdigit():
+                return abort(400, "Invalid min_observations. Use a whole number.")
+            if not limit.isdigit() or not 0 < int(limit) <= 500:
+                return abort(400, "Invalid limit. Use a number between 1 and 500.")
+
+            with pooled_cursor() as cur:
+                cur.execute(
+                    CORRELATION_QUERY,
+                    {
+                        "source": SOURCES[source],
+                        "topic": topic,
+                        "food_item": food_item,
+                        "lag": int(lag) if lag else None,
+                        "min_observations": int(min_observations),
+                        "limit": int(limit),
+                    },
+                )
+                records = cur.fetchall()
+
+        except psycopg2.Error as e:
+            return abort(500, f"Database error: {str(e)}")
+
+        data = [
+            {
+                "food_item": food_item,
+                "item_type": item_type,
+                "category": category,
+                "topic": topic,
+                "lag": lag,
+                "correlation": round(float(correlation), 4),
+                "observations": int(observations),
+                "through": through.isoformat(),
+            }
+            for (
+                food_item,
+                item_type,
+                category,
+                topic,
+                lag,
+                correlation,
+                observations,
+                through,
+            ) in records
+        ]
+        return jsonify({"data": data})
@@ -0,0 +1,139 @@
+"""
+Checks that two running instances, e.g. one in the threaded and one in the
+gevent serving mode (see src/green.py), answer the same requests identically:
+
+    python -m src.parity http://127.0.0.1:8001 http://127.0.0.1:8002
+    python -m src.parity http://127.0.0.1:8001 http://127.0.0.1:8002 \\
+        --log access.log --concurrency 32
+
+Every request, either from --log or the load test mix (see src/loadtest.py),
+is sent to both instances, with --concurrency pairs in flight so each mode
+interleaves requests the way it would under load. Statuses, content types and
+bodies are compared, and the differences printed. Exits with 1 if any differ.
+Run both instances against the same database and with the same settings.
+"""
+
+import sys
+import json
+import difflib
+import argparse
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from src.loadtest import build_requests
+from src.replay import read_log
+
+
+def fetch(base_url, entry, timeout):
+    """Issues one request. Returns its (status, content type, body)."""
+    url = base_url.rstrip("/") + entry["p"]
+    if entry.get("q"):
+        url += "?" + urlencode(entry["q"], doseq=True)
+    headers = {"Accept-Encoding": "identity"}
+    if entry.get("a"):
+        headers["Accept"] = entry["a"]
+
+    try:
+        with urlopen(Request(url, headers=headers), timeout=timeout) as response:
+            return (
+                response.status,
+                response.headers.get("Content-Type"),
+                response.read(),
+            )
+    except HTTPError as error:
+        return error.code, error.headers.get("Content-Type"), error.read()
+    except (URLError, OSError) as error:
+        return 0, None, str(error).encode("utf-8")
+
+
+def readable(body):
+    """The body as lines, with JSON indented so a diff points at the field."""
+    try:
+        text = json.dumps(json.loads(body), indent=1, sort_keys=True)
+    except ValueError:
+        text = body.decode("utf-8", "replace")
+    return text.splitlines()
+
+
+def compare(expected, actual):
+    """Returns the differences between two responses as lines, if any."""
+    if expected == actual:
+        return []
+    status, content_type, body = expected
+    other_status, other_type, other_body = actual
+    lines = []
+    if status != other_status:
+        lines.append(f"status: {status} != {other_status}")
+    if content_type != other_type:
+        lines.append(f"content type: {content_type} != {other_type}")
+    if readable(body) != readable(other_body):
+        lines += list(
+            difflib.unified_diff(
+                readable(body),
+                readable(other_body),
+                "first",
+                "second",
+                lineterm="",
+                n=1,
+            )
+        )[:40]
+    return lines
+
+
+def check(entries, first_url, second_url, concurrency, timeout):
+    """Sends every entry to both instances and returns the (entry, differences) found."""
+
+    def run(entry):
+        expected = fetch(first_url, entry, timeout)
+        actual = fetch(second_url, entry, timeout)
+        return entry, compare(expected, actual)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return [
+            (entry, differences)
+            for entry, differences in executor.map(run, entries)
+            if differences
+        ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two running instances.")
+    parser.add_argument("first_url", help="e.g. the threaded instance")
+    parser.add_argument("second_url", help="e.g. the gevent instance")
+    parser.add_argument("--log", help="Send the requests of this access log instead")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    if args.log:
+        entries = read_log(args.log, args.requests)
+    else:
+        entries = build_requests(args.first_url, args.requests, args.seed, args.timeout)
+
+    # Each distinct request is checked once.
+    unique = {}
+    for entry in entries:
+        key = (
+            entry["p"],
+            json.dumps(entry.get("q") or {}, sort_keys=True),
+            entry.get("a"),
+        )
+        unique.setdefault(key, entry)
+    entries = list(unique.values())
+
+    mismatches = check(
+        entries, args.first_url, args.second_url, args.concurrency, args.timeout
+    )
+    for entry, differences in mismatches:
+        query = f"?{urlencode(entry['q'], doseq=True)}" if entry.get("q") else ""
+        print(f"{entry['p']}{query}")
+        for line in differences:
+            print("   ", line)
+
+    print(f"{len(entries) - len(mismatches)} of {len(entries)} requests identical")
+    sys.exit(1 if mismatches else 0)
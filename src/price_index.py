@@ -0,0 +1,290 @@
+"""
+Basket-weighted food price index.
+
+The basket (`BASKET_FILE`, by default dashboard_items/basket.json) gives a
+weight to every (food_item, item_type, category) of each source:
+
+    {"nbs": {"rice": {"local": {"1000 g": 2.0}}}, "supermarkets": {...}}
+
+Weights are relative and normalized per source. The index is a fixed-weight
+(Laspeyres-style) average of price relatives against the first period in which
+every basket item has a price, monthly for NBS and daily for supermarkets:
+
+    index[t] = 100 * sum(weight[i] * price[t, i] / price[base, i])
+
+Prices are forward-filled over periods without data. The index is materialized
+from the in-memory store and only the periods from the first changed day
+onwards are recomputed when new data arrives.
+"""
+import os
+import json
+import threading
+
+import numpy as np
+
+from flask import request, abort
+from flask_restx import Resource, Namespace
+
+from src.catalog import SOURCES
+from src.engine import get_store, current_resolution, first_difference
+from src.serializers import render, render_series
+from src.timeseries import align, bucket_start, calendar
+from src.utils import parse_date_range
+
+
+api = Namespace("Price index", description="Basket-weighted food price index")
+
+BASKET_FILE = os.getenv("BASKET_FILE", "dashboard_items/basket.json")
+
+
+def load_basket(path=BASKET_FILE):
+    """
+    Reads the basket file into {source: {(food_item, item_type, category): weight}}
+    with the weights of each source summing to 1.
+    """
+    with open(path, "r") as file:
+        basket = json.load(file)
+
+    weights = {}
+    for name, source in SOURCES.items():
+        items = {
+            (food_item, item_type, category): float(weight)
+            for food_item, item_types in basket.get(name, {}).items()
+            for item_type, categories in item_types.items()
+            for category, weight in categories.items()
+            if weight > 0
+        }
+        total = sum(items.values()) or 1.0
+        weights[source] = {key: weight / total for key, weight in items.items()}
+    return weights
+
+
+class IndexState:
+    """
+    The basket keys, periods and price matrix of an index at one point in time.
+    Never modified once built, so readers can use it without the index lock.
+    """
+
+    def __init__(self, keys, periods, prices, weights):
+        self.keys = keys
+        self.periods = periods
+        self.prices = prices
+        self.weight_vector = np.array([weights[key[1:]] for key in keys])
+
+    @property
+    def relatives(self):
+        """Each item's price relative to the base (first) period."""
+        return self.prices / self.prices[0]
+
+    def index(self):
+        """The index level of every period, 100 in the base period."""
+        weights = self.weight_vector
+        return 100 * (self.relatives @ weights) / weights.sum()
+
+    def contributions(self, period=None):
+        """
+        How much each item adds to the index level in `period` (the latest by
+        default) and to its change since the previous period, in index points.
+        """
+        position = len(self.periods) - 1
+        if period is not None:
+            position = int(np.searchsorted(self.periods, period, side="right")) - 1
+        if position < 0:
+            return None
+
+        weights = self.weight_vector / self.weight_vector.sum()
+        relatives = self.relatives
+        level = 100 * weights * relatives[position]
+        previous = 100 * weights * relatives[max(position - 1, 0)]
+        return self.periods[position], [
+            {
+                "food_item": key[1],
+                "item_type": key[2],
+                "category": key[3],
+                "weight": round(float(weight), 4),
+                "contribution": round(float(points), 2),
+                "change_contribution": round(float(points - before), 2),
+            }
+            for key, weight, points, before in zip(self.keys, weights, level, previous)
+        ]
+
+
+class PriceIndex:
+    """The materialized index of one source and its per-item price relatives."""
+
+    def __init__(self, source, weights):
+        self.source = source
+        self.resolution = current_resolution(source)
+        self.weights = weights
+        self.series = {}
+        # Replaced as a whole on every change, see IndexState.
+        self.state = IndexState(
+            [], np.array([], dtype="datetime64[D]"), np.empty((0, 0)), weights
+        )
+        self.watermark = None
+        self.lock = threading.Lock()
+
+    def item_prices(self, series):
+        """The (periods, average prices) of a basket series at the index resolution."""
+        if self.resolution == "day":
+            return series.dates, series.prices
+        return series.period_means(self.resolution)
+
+    def update(self, store):
+        """
+        Brings the index up to date with the store, recomputing only the periods
+        from the first day any basket series changed. Returns True if it changed.
+        """
+        if store.watermark == self.watermark and self.series:
+            return False
+
+        current = {
+            (self.source, *key): store.series.get((self.source, *key))
+            for key in self.weights
+        }
+        current = {key: series for key, series in current.items() if series is not None}
+        if not current:
+            self.watermark = store.watermark
+            return False
+
+        changed_from = None
+        if list(current) != self.state.keys:
+            changed_from = np.datetime64("NaT")
+        else:
+            for key, series in current.items():
+                if series is self.series[key]:
+                    continue
+                day = first_difference(self.series[key], series)
+                if day is not None and (changed_from is None or day < changed_from):
+                    changed_from = day
+
+        if changed_from is not None:
+            self.state = self.rebuild(current, changed_from)
+        self.series = current
+        self.watermark = store.watermark
+        return changed_from is not None
+
+    def rebuild(self, current, changed_from):
+        """
+        Returns a new state with the price matrix recomputed from the period
+        containing `changed_from`.
+        """
+        prices = [self.item_prices(series) for series in current.values()]
+        base = max(periods[0] for periods, _ in prices)
+        end = max(periods[-1] for periods, _ in prices)
+        periods = calendar(base, end, self.resolution)
+
+        state = self.state
+        keep = 0
+        if not np.isnat(changed_from) and len(state.periods) and state.periods[0] == base:
+            start = bucket_start(np.array([changed_from]), self.resolution)[0]
+            keep = int(np.searchsorted(state.periods, start))
+
+        tail = np.column_stack([align(periods[keep:], *item) for item in prices])
+        matrix = np.vstack([state.prices[:keep], tail]) if keep else tail
+        return IndexState(list(current), periods, matrix, self.weights)
+
+
+_basket = None
+_indices = {}
+
+
+def get_index(source):
+    """
+    Returns the up-to-date state of the price index of `source`, or None when
+    the in-memory store isn't available.
+    """
+    global _basket
+    store = get_store()
+    if store is None:
+        return None
+
+    if _basket is None:
+        _basket = load_basket()
+    price_index = _indices.setdefault(source, PriceIndex(source, _basket[source]))
+    with price_index.lock:
+        price_index.update(store)
+        state = price_index.state
+    return state if len(state.periods) else None
+
+
+def parse_index_source():
+    source = request.args.get("source", "").lower().strip()
+    if source not in SOURCES:
+        return abort(400, f"Invalid source. Choose from: {', '.join(SOURCES)}")
+
+    price_index = get_index(SOURCES[source])
+    if price_index is None:
+        return abort(503, "The price index is not available yet. Try again later.")
+    return price_index
+
+
+# http://127.0.0.1:5000/price-index/?source=nbs&from=2020-01-01
+@api.route("/")
+@api.doc(
+    description="Returns the basket-weighted price index, monthly for NBS and "
+    "daily for supermarkets. The base period is 100.",
+    params={
+        "source": "nbs or supermarkets",
+        "from": "First day, YYYY-MM-DD. Default is the base period.",
+        "to": "Last day, YYYY-MM-DD. Default is the latest period.",
+        "format": "rows (default) or columnar.",
+    },
+)
+class PriceIndexSeries(Resource):
+    """Returns the basket-weighted price index."""
+
+    def get(self):
+        price_index = parse_index_source()
+        start, end = parse_date_range()
+
+        periods, values = price_index.periods, price_index.index()
+        mask = np.ones(len(periods), dtype=bool)
+        if start:
+            mask &= periods >= np.datetime64(start, "D")
+        if end:
+            mask &= periods <= np.datetime64(end, "D")
+        if not mask.any():
+            return abort(404, "No records found. Confirm query parameters.")
+
+        return render_series(
+            np.datetime_as_string(periods[mask]).tolist(), values[mask], "index",
+            "period",
+        )
+
+
+# http://127.0.0.1:5000/price-index/contributions/?source=supermarkets
+@api.route("/contributions/")
+@api.doc(
+    description="Returns each basket item's weight and contribution to the index "
+    "level and to its change since the previous period.",
+    params={
+        "source": "nbs or supermarkets",
+        "period": "Day within the period, YYYY-MM-DD. Default is the latest period.",
+    },
+)
+class PriceIndexContributions(Resource):
+    """Returns each basket item's contribution to the price index."""
+
+    def get(self):
+        price_index = parse_index_source()
+        period = request.args.get("period", "").strip()
+
+        try:
+            period = np.datetime64(period, "D") if period else None
+        except ValueError:
+            return abort(400, "Invalid period. Use the YYYY-MM-DD format.")
+
+        result = price_index.contributions(period)
+        if result is None:
+            return abort(404, "No records found. Confirm query parameters.")
+
+        period, items = result
+        index = price_index.index()[int(np.searchsorted(price_index.periods, period))]
+        return render(
+            {
+                "period": str(period),
+                "index": round(float(index), 2),
+                "data": sorted(items, key=lambda item: -item["contribution"]),
+            }
+        )
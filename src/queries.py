@@ -0,0 +1,351 @@
+import os
+import re
+
+
+class Statement:
+    """A named, parameterized SQL statement that can be prepared server-side."""
+
+    __slots__ = ("name", "sql", "params", "prepare_sql", "execute_sql")
+
+    def __init__(self, name, sql, params):
+        self.name = name
+        self.sql = sql.strip().rstrip(";")
+        self.params = params
+
+        positions = {param: index + 1 for index, param in enumerate(params)}
+        body = re.sub(
+            r"%\((\w+)\)s", lambda match: f"${positions[match.group(1)]}", self.sql
+        )
+        self.prepare_sql = f"PREPARE {name} ({', '.join(params.values())}) AS {body}"
+        self.execute_sql = (
+            f"EXECUTE {name} ({', '.join(f'%({param})s' for param in params)})"
+        )
+
+
+QUERIES = {}
+
+# Prepared statements don't survive transaction-pooling proxies such as
+# PgBouncer, so they can be switched off and the plain statements used instead.
+USE_PREPARED_STATEMENTS = os.getenv("PREPARED_STATEMENTS", "true").lower() == "true"
+
+
+def register(name, sql, **params):
+    """
+    Registers a statement under `name`. `sql` uses `%(param)s` placeholders and
+    `params` maps every placeholder to its Postgres type, in order.
+    """
+    QUERIES[name] = Statement(name, sql, params)
+    return QUERIES[name]
+
+
+def execute(cur, name, values):
+    """
+    Executes a registered statement, preparing it the first time it is used on
+    the cursor's connection so planning is only paid once per connection.
+    """
+    statement = QUERIES[name]
+    prepared = getattr(cur.connection, "prepared", None)
+
+    if prepared is None or not USE_PREPARED_STATEMENTS:
+        cur.execute(statement.sql, values)
+        return
+
+    if name not in prepared:
+        cur.execute(statement.prepare_sql)
+        prepared.add(name)
+    cur.execute(statement.execute_sql, values)
+
+
+def gap_filled_daily_sql(extra_filter=""):
+    """
+    Builds a query returning the daily supermarket average price of one series,
+    with days that have no prices filled forward from the last known day.
+    """
+    series_filter = """food_item = %(food_item)s AND item_type = %(item_type)s
+                        AND category = %(category)s AND vendor_type = 'Supermarket'"""
+
+    return f"""
+        WITH RECURSIVE date_series AS (
+            SELECT
+                generate_series(
+                    (SELECT MIN(date_trunc('day', CAST(date AS DATE)))
+                    FROM "Cleaned-Food-Prices"
+                    WHERE {series_filter}),
+                    (SELECT MAX(date_trunc('day', CAST(date AS DATE)))
+                    FROM "Cleaned-Food-Prices"
+                    WHERE {series_filter}),
+                    '1 day'::interval
+                )::date AS date
+        ),
+        cleaned_data AS (
+            SELECT
+                CAST(date AS date) as date,
+                AVG(price) AS avg_price
+            FROM "Cleaned-Food-Prices"
+            WHERE {series_filter}
+                {extra_filter}
+            GROUP BY CAST(date AS date)
+        ),
+        joined_data AS (
+            SELECT
+                ds.date,
+                cd.avg_price
+            FROM date_series ds
+            LEFT JOIN cleaned_data cd ON ds.date = cd.date
+        ),
+        recursive_filled_data AS (
+            SELECT
+                date,
+                avg_price,
+                avg_price AS filled_avg_price
+            FROM joined_data
+            WHERE avg_price IS NOT NULL
+
+            UNION ALL
+
+            SELECT
+                jd.date,
+                jd.avg_price,
+                rfd.filled_avg_price
+            FROM joined_data jd
+            JOIN recursive_filled_data rfd ON jd.date = rfd.date + INTERVAL '1 day'
+            WHERE jd.avg_price IS NULL
+        )
+        SELECT
+            date,
+            filled_avg_price AS avg_price
+        FROM recursive_filled_data
+        ORDER BY date
+    """
+
+
+def period_stats_sql(source_filter):
+    """
+    Builds a query returning the mean, min, max and row count of one series per
+    `granularity` period within a date range. Like the in-memory engine, min and
+    max are taken over daily average prices.
+    """
+    return f"""
+        WITH daily AS (
+            SELECT
+                CAST(date AS DATE) AS day,
+                CAST(SUM(price) AS NUMERIC) AS total,
+                COUNT(price) AS rows
+            FROM "Cleaned-Food-Prices"
+            WHERE food_item = %(food_item)s AND item_type = %(item_type)s
+                AND category = %(category)s AND {source_filter}
+                AND CAST(date AS DATE) BETWEEN %(start)s AND %(end)s
+                AND price IS NOT NULL
+            GROUP BY 1
+        )
+        SELECT
+            CAST(DATE_TRUNC(%(granularity)s, day) AS DATE) AS period,
+            SUM(total) / SUM(rows) AS mean,
+            MIN(total / rows) AS min,
+            MAX(total / rows) AS max,
+            SUM(rows) AS count
+        FROM daily
+        GROUP BY 1
+        ORDER BY 1
+    """
+
+
+def overview_sql(source_filter):
+    """
+    Builds a query returning the average price per standard unit of every
+    (food_item, item_type, unit) of the given series in the latest and previous
+    month of its food item, in one pass over the table.
+    """
+    return f"""
+        WITH series AS (
+            SELECT *
+            FROM unnest(
+                %(food_items)s::text[], %(item_types)s::text[], %(categories)s::text[]
+            ) AS series(food_item, item_type, category)
+        ),
+        monthly AS (
+            SELECT
+                prices.food_item,
+                prices.item_type,
+                COALESCE(units.standard_unit, prices.unit) AS unit,
+                DATE_TRUNC('month', CAST(prices.date AS TIMESTAMP)) AS month,
+                AVG(prices.unit_price * COALESCE(units.factor, 1)) AS average_price
+            FROM "Cleaned-Food-Prices" prices
+            JOIN series
+                ON prices.food_item = series.food_item
+                AND prices.item_type = series.item_type
+                AND prices.category = series.category
+            LEFT JOIN unit_normalization units ON units.unit = prices.unit
+            WHERE {source_filter} AND LENGTH(prices.category) > 0
+            GROUP BY 1, 2, 3, 4
+        ),
+        ranked AS (
+            SELECT
+                *,
+                DENSE_RANK() OVER (
+                    PARTITION BY food_item ORDER BY month DESC
+                ) AS recency
+            FROM monthly
+        )
+        SELECT
+            food_item,
+            item_type,
+            unit,
+            MAX(average_price) FILTER (WHERE recency = 1) AS price,
+            MAX(average_price) FILTER (WHERE recency = 2) AS previous_price
+        FROM ranked
+        WHERE recency <= 2
+        GROUP BY food_item, item_type, unit
+        HAVING MAX(average_price) FILTER (WHERE recency = 1) IS NOT NULL
+        ORDER BY food_item, item_type
+    """
+
+
+register(
+    "supermarkets_all_time",
+    gap_filled_daily_sql(),
+    food_item="text",
+    item_type="text",
+    category="text",
+)
+
+register(
+    "supermarkets_current_year",
+    gap_filled_daily_sql(
+        """AND EXTRACT(YEAR FROM CAST(date AS DATE)) = EXTRACT(YEAR FROM CURRENT_DATE)
+                AND (NOT %(current_month)s
+                    OR EXTRACT(MONTH FROM CAST(date AS DATE)) = EXTRACT(MONTH FROM CURRENT_DATE))
+                AND (NOT %(current_week)s
+                    OR EXTRACT(WEEK FROM CAST(date AS DATE)) = EXTRACT(WEEK FROM CURRENT_DATE))"""
+    ),
+    food_item="text",
+    item_type="text",
+    category="text",
+    current_month="boolean",
+    current_week="boolean",
+)
+
+register(
+    "nbs_average_item_types_price",
+    """
+    WITH latest AS (
+        SELECT *, DATE_TRUNC('month', MAX(CAST(date AS TIMESTAMP)) OVER()) AS max_date
+        FROM "Cleaned-Food-Prices"
+        WHERE category IS NOT NULL AND LENGTH(category) > 0
+        AND food_item = %(food_item)s AND source = 'NBS'
+    )
+    SELECT
+        latest.item_type,
+        AVG(latest.unit_price * COALESCE(units.factor, 1)) AS average_price,
+        COALESCE(units.standard_unit, latest.unit) AS unit
+    FROM latest
+    LEFT JOIN unit_normalization units ON units.unit = latest.unit
+    WHERE DATE_TRUNC('month', CAST(latest.date AS TIMESTAMP)) = latest.max_date
+        AND latest.item_type = ANY(%(item_types)s)
+    GROUP BY latest.item_type, COALESCE(units.standard_unit, latest.unit)
+    ORDER BY
+        latest.item_type COLLATE "C",
+        COALESCE(units.standard_unit, latest.unit) COLLATE "C" NULLS FIRST
+    """,
+    food_item="text",
+    item_types="text[]",
+)
+
+register(
+    "supermarkets_average_item_types_price",
+    """
+    WITH LatestDate AS (
+        SELECT MAX(CAST(date AS TIMESTAMP)) AS max_date
+        FROM "Cleaned-Food-Prices"
+        WHERE category IS NOT NULL AND LENGTH(category) > 0
+        AND food_item = %(food_item)s AND vendor_type = 'Supermarket'
+    ),
+    DashboardItems AS (
+        SELECT item_type, category
+        FROM unnest(%(item_types)s::text[], %(categories)s::text[]) AS items(item_type, category)
+    )
+    SELECT
+        prices.item_type,
+        AVG(prices.unit_price * COALESCE(units.factor, 1)) AS average_price,
+        COALESCE(units.standard_unit, prices.unit) AS unit
+    FROM "Cleaned-Food-Prices" prices
+    JOIN DashboardItems items
+        ON prices.item_type = items.item_type AND prices.category = items.category
+    LEFT JOIN unit_normalization units ON units.unit = prices.unit
+    WHERE CAST(prices.date AS TIMESTAMP) = (SELECT max_date FROM LatestDate)
+        AND prices.food_item = %(food_item)s AND prices.vendor_type = 'Supermarket'
+    GROUP BY prices.item_type, COALESCE(units.standard_unit, prices.unit)
+    ORDER BY
+        prices.item_type COLLATE "C",
+        COALESCE(units.standard_unit, prices.unit) COLLATE "C" NULLS FIRST
+    """,
+    food_item="text",
+    item_types="text[]",
+    categories="text[]",
+)
+
+for name, source_filter in (
+    ("nbs_overview", "prices.source = 'NBS'"),
+    ("supermarkets_overview", "prices.vendor_type = 'Supermarket'"),
+):
+    register(
+        name,
+        overview_sql(source_filter),
+        food_items="text[]",
+        item_types="text[]",
+        categories="text[]",
+    )
+
+for name, source_filter in (
+    ("nbs_period_stats", "source = 'NBS'"),
+    ("supermarkets_period_stats", "vendor_type = 'Supermarket'"),
+):
+    register(
+        name,
+        period_stats_sql(source_filter),
+        food_item="text",
+        item_type="text",
+        category="text",
+        start="date",
+        end="date",
+        granularity="text",
+    )
+
+register(
+    "compare_period_means",
+    """
+    WITH series AS (
+        SELECT *
+        FROM unnest(
+            %(sources)s::text[],
+            %(food_items)s::text[],
+            %(item_types)s::text[],
+            %(categories)s::text[]
+        ) WITH ORDINALITY AS series(source, food_item, item_type, category, position)
+    )
+    SELECT
+        series.position,
+        CAST(DATE_TRUNC(%(granularity)s, CAST(prices.date AS DATE)) AS DATE) AS period,
+        AVG(prices.price) AS mean
+    FROM "Cleaned-Food-Prices" prices
+    JOIN series
+        ON prices.food_item = series.food_item
+        AND prices.item_type = series.item_type
+        AND prices.category = series.category
+        AND (
+            (series.source = 'NBS' AND prices.source = 'NBS')
+            OR (series.source = 'Supermarket' AND prices.vendor_type = 'Supermarket')
+        )
+    WHERE CAST(prices.date AS DATE) BETWEEN %(start)s AND %(end)s
+        AND prices.price IS NOT NULL
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    """,
+    sources="text[]",
+    food_items="text[]",
+    item_types="text[]",
+    categories="text[]",
+    start="date",
+    end="date",
+    granularity="text",
+)
@@ -0,0 +1,159 @@
+"""
+Replays captured traffic (see src/access_log.py) against a running instance
+and reports latency percentiles, overall and per route:
+
+    python -m src.replay access.log
+    python -m src.replay access.log --base-url http://127.0.0.1:8000 \\
+        --speedup 10 --concurrency 32
+
+Requests keep their recorded spacing, divided by --speedup (0 sends them as fast
+as --concurrency allows). Run it before and after a cache, pool or index change
+to compare the two on the same, realistic mix of requests.
+"""
+import sys
+import json
+import time
+import argparse
+import statistics
+import threading
+
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+def read_log(path, limit=None):
+    """Reads the captured request lines, oldest first, skipping broken ones."""
+    entries = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and "p" in entry and "t" in entry:
+                entries.append(entry)
+    entries.sort(key=lambda entry: entry["t"])
+    return entries[:limit] if limit else entries
+
+
+def send(base_url, entry, timeout):
+    """Issues one captured request. Returns its (status, latency in ms)."""
+    url = base_url.rstrip("/") + entry["p"]
+    if entry.get("q"):
+        # Values are lists of every value given, or single ones in older logs.
+        url += "?" + urlencode(entry["q"], doseq=True)
+    headers = {"Accept-Encoding": "gzip"}
+    if entry.get("a"):
+        headers["Accept"] = entry["a"]
+
+    started = time.perf_counter()
+    try:
+        with urlopen(Request(url, headers=headers), timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except HTTPError as error:
+        error.read()
+        status = error.code
+    except (URLError, OSError):
+        status = 0
+    return status, (time.perf_counter() - started) * 1000
+
+
+def replay(entries, base_url, speedup, concurrency, timeout):
+    """
+    Sends the entries on their recorded schedule, sped up `speedup` times, with
+    at most `concurrency` in flight. Returns the (entry, status, latency) of
+    each and the wall time taken.
+    """
+    results = []
+    lock = threading.Lock()
+
+    def run(entry):
+        status, latency = send(base_url, entry, timeout)
+        with lock:
+            results.append((entry, status, latency))
+
+    first = entries[0]["t"] if entries else 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for entry in entries:
+            if speedup:
+                delay = (entry["t"] - first) / speedup - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            executor.submit(run, entry)
+    return results, time.perf_counter() - started
+
+
+def percentiles(latencies):
+    if len(latencies) < 2:
+        return {percentile: latencies[0] for percentile in PERCENTILES}
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {percentile: cuts[percentile - 1] for percentile in PERCENTILES}
+
+
+def report(results, elapsed, top):
+    """Prints throughput, status counts and latency percentiles."""
+    statuses = Counter(status for _, status, _ in results)
+    print(
+        f"{len(results)} requests in {elapsed:.1f}s "
+        f"({len(results) / elapsed if elapsed else 0:.1f} req/s)"
+    )
+    counts = (f"{status or 'failed'}: {n}" for status, n in sorted(statuses.items()))
+    print("statuses:", ", ".join(counts))
+
+    routes = defaultdict(list)
+    recorded = defaultdict(list)
+    for entry, _, latency in results:
+        routes[entry["p"]].append(latency)
+        if "ms" in entry:
+            recorded[entry["p"]].append(entry["ms"])
+    routes["all"] = [latency for _, _, latency in results]
+    recorded["all"] = [ms for route, values in recorded.items() for ms in values]
+
+    header = "".join(f"{f'p{percentile}':>9}" for percentile in PERCENTILES)
+    print(f"\n{'route':<40}{'count':>7}{header}{'max':>9}{'recorded p50':>14}")
+    ordered = sorted(routes.items(), key=lambda item: -len(item[1]))
+    for route, latencies in ordered[: top + 1]:
+        cuts = percentiles(latencies)
+        captured = (
+            f"{statistics.median(recorded[route]):14.1f}" if recorded[route] else ""
+        )
+        print(
+            f"{route:<40}{len(latencies):>7}"
+            + "".join(f"{cuts[percentile]:9.1f}" for percentile in PERCENTILES)
+            + f"{max(latencies):9.1f}{captured}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured API traffic.")
+    parser.add_argument("log", help="A log written with ACCESS_LOG_PATH")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument(
+        "--speedup",
+        type=float,
+        default=1.0,
+        help="Divide the recorded gaps between requests by this (0: no gaps)",
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--limit", type=int, help="Only replay the first N requests")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--top", type=int, default=15, help="Routes to list")
+    args = parser.parse_args()
+
+    entries = read_log(args.log, args.limit)
+    if not entries:
+        print("No requests to replay", file=sys.stderr)
+        sys.exit(1)
+
+    results, elapsed = replay(
+        entries, args.base_url, args.speedup, args.concurrency, args.timeout
+    )
+    report(results, elapsed, args.top)
@@ -0,0 +1,168 @@
+"""
+Stale-while-revalidate serving for the price and news endpoints.
+
+The last good (200) response of every GET request under SWR_PATHS is kept. A
+repeated request is then answered:
+
+- from the kept response while it is younger than SWR_FRESH_SECONDS
+  (SWR_NEWS_FRESH_SECONDS for /news/, whose summaries come from an LLM);
+- from the kept response, marked stale, for SWR_REVALIDATE_SECONDS more, while
+  the request is re-run in the background to refresh it;
+- by the endpoint otherwise. When the endpoint fails (a 5xx, e.g. a database
+  statement timeout or an LLM error), the kept response is served, marked
+  stale, if it is younger than SWR_STALE_IF_ERROR_SECONDS.
+
+Stale responses carry `Age`, `Warning: 110` and `X-Cache: STALE` headers.
+"""
+import os
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Response, current_app, g, request
+
+from src.cache import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+SWR_PATHS = tuple(
+    path.strip()
+    for path in os.getenv(
+        "SWR_PATHS",
+        "/nbs/,/supermarkets/,/news/,/series/,/compare/,/price-index/,"
+        "/distribution/,/anomalies/,/volatility/",
+    ).split(",")
+    if path.strip()
+)
+
+SWR_FRESH_SECONDS = int(os.getenv("SWR_FRESH_SECONDS", "30"))
+SWR_NEWS_FRESH_SECONDS = int(os.getenv("SWR_NEWS_FRESH_SECONDS", "600"))
+SWR_REVALIDATE_SECONDS = int(os.getenv("SWR_REVALIDATE_SECONDS", "300"))
+SWR_STALE_IF_ERROR_SECONDS = int(os.getenv("SWR_STALE_IF_ERROR_SECONDS", "86400"))
+
+# Set on the requests re-run in the background, which must reach the endpoint.
+REVALIDATING = "resilience.revalidating"
+
+last_good = TTLCache(
+    maxsize=int(os.getenv("SWR_MAX_ENTRIES", "1024")),
+    ttl=SWR_STALE_IF_ERROR_SECONDS,
+)
+
+revalidator = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SWR_WORKERS", "2")), thread_name_prefix="revalidate"
+)
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def is_resilient():
+    return request.method == "GET" and request.path.startswith(SWR_PATHS)
+
+
+def cache_key():
+    # The Accept header picks the body format (JSON, msgpack or Arrow).
+    return request.full_path, request.headers.get("Accept", "")
+
+
+def fresh_seconds():
+    if request.path.startswith("/news/"):
+        return SWR_NEWS_FRESH_SECONDS
+    return SWR_FRESH_SECONDS
+
+
+def kept_response(kept, age, stale):
+    """Rebuilds a kept (body, content type) response with its age."""
+    body, content_type = kept
+    response = Response(body, status=200, content_type=content_type)
+    response.headers["Age"] = str(int(age))
+    response.headers["X-Cache"] = "STALE" if stale else "HIT"
+    if stale:
+        response.headers["Warning"] = '110 - "Response is Stale"'
+    g.served_kept = True
+    return response
+
+
+def refresh(app, key, path, query_string, headers):
+    """Re-runs a request through the app so its kept response is replaced."""
+    try:
+        with app.test_request_context(
+            path,
+            method="GET",
+            query_string=query_string,
+            headers=headers,
+            environ_base={REVALIDATING: True},
+        ):
+            response = app.full_dispatch_request()
+        if response.status_code != 200:
+            logger.warning("Revalidating %s failed: %s", path, response.status_code)
+    except Exception:
+        logger.exception("Revalidating %s failed", path)
+    finally:
+        with _pending_lock:
+            _pending.discard(key)
+
+
+def revalidate(key):
+    """Refreshes the kept response of the current request in the background."""
+    with _pending_lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+
+    revalidator.submit(
+        refresh,
+        current_app._get_current_object(),
+        key,
+        request.path,
+        request.query_string.decode("latin-1"),
+        {"Accept": request.headers.get("Accept", "*/*")},
+    )
+
+
+def serve_kept():
+    """Answers from the kept response while it is fresh or being revalidated."""
+    if not is_resilient() or request.environ.get(REVALIDATING):
+        return None
+
+    key = cache_key()
+    entry = last_good.get_with_age(key)
+    if entry is None:
+        return None
+
+    age, kept = entry
+    if age <= fresh_seconds():
+        return kept_response(kept, age, stale=False)
+    if age <= fresh_seconds() + SWR_REVALIDATE_SECONDS:
+        revalidate(key)
+        return kept_response(kept, age, stale=True)
+    return None
+
+
+def keep_or_fall_back(response):
+    """
+    Keeps good responses, and swaps failed ones for the last good response.
+    """
+    if not is_resilient() or g.get("served_kept"):
+        return response
+
+    if response.status_code == 200 and not response.is_streamed:
+        last_good.set(cache_key(), (response.get_data(), response.content_type))
+    elif response.status_code >= 500 and not request.environ.get(REVALIDATING):
+        entry = last_good.get_with_age(cache_key())
+        if entry is not None:
+            logger.warning(
+                "Serving a stale %s after a %s", request.path, response.status_code
+            )
+            return kept_response(entry[1], entry[0], stale=True)
+    return response
+
+
+def init_resilience(app):
+    """
+    Registers stale-while-revalidate serving on a Flask app. Call it after
+    `init_compression` so responses are kept uncompressed.
+    """
+    app.before_request(serve_kept)
+    app.after_request(keep_or_fall_back)
@@ -0,0 +1,115 @@
+import json
+import datetime
+
+import numpy as np
+
+from flask import request, Response
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+
+def wants_columnar():
+    """
+    Returns True when the client asked for `format=columnar`.
+    """
+    return request.args.get("format", "rows").lower().strip() == "columnar"
+
+
+def round_prices(values):
+    """
+    Rounds a sequence of prices to 2 decimal places in one vectorized pass.
+    """
+    return np.round(np.asarray(values, dtype="float64"), 2)
+
+
+def format_dates(dates):
+    """
+    Formats dates the same way Flask's default JSON provider does.
+    """
+    return [
+        http_date(date) if isinstance(date, datetime.date) else str(date)
+        for date in dates
+    ]
+
+
+def negotiate(columnar=False):
+    """
+    Picks the response mimetype from the Accept header. Arrow IPC is only
+    offered for columnar payloads and binary formats only when installed.
+    """
+    offered = [JSON_MIMETYPE]
+    if msgpack is not None:
+        offered += [MSGPACK_MIMETYPE, "application/x-msgpack"]
+    if columnar and pa is not None:
+        offered.append(ARROW_MIMETYPE)
+
+    best = request.accept_mimetypes.best_match(offered, default=JSON_MIMETYPE)
+    return MSGPACK_MIMETYPE if best == "application/x-msgpack" else best
+
+
+def dumps(payload):
+    """
+    Serializes a payload to JSON bytes, using orjson when it is available.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload).encode("utf-8")
+
+
+def render(payload, mimetype=None):
+    """
+    Renders a JSON-compatible payload as JSON or msgpack.
+    """
+    mimetype = mimetype or negotiate()
+    if mimetype == MSGPACK_MIMETYPE:
+        return Response(msgpack.packb(payload), mimetype=MSGPACK_MIMETYPE)
+    return Response(dumps(payload), mimetype=JSON_MIMETYPE)
+
+
+def render_series(dates, values, value_key, date_key="date"):
+    """
+    Renders a price series.
+
+    By default the series is an array of `{date_key: ..., value_key: ...}` rows.
+    With `format=columnar` it is a pair of parallel arrays, e.g.
+    `{"dates": [...], "values": [...]}`, which may also be requested as an
+    Arrow IPC stream or msgpack through the Accept header.
+    """
+    values = round_prices(values)
+    columnar = wants_columnar()
+    mimetype = negotiate(columnar)
+
+    if mimetype == ARROW_MIMETYPE:
+        table = pa.table({date_key: list(dates), value_key: values})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(sink.getvalue().to_pybytes(), mimetype=ARROW_MIMETYPE)
+
+    values = values.tolist()
+    if columnar:
+        data = {f"{date_key}s": list(dates), "values": values}
+    else:
+        data = [
+            {date_key: date, value_key: value} for date, value in zip(dates, values)
+        ]
+    return render({"data": data}, mimetype)
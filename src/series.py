@@ -0,0 +1,137 @@
+import datetime
+
+import numpy as np
+import psycopg2
+
+from flask import request, abort
+from flask_restx import Resource, Namespace
+
+from src.cache import response_cache
+from src.catalog import SOURCES, get_catalog
+from src.db import pooled_cursor
+from src.engine import get_store
+from src.queries import execute
+from src.serializers import render_series
+from src.utils import parse_date_range
+from src.timeseries import GRANULARITIES
+
+
+api = Namespace(
+    "Series", description="Price series over any date range and granularity"
+)
+
+AGGREGATES = ["mean", "min", "max", "count"]
+
+STATEMENTS = {"nbs": "nbs_period_stats", "supermarkets": "supermarkets_period_stats"}
+
+
+def parse_series_key(source, food_item, item_type, category):
+    """
+    Validates a series against the catalog of its source and returns its store key.
+    """
+    if source not in SOURCES:
+        return abort(400, f"Invalid source. Choose from: {', '.join(SOURCES)}")
+    if not all([food_item, item_type, category]):
+        return abort(400, "Missing required parameters")
+
+    catalog = get_catalog(SOURCES[source])
+    if not catalog.has_series(food_item, item_type, category):
+        return abort(
+            404, f"No {source} series for {food_item}, {item_type}, {category}."
+        )
+    return (SOURCES[source], food_item, item_type, category)
+
+
+def period_stats(source, key, start, end, granularity):
+    """
+    The (periods, means, minimums, maximums, counts) of a series, from the
+    in-memory store when it is loaded and from Postgres otherwise.
+    """
+    store = get_store()
+    if store is not None:
+        return store.period_stats(key, start, end, granularity)
+
+    with pooled_cursor() as cur:
+        execute(
+            cur,
+            STATEMENTS[source],
+            {
+                "food_item": key[1],
+                "item_type": key[2],
+                "category": key[3],
+                "start": start or datetime.date.min,
+                "end": end or datetime.date.max,
+                "granularity": granularity,
+            },
+        )
+        records = cur.fetchall()
+
+    if not records:
+        return None
+    periods, *values = zip(*records)
+    return (
+        np.array([str(period) for period in periods], dtype="datetime64[D]"),
+        *(np.array(column, dtype="float64") for column in values),
+    )
+
+
+# http://127.0.0.1:5000/series/?source=supermarkets&food_item=tomato&item_type=tomato&category=1000%20g&from=2024-01-01&to=2024-06-30&granularity=week&aggregate=mean
+@api.route("/")
+@api.doc(
+    description="Returns one price series over any date range, aggregated per day, "
+    "week, month or year.",
+    params={
+        "source": "nbs or supermarkets",
+        "food_item": "Food item e.g. Rice",
+        "item_type": "Item type e.g. Long grain",
+        "category": "Category e.g. 4500 g",
+        "from": "First day, YYYY-MM-DD. Default is the start of the series.",
+        "to": "Last day, YYYY-MM-DD. Default is the end of the series.",
+        "granularity": f"One of {', '.join(GRANULARITIES)}. Default is day.",
+        "aggregate": f"One of {', '.join(AGGREGATES)}. Default is mean.",
+        "format": "rows (default) or columnar.",
+    },
+)
+class Series(Resource):
+    """Returns one price series over any date range and granularity."""
+
+    def get(self):
+        try:
+            source = request.args.get("source", "").lower().strip()
+            food_item = request.args.get("food_item", "").lower().strip()
+            item_type = request.args.get("item_type", "").lower().strip()
+            category = request.args.get("category", "").lower().strip()
+            granularity = request.args.get("granularity", "day").lower().strip()
+            aggregate = request.args.get("aggregate", "mean").lower().strip()
+
+            if granularity not in GRANULARITIES:
+                return abort(
+                    400,
+                    f"Invalid granularity. Choose from: {', '.join(GRANULARITIES)}",
+                )
+            if aggregate not in AGGREGATES:
+                return abort(
+                    400, f"Invalid aggregate. Choose from: {', '.join(AGGREGATES)}"
+                )
+
+            key = parse_series_key(source, food_item, item_type, category)
+            start, end = parse_date_range()
+
+            store = get_store()
+            version = store.watermark if store else None
+            cache_key = ("series", key, start, end, granularity, version)
+            stats = response_cache.get(cache_key)
+            if stats is None:
+                stats = period_stats(source, key, start, end, granularity)
+                response_cache.set(cache_key, stats)
+
+            if stats is None or len(stats[0]) == 0:
+                return abort(404, "No records found. Confirm query parameters.")
+
+        except psycopg2.Error as e:
+            return abort(500, f"Database error: {str(e)}")
+
+        periods, values = stats[0], stats[1 + AGGREGATES.index(aggregate)]
+        return render_series(
+            np.datetime_as_string(periods).tolist(), values, aggregate, "period"
+        )
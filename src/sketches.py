@@ -0,0 +1,341 @@
+"""
+Mergeable price distribution sketches.
+
+Each series keeps, for every day, a histogram of its prices over logarithmic
+bins (a DDSketch): bin `i` holds the prices in (gamma^(i-1), gamma^i], where
+gamma = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY). Any quantile read
+from a histogram is within RELATIVE_ACCURACY of the true one, and histograms
+merge by adding their bin counts, so a window of days (and every vendor within
+them) is summarised by adding its daily histograms without touching the rows.
+
+The daily histograms are built in Postgres and follow the in-memory store:
+when a series changes, only its days from the first changed one are reloaded.
+"""
+import os
+import datetime
+import threading
+
+import numpy as np
+import psycopg2
+
+from flask import request, abort
+from flask_restx import Resource, Namespace
+
+from src.cache import response_cache
+from src.db import DB_LOAD_TIMEOUT_MS, pooled_cursor
+from src.engine import first_difference, get_store
+from src.series import parse_series_key
+from src.serializers import render
+from src.timeseries import GRANULARITIES, bucket_start, period_runs
+from src.utils import parse_date_range
+
+
+api = Namespace(
+    "Distribution", description="Price distributions across vendors and days"
+)
+
+RELATIVE_ACCURACY = float(os.getenv("SKETCH_RELATIVE_ACCURACY", "0.01"))
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+
+QUANTILES = {"p10": 0.1, "p25": 0.25, "median": 0.5, "p75": 0.75, "p90": 0.9}
+
+SKETCH_COLUMNS = """
+    SELECT
+        CASE WHEN prices.source = 'NBS' THEN 'NBS' ELSE 'Supermarket' END AS source,
+        prices.food_item,
+        prices.item_type,
+        prices.category,
+        CAST(prices.date AS DATE) AS day,
+        CAST(CEIL(LN(CAST(prices.price AS DOUBLE PRECISION)) / %(log_gamma)s)
+            AS INTEGER) AS bin,
+        COUNT(*) AS count
+    FROM "Cleaned-Food-Prices" prices
+"""
+
+SKETCH_LOAD_QUERY = (
+    SKETCH_COLUMNS
+    + """
+    WHERE (prices.source = 'NBS' OR prices.vendor_type = 'Supermarket')
+        AND prices.price > 0
+    GROUP BY 1, 2, 3, 4, 5, 6
+    ORDER BY 5, 6
+"""
+)
+
+# SKETCH_LOAD_QUERY restricted to the given series, each from its own first day.
+# NBS and supermarket series can share a (food_item, item_type, category), so
+# the source is matched too.
+SKETCH_SERIES_QUERY = (
+    SKETCH_COLUMNS
+    + """
+    JOIN unnest(
+        %(sources)s::text[],
+        %(food_items)s::text[],
+        %(item_types)s::text[],
+        %(categories)s::text[],
+        %(since)s::date[]
+    ) AS changed(source, food_item, item_type, category, since)
+        ON CASE WHEN prices.source = 'NBS' THEN 'NBS' ELSE 'Supermarket' END
+            = changed.source
+        AND prices.food_item = changed.food_item
+        AND prices.item_type = changed.item_type
+        AND prices.category = changed.category
+    WHERE (prices.source = 'NBS' OR prices.vendor_type = 'Supermarket')
+        AND prices.price > 0
+        AND CAST(prices.date AS DATE) >= changed.since
+    GROUP BY 1, 2, 3, 4, 5, 6
+    ORDER BY 5, 6
+"""
+)
+
+
+def bin_value(bins):
+    """The price each bin stands for, within RELATIVE_ACCURACY of its prices."""
+    return 2 * GAMMA ** bins.astype("float64") / (GAMMA + 1)
+
+
+def summarize(bins, counts):
+    """
+    Merges (bin, count) histogram entries and returns the quantiles, min, max,
+    spread and number of prices of the merged histogram.
+    """
+    merged, inverse = np.unique(bins, return_inverse=True)
+    counts = np.bincount(inverse, weights=counts)
+    ranks = np.cumsum(counts)
+    total = ranks[-1]
+
+    names = list(QUANTILES)
+    positions = np.searchsorted(
+        ranks, [QUANTILES[name] * (total - 1) for name in names], side="right"
+    )
+    values = dict(zip(names, bin_value(merged[positions]).tolist()))
+    spread = values["p90"] - values["p10"]
+    return {
+        **{name: round(value, 2) for name, value in values.items()},
+        "min": round(float(bin_value(merged[:1])[0]), 2),
+        "max": round(float(bin_value(merged[-1:])[0]), 2),
+        "spread": round(spread, 2),
+        "spread_percentage": round(spread * 100 / values["median"], 2),
+        "count": int(total),
+    }
+
+
+class SeriesSketch:
+    """The daily price histograms of one series, as flat arrays sorted by day."""
+
+    __slots__ = ("dates", "bins", "counts")
+
+    def __init__(self, dates, bins, counts):
+        self.dates = dates
+        self.bins = bins
+        self.counts = counts
+
+    def merged(self, dates, bins, counts):
+        """A new sketch where the given days, and every day after them, are replaced."""
+        keep = self.dates < dates[0]
+        return SeriesSketch(
+            np.concatenate([self.dates[keep], dates]),
+            np.concatenate([self.bins[keep], bins]),
+            np.concatenate([self.counts[keep], counts]),
+        )
+
+    def truncated(self, since):
+        """A new sketch without the days from `since` onwards."""
+        keep = self.dates < np.datetime64(since, "D")
+        return SeriesSketch(self.dates[keep], self.bins[keep], self.counts[keep])
+
+    def window(self, start=None, end=None):
+        """The (dates, bins, counts) entries of the days from `start` to `end`."""
+        first = np.searchsorted(self.dates, np.datetime64(start, "D")) if start else 0
+        last = (
+            np.searchsorted(self.dates, np.datetime64(end, "D"), side="right")
+            if end
+            else len(self.dates)
+        )
+        return self.dates[first:last], self.bins[first:last], self.counts[first:last]
+
+    def distribution(self, start=None, end=None, granularity=None):
+        """
+        The summary of every price from `start` to `end`, or a (period, summary)
+        list per day, week, month or year when a granularity is given. Returns
+        None when there are no prices in the window.
+        """
+        dates, bins, counts = self.window(start, end)
+        if not len(dates):
+            return None
+        if granularity is None:
+            return summarize(bins, counts)
+
+        periods = bucket_start(dates, granularity)
+        starts = period_runs(periods)
+        ends = np.r_[starts[1:], len(periods)]
+        return [
+            (periods[first], summarize(bins[first:last], counts[first:last]))
+            for first, last in zip(starts, ends)
+        ]
+
+
+class SketchStore:
+    """The sketches of every series in the price store, kept in step with it."""
+
+    def __init__(self):
+        self.sketches = {}
+        self.series = {}
+        self.watermark = None
+        self.lock = threading.Lock()
+
+    def load(self, cur, changes):
+        """
+        Loads the histograms of every series, or, given {key: since} changes, of
+        those series from their first changed day. Returns {key: SeriesSketch}.
+        """
+        values = {"log_gamma": float(np.log(GAMMA))}
+        if changes is None:
+            cur.execute(SKETCH_LOAD_QUERY, values)
+        else:
+            sources, food_items, item_types, categories = zip(*changes)
+            values.update(
+                sources=list(sources),
+                food_items=list(food_items),
+                item_types=list(item_types),
+                categories=list(categories),
+                since=list(changes.values()),
+            )
+            cur.execute(SKETCH_SERIES_QUERY, values)
+
+        grouped = {}
+        for source, food_item, item_type, category, day, price_bin, count in cur:
+            entries = grouped.setdefault((source, food_item, item_type, category), [])
+            entries.append((day, price_bin, count))
+
+        return {
+            key: SeriesSketch(
+                np.array([day for day, _, _ in entries], dtype="datetime64[D]"),
+                np.array([price_bin for _, price_bin, _ in entries], dtype="int32"),
+                np.array([count for _, _, count in entries], dtype="float64"),
+            )
+            for key, entries in grouped.items()
+        }
+
+    def update(self, store):
+        """
+        Brings the sketches up to date with the store, reloading only the series
+        that changed and only from the first day that changed.
+        """
+        if store.watermark == self.watermark and self.sketches:
+            return
+
+        changes = {}
+        for key, series in store.series.items():
+            seen = self.series.get(key)
+            if seen is series:
+                continue
+            if seen is None or key not in self.sketches:
+                changes[key] = datetime.date.min
+                continue
+            day = first_difference(seen, series)
+            if day is not None:
+                changes[key] = day.astype(datetime.date)
+
+        sketches = {
+            key: self.sketches[key] for key in store.series if key in self.sketches
+        }
+        if changes and not self.sketches:
+            with pooled_cursor(DB_LOAD_TIMEOUT_MS) as cur:
+                sketches = self.load(cur, None)
+        elif changes:
+            with pooled_cursor(DB_LOAD_TIMEOUT_MS) as cur:
+                loaded = self.load(cur, changes)
+            for key, since in changes.items():
+                existing, sketch = sketches.get(key), loaded.get(key)
+                if existing is None or sketch is None:
+                    sketch = sketch or (existing and existing.truncated(since))
+                else:
+                    sketch = existing.merged(sketch.dates, sketch.bins, sketch.counts)
+                if sketch is not None:
+                    sketches[key] = sketch
+
+        # The store swaps in a new series index on every change, never mutating
+        # it, so holding on to it is enough to spot changed series next time.
+        self.sketches, self.series = sketches, store.series
+        self.watermark = store.watermark
+
+
+_sketch_store = SketchStore()
+
+
+def get_sketches():
+    """
+    Returns the up-to-date sketch store, or None when the in-memory price store
+    isn't available.
+    """
+    store = get_store()
+    if store is None:
+        return None
+
+    with _sketch_store.lock:
+        _sketch_store.update(store)
+    return _sketch_store
+
+
+# http://127.0.0.1:5000/distribution/?source=supermarkets&food_item=tomato&item_type=tomato&category=1000%20g&from=2024-06-01
+@api.route("/")
+@api.doc(
+    description="Returns the median, p10, p25, p75 and p90 price, the p10-p90 "
+    "spread and the number of prices of a series across every vendor over a "
+    f"window of days. Quantiles are within {RELATIVE_ACCURACY:.0%} of the exact "
+    "values.",
+    params={
+        "source": "nbs or supermarkets. Default is supermarkets.",
+        "food_item": "Specify the food item e.g. tomato",
+        "item_type": "Specify its item_type e.g. tomato",
+        "category": "Specify the category e.g. 1000 g",
+        "from": "First day, YYYY-MM-DD. Default is the first day with data.",
+        "to": "Last day, YYYY-MM-DD. Default is the latest day.",
+        "granularity": "One of day, week, month or year to get a distribution "
+        "per period. Default is one distribution over the whole window.",
+    },
+)
+class Distribution(Resource):
+    """Returns the price distribution of a series over a window of days."""
+
+    def get(self):
+        try:
+            source = request.args.get("source", "supermarkets").lower().strip()
+            food_item = request.args.get("food_item", "").lower().strip()
+            item_type = request.args.get("item_type", "").lower().strip()
+            category = request.args.get("category", "").lower().strip()
+            granularity = request.args.get("granularity", "").lower().strip() or None
+
+            if granularity is not None and granularity not in GRANULARITIES:
+                return abort(
+                    400,
+                    f"Invalid granularity. Choose from: {', '.join(GRANULARITIES)}",
+                )
+
+            key = parse_series_key(source, food_item, item_type, category)
+            start, end = parse_date_range()
+
+            sketches = get_sketches()
+            if sketches is None:
+                return abort(
+                    503, "Distributions are not available yet. Try again later."
+                )
+
+            version = sketches.watermark
+            cache_key = ("distribution", key, start, end, granularity, version)
+            data = response_cache.get(cache_key)
+            if data is None:
+                sketch = sketches.sketches.get(key)
+                data = sketch.distribution(start, end, granularity) if sketch else None
+                response_cache.set(cache_key, data)
+
+            if data is None:
+                return abort(404, "No records found. Confirm query parameters.")
+
+        except psycopg2.Error as e:
+            return abort(500, f"Database error: {str(e)}")
+
+        if granularity is not None:
+            data = [{"period": str(period), **summary} for period, summary in data]
+        return render({"data": data})
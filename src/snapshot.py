@@ -0,0 +1,156 @@
+"""
+Columnar snapshots of the in-memory price store.
+
+A snapshot is a directory of raw NumPy arrays holding every series back to back,
+plus an `index.json` mapping each series key to its slice:
+
+    snapshots/
+        LATEST                  name of the newest complete snapshot
+        20261019T020000/
+            index.json
+            dates.npy           datetime64[D]
+            sums.npy            float64
+            counts.npy          float64
+
+Workers map the arrays with `mmap_mode="r"`, so loading is zero-copy and every
+worker on the box shares the same page-cache pages. Build one nightly with
+
+    python -m src.snapshot build
+
+which also prunes the price change log workers catch up from.
+"""
+import os
+import sys
+import json
+import datetime
+
+import numpy as np
+
+from dotenv import load_dotenv
+
+from src.db import pooled_cursor
+from src.engine import PriceStore, Series, prune_changes
+
+
+SNAPSHOT_FORMAT = 2
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+
+# How many snapshots to keep around after building a new one.
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "3"))
+
+
+def latest_snapshot_path(directory=SNAPSHOT_DIR):
+    """
+    Returns the path of the newest complete snapshot, or None if there is none.
+    """
+    try:
+        with open(os.path.join(directory, "LATEST"), "r") as file:
+            name = file.read().strip()
+    except FileNotFoundError:
+        return None
+
+    path = os.path.join(directory, name)
+    return path if os.path.exists(os.path.join(path, "index.json")) else None
+
+
+def build_snapshot(store, directory=SNAPSHOT_DIR):
+    """
+    Writes every series of `store` to a new snapshot directory and points
+    `LATEST` at it once it is complete. Returns the snapshot path.
+    """
+    name = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(directory, name)
+    os.makedirs(path, exist_ok=True)
+
+    keys, offsets, start = [], [], 0
+    for key, series in store.series.items():
+        keys.append(list(key))
+        offsets.append([start, start + len(series.dates)])
+        start += len(series.dates)
+
+    all_series = list(store.series.values())
+    columns = (("dates", "datetime64[D]"), ("sums", "float64"), ("counts", "float64"))
+    for column, dtype in columns:
+        arrays = [getattr(series, column) for series in all_series]
+        values = np.concatenate(arrays) if arrays else np.array([], dtype=dtype)
+        np.save(os.path.join(path, f"{column}.npy"), values.astype(dtype))
+
+    with open(os.path.join(path, "index.json"), "w") as file:
+        json.dump(
+            {
+                "format": SNAPSHOT_FORMAT,
+                "created_at": name,
+                "watermark": store.watermark or 0,
+                "keys": keys,
+                "offsets": offsets,
+            },
+            file,
+        )
+
+    # Swap LATEST atomically so readers never see a half-written snapshot.
+    latest_tmp = os.path.join(directory, "LATEST.tmp")
+    with open(latest_tmp, "w") as file:
+        file.write(name)
+    os.replace(latest_tmp, os.path.join(directory, "LATEST"))
+
+    prune_snapshots(directory)
+    return path
+
+
+def prune_snapshots(directory=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP):
+    """
+    Removes all but the `keep` newest snapshots. Mapped files stay readable by
+    the workers that still have them open.
+    """
+    names = sorted(
+        name
+        for name in os.listdir(directory)
+        if os.path.exists(os.path.join(directory, name, "index.json"))
+    )
+    for name in names[:-keep]:
+        path = os.path.join(directory, name)
+        for file_name in os.listdir(path):
+            os.remove(os.path.join(path, file_name))
+        os.rmdir(path)
+
+
+def load_snapshot(path):
+    """
+    Maps a snapshot into a new PriceStore without copying the arrays.
+    Returns None if the snapshot was written in an unknown format.
+    """
+    with open(os.path.join(path, "index.json"), "r") as file:
+        index = json.load(file)
+
+    if index.get("format") != SNAPSHOT_FORMAT:
+        return None
+
+    dates = np.load(os.path.join(path, "dates.npy"), mmap_mode="r")
+    sums = np.load(os.path.join(path, "sums.npy"), mmap_mode="r")
+    counts = np.load(os.path.join(path, "counts.npy"), mmap_mode="r")
+
+    store = PriceStore()
+    series = {}
+    for key, (start, end) in zip(index["keys"], index["offsets"]):
+        key = tuple(key)
+        series[key] = Series(key, dates[start:end], sums[start:end], counts[start:end])
+    store.replace_series(series)
+
+    store.watermark = index["watermark"]
+    store.snapshot = path
+    return store
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    if sys.argv[1:] != ["build"]:
+        print("Usage: python -m src.snapshot build")
+        sys.exit(1)
+
+    store = PriceStore()
+    store.load()
+    print("Snapshot written to", build_snapshot(store))
+
+    with pooled_cursor() as cur:
+        print("Pruned", prune_changes(cur), "price change log entries")
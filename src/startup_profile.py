@@ -0,0 +1,82 @@
+"""
+Import-time profile of the app, i.e. what every worker boot and CLI run pays
+before serving anything:
+
+    python -m src.startup_profile
+    python -m src.startup_profile --budget 800
+
+Prints the slowest top-level imports and the total, and exits non-zero when the
+median total of a few fresh interpreters exceeds the budget (in milliseconds),
+so it can guard against import-time regressions in CI.
+"""
+import os
+import re
+import sys
+import argparse
+import statistics
+import subprocess
+
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def profile_imports(module="app"):
+    """
+    Imports `module` in a fresh interpreter with `-X importtime`. Returns the
+    total time in ms and the (cumulative ms, self ms, depth, name) of every
+    import.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            depth = (len(indent) - 1) // 2
+            imports.append((int(cumulative) / 1000, int(own) / 1000, depth, name))
+
+    total = next(
+        (cumulative for cumulative, _, _, name in imports if name == module), 0.0
+    )
+    return total, imports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the app's import time.")
+    parser.add_argument("--module", default="app", help="Module to import")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters")
+    parser.add_argument("--top", type=int, default=15, help="Imports to list")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=float(os.getenv("IMPORT_BUDGET_MS", "0")),
+        help="Fail if the median total exceeds this many ms (0 disables)",
+    )
+    args = parser.parse_args()
+
+    runs = [profile_imports(args.module) for _ in range(args.runs)]
+    totals = [total for total, _ in runs]
+    median = statistics.median(totals)
+
+    # Direct dependencies of the module, and theirs, from the median run.
+    _, imports = min(runs, key=lambda run: abs(run[0] - median))
+    shallow = [entry for entry in imports if 1 <= entry[2] <= 2]
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative, own, depth, name in sorted(shallow, reverse=True)[: args.top]:
+        print(f"{cumulative:14.1f} {own:9.1f}  {'  ' * (depth - 1)}{name}")
+
+    print(
+        f"\nimport {args.module}: median {median:.1f} ms over {args.runs} runs "
+        f"(min {min(totals):.1f}, max {max(totals):.1f})"
+    )
+    if args.budget and median > args.budget:
+        print(f"Over the {args.budget:.0f} ms budget", file=sys.stderr)
+        sys.exit(1)
@@ -1,25 +1,51 @@
-# Add OpenAI library
-import openai
-from openai import AzureOpenAI
-
 import os
 
 from dotenv import load_dotenv
 load_dotenv()
 
-openai.api_key = os.getenv('API_KEY')
-openai.api_base =  os.getenv('ENDPOINT')
-openai.api_type = 'azure' # Necessary for using the OpenAI library with Azure OpenAI
-openai.api_version = '2023-05-15' # Latest / target version of the API
+# The OpenAI SDK is the slowest import of the app, so it is only imported when
+# the first summary is requested (see `get_client`).
+api_version = '2023-05-15' # Latest / target version of the API
 
 deployment_name = 'Voicetask' # SDK calls this "engine", but naming
                                            # it "deployment_name" for clarity
                                            
-client = AzureOpenAI(
-    api_version=openai.api_version,
-    azure_endpoint=openai.api_base,
-    azure_deployment=deployment_name,
-)
+# A summary taking longer than this fails, and the last good one is served
+# instead (see src/resilience.py).
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+
+_client = None
+
+
+def get_client():
+    """Creates the Azure OpenAI client on first use, once per process."""
+    global _client
+    if _client is None:
+        # Add OpenAI library
+        import openai
+        from openai import AzureOpenAI
+
+        openai.api_key = os.getenv('API_KEY')
+        openai.api_base = os.getenv('ENDPOINT')
+        openai.api_type = 'azure' # Necessary for using the OpenAI library with Azure OpenAI
+        openai.api_version = api_version
+
+        _client = AzureOpenAI(
+            api_version=openai.api_version,
+            azure_endpoint=openai.api_base,
+            azure_deployment=deployment_name,
+            timeout=LLM_TIMEOUT_SECONDS,
+            max_retries=LLM_MAX_RETRIES,
+        )
+    return _client
+
+
+def reset_client():
+    """Drops the client, e.g. after a fork, so the next call opens new connections."""
+    global _client
+    _client = None
+
 
 def summarize(news, model="gpt-3.5-turbo", deployment_name='Voicetask'):
 
@@ -30,16 +56,18 @@ def summarize(news, model="gpt-3.5-turbo", deployment_name='Voicetask'):
 
     News: {news}
     """
-    try:
-        response = client.chat.completions.create(
-            temperature=0.4,
-            # engine=deployment_name,
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a great News Aggregator specialization in food security and factors affecting food prices."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response.choices[0].message.content
-    except:
-        return ''
\ No newline at end of file
+    # Errors and timeouts are left to the caller: the endpoints answer 503 and the
+    # last good summary is served instead (see src/resilience.py).
+    response = get_client().chat.completions.create(
+        temperature=0.4,
+        # engine=deployment_name,
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": "You are a great News Aggregator specialization in food security and factors affecting food prices."},
+            {"role": "user", "content": prompt}
+        ]
+    )
+    summary = response.choices[0].message.content
+    if not summary:
+        raise ValueError("The model returned an empty summary")
+    return summary
@@ -1,29 +1,40 @@
-import os
-import json
 import psycopg2
+import numpy as np
 
 from flask import jsonify, request, abort
 from flask_restx import Resource, Namespace
 
-from src.utils import validate_supermarkets_food_item
+from src.cache import response_cache
+from src.catalog import get_catalog
+from src.db import pooled_cursor
+from src.engine import get_store, SUPERMARKET
+from src.forecast import forecast_response
+from src.queries import QUERIES, execute
+from src.serializers import render_series
+from src.timeseries import to_arrays, downsample
+from src.utils import (
+    validate_supermarkets_food_item,
+    wants_stream,
+    stream_records,
+    stream_arrays,
+    parse_downsampling_args,
+    catalog_series,
+    format_overview,
+)
 
 
-def get_db_connection():
-    conn = psycopg2.connect(
-        host=os.getenv("HOST"),
-        database=os.getenv("DATABASE"),
-        user=os.getenv("USER_NAME"),
-        password=os.getenv("PASSWORD"),
-    )
-    return conn
+api = Namespace("Supermarket", description="Supermarket food price data operations")
 
 
-api = Namespace("Supermarket", description="Supermarket food price data operations")
+def format_daily_row(row):
+    """Formats a (date, average price) row of a gap-filled daily series."""
+    return {"date": str(row[0]), "average_price": round(float(row[1]), 2)}
 
-conversion_dictionary = {"g": [1000, "kg"], "ml": [1000, "L"], "pcs": [1, "pcs"]}
 
-with open("dashboard_items/supermarkets_dashboard.json", "r") as file:
-    dashboard_items = json.load(file)
+def daily_series(dates, values, resolution="day", max_points=None):
+    """Turns day and price arrays into date strings and prices, optionally downsampled."""
+    dates, values = downsample(dates, values, resolution, max_points)
+    return np.datetime_as_string(dates).tolist(), values
 
 
 # http://127.0.0.1:5000/supermarkets/all-time/?food_item=tomato&item_type=tomato&category=1000%20g
@@ -34,6 +45,11 @@ with open("dashboard_items/supermarkets_dashboard.json", "r") as file:
         "food_item": "Food item e.g. Rice",
         "item_type": "Item type e.g. Long grain",
         "category": "Category e.g. 4500 g",
+        "stream": "Stream the series as a chunked response. Default is false. "
+        "Downsampled series are short and always sent whole.",
+        "resolution": "Aggregate the series by day, week or month. Default is day.",
+        "max_points": "Downsample the series to at most this many points (LTTB).",
+        "format": "Response layout, rows or columnar. Default is rows.",
     },
 )
 class AllTime(Resource):
@@ -48,82 +64,67 @@ class AllTime(Resource):
             if not all([food_item, item_type, category]):
                 return abort(400, "Missing required parameters")
 
-            check = validate_supermarkets_food_item(food_item, dashboard_items)
+            check = validate_supermarkets_food_item(
+                food_item, get_catalog(SUPERMARKET)
+            )
             if check is not None:
                 return check
 
-            with get_db_connection().cursor() as cur:
-                cur.execute(
-                    f"""
-                    WITH RECURSIVE date_series AS (
-                        SELECT 
-                            generate_series(
-                                (SELECT MIN(date_trunc('day', CAST(date AS DATE))) 
-                                FROM "Cleaned-Food-Prices"
-                                WHERE food_item = '{food_item}' AND item_type = '{item_type}' 
-                                    AND category = '{category}' AND vendor_type = 'Supermarket'),
-                                (SELECT MAX(date_trunc('day', CAST(date AS DATE))) 
-                                FROM "Cleaned-Food-Prices"
-                                WHERE food_item = '{food_item}' AND item_type = '{item_type}' 
-                                    AND category = '{category}' AND vendor_type = 'Supermarket'),
-                                '1 day'::interval
-                            )::date AS date
-                    ),
-                    cleaned_data AS (
-                        SELECT 
-                            CAST(date AS date) as date,
-                            AVG(price) AS avg_price
-                        FROM "Cleaned-Food-Prices"
-                        WHERE food_item = '{food_item}' 
-                            AND item_type = '{item_type}' 
-                            AND category = '{category}' 
-                            AND vendor_type = 'Supermarket'
-                        GROUP BY CAST(date AS date)
-                    ),
-                    joined_data AS (
-                        SELECT 
-                            ds.date,
-                            cd.avg_price
-                        FROM date_series ds
-                        LEFT JOIN cleaned_data cd ON ds.date = cd.date
-                    ),
-                    recursive_filled_data AS (
-                        SELECT 
-                            date,
-                            avg_price,
-                            avg_price AS filled_avg_price
-                        FROM joined_data
-                        WHERE avg_price IS NOT NULL
-                        
-                        UNION ALL
-                        
-                        SELECT 
-                            jd.date,
-                            jd.avg_price,
-                            rfd.filled_avg_price
-                        FROM joined_data jd
-                        JOIN recursive_filled_data rfd ON jd.date = rfd.date + INTERVAL '1 day'
-                        WHERE jd.avg_price IS NULL
-                    )
-                    SELECT 
-                        date,
-                        filled_avg_price AS avg_price
-                    FROM recursive_filled_data
-                    ORDER BY date;
-                    """,
+            resolution, max_points = parse_downsampling_args()
+            downsampling = resolution != "day" or max_points is not None
+
+            store = get_store()
+            cache_key = (
+                "all-time",
+                food_item,
+                item_type,
+                category,
+                resolution,
+                max_points,
+                store.watermark if store else None,
+            )
+
+            if downsampling:
+                series = response_cache.get(cache_key)
+                if series is not None:
+                    return render_series(*series, "average_price")
+
+            series_params = {
+                "food_item": food_item,
+                "item_type": item_type,
+                "category": category,
+            }
+
+            if wants_stream() and not downsampling and store is None:
+                response = stream_records(
+                    QUERIES["supermarkets_all_time"].sql,
+                    series_params,
+                    format_daily_row,
                 )
+                if response is None:
+                    return abort(404, "No records found. Confirm query parameters.")
+                return response
 
-                records = cur.fetchall()
+            if store is not None:
+                daily = store.filled_daily(
+                    (SUPERMARKET, food_item, item_type, category)
+                )
+                dates, values = daily if daily is not None else to_arrays([])
+            else:
+                with pooled_cursor() as cur:
+                    execute(cur, "supermarkets_all_time", series_params)
 
-                if not records:
-                    return abort(404, "No records found. Confirm query parameters.")
-                data = [
-                    {
-                        "date": str(row[0]),
-                        "average_price": float("{:.2f}".format(row[1])),
-                    }
-                    for row in records
-                ]
+                    dates, values = to_arrays(cur.fetchall())
+
+            if not len(dates):
+                return abort(404, "No records found. Confirm query parameters.")
+
+            if wants_stream() and not downsampling:
+                return stream_arrays(dates, values, format_daily_row)
+
+            series = daily_series(dates, values, resolution, max_points)
+            if downsampling:
+                response_cache.set(cache_key, series)
 
         except psycopg2.Error as e:
             return abort(500, f"Database error: {str(e)}")
@@ -131,7 +132,7 @@ class AllTime(Resource):
         # except Exception as e:
         #     return abort(500, f"An unexpected error occurred: {str(e)}")
 
-        return jsonify({"data": data})
+        return render_series(*series, "average_price")
 
 
 # http://127.0.0.1:5000/supermarkets/year/?food_item=tomato&item_type=tomato&category=1000%20g
@@ -146,6 +147,8 @@ class AllTime(Resource):
         "category": "Category e.g. 4500 g",
         "current_month": "Filter for current month. Default is false.",
         "current_week": "Filter for current week. Default is false.",
+        "stream": "Stream the series as a chunked response. Default is false.",
+        "format": "Response layout, rows or columnar. Default is rows.",
     },
 )
 class FilterByCurrentYear(Resource):
@@ -165,96 +168,51 @@ class FilterByCurrentYear(Resource):
             if not all([food_item, item_type, category]):
                 return abort(400, "Missing required parameters")
 
-            check = validate_supermarkets_food_item(food_item, dashboard_items)
+            check = validate_supermarkets_food_item(
+                food_item, get_catalog(SUPERMARKET)
+            )
             if check is not None:
                 return check
 
-            prequel = f"""
-                    WITH RECURSIVE date_series AS (
-                        SELECT 
-                            generate_series(
-                                (SELECT MIN(date_trunc('day', CAST(date AS DATE))) 
-                                FROM "Cleaned-Food-Prices"
-                                WHERE food_item = '{food_item}' AND item_type = '{item_type}' AND category = '{category}' AND vendor_type = 'Supermarket'),
-                                (SELECT MAX(date_trunc('day', CAST(date AS DATE))) 
-                                FROM "Cleaned-Food-Prices"
-                                WHERE food_item = '{food_item}' AND item_type = '{item_type}' AND category = '{category}' AND vendor_type = 'Supermarket'),
-                                '1 day'::interval
-                            )::date AS date
-                    ),
-                    cleaned_data AS ("""
-
-            sequel = """
-                    ),
-                    joined_data AS (
-                        SELECT 
-                            ds.date,
-                            cd.avg_price
-                        FROM date_series ds
-                        LEFT JOIN cleaned_data cd ON ds.date = cd.date
-                    ),
-                    recursive_filled_data AS (
-                        SELECT 
-                            date,
-                            avg_price,
-                            avg_price AS filled_avg_price
-                        FROM joined_data
-                        WHERE avg_price IS NOT NULL
-                        
-                        UNION ALL
-                        
-                        SELECT 
-                            jd.date,
-                            jd.avg_price,
-                            rfd.filled_avg_price
-                        FROM joined_data jd
-                        JOIN recursive_filled_data rfd ON jd.date = rfd.date + INTERVAL '1 day'
-                        WHERE jd.avg_price IS NULL
-                    )
-                    SELECT 
-                        date,
-                        filled_avg_price AS avg_price
-                    FROM recursive_filled_data
-                    ORDER BY date;
-                    """
-
-            query = f"""
-                    SELECT CAST(date AS date) as date, AVG(price) AS avg_price
-                    FROM "Cleaned-Food-Prices"
-                    WHERE food_item = '{food_item}' 
-                        AND item_type = '{item_type}' 
-                        AND category = '{category}' 
-                        AND vendor_type = 'Supermarket'
-                        AND EXTRACT(YEAR FROM CAST(date AS DATE)) = EXTRACT(YEAR FROM CURRENT_DATE)
-                    """
-
-            if current_month.lower() == "true":
-                query += " AND EXTRACT(MONTH FROM CAST(date AS DATE)) = EXTRACT(MONTH FROM CURRENT_DATE)"
-
-            if current_week.lower() == "true":
-                query += " AND EXTRACT(WEEK FROM CAST(date AS DATE)) = EXTRACT(WEEK FROM CURRENT_DATE)"
-
-            query += " GROUP BY CAST(date AS date)\n"  # ORDER BY date;"
-
-            query += sequel
-            query = prequel + query
-
-            with get_db_connection().cursor() as cur:
-                cur.execute(
-                    query,
+            series_params = {
+                "food_item": food_item,
+                "item_type": item_type,
+                "category": category,
+                "current_month": current_month == "true",
+                "current_week": current_week == "true",
+            }
+
+            store = get_store()
+            if wants_stream() and store is None:
+                response = stream_records(
+                    QUERIES["supermarkets_current_year"].sql,
+                    series_params,
+                    format_daily_row,
                 )
-                records = cur.fetchall()
-
-                if not records:
+                if response is None:
                     return abort(404, "No records found. Confirm query parameters.")
+                return response
+
+            if store is not None:
+                daily = store.filled_daily(
+                    (SUPERMARKET, food_item, item_type, category),
+                    current_year=True,
+                    current_month=current_month == "true",
+                    current_week=current_week == "true",
+                )
+                dates, values = daily if daily is not None else to_arrays([])
+            else:
+                with pooled_cursor() as cur:
+                    execute(cur, "supermarkets_current_year", series_params)
+                    dates, values = to_arrays(cur.fetchall())
 
-                data = [
-                    {
-                        "date": str(row[0]),
-                        "average_price": float("{:.2f}".format(row[1])),
-                    }
-                    for row in records
-                ]
+            if not len(dates):
+                return abort(404, "No records found. Confirm query parameters.")
+
+            if wants_stream():
+                return stream_arrays(dates, values, format_daily_row)
+
+            series = daily_series(dates, values)
 
         except psycopg2.Error as e:
             return abort(500, f"Database error: {str(e)}")
@@ -265,7 +223,7 @@ class FilterByCurrentYear(Resource):
         # except Exception as e:
         #     return abort(500, f"An unexpected error occurred: {str(e)}")
 
-        return jsonify({"data": data})
+        return render_series(*series, "average_price")
 
 
 # http://127.0.0.1:5000/supermarkets/average-item-types-price/?food_item=tomato
@@ -284,83 +242,53 @@ class AverageItemTypesPrice(Resource):
             if not all([food_item]):
                 return abort(400, "Missing required parameters")
 
-            check = validate_supermarkets_food_item(food_item, dashboard_items)
+            check = validate_supermarkets_food_item(
+                food_item, get_catalog(SUPERMARKET)
+            )
             if check is not None:
                 return check
 
-            category_filter = ""
-            for item_type, categories in dashboard_items[food_item].items():
-                for category in categories:
-                    category_filter += (
-                        f"(item_type = '{item_type}' AND category = '{category}')"
+            item_types, categories = [], []
+            catalog = get_catalog(SUPERMARKET)
+            for item_type, item_categories in catalog[food_item].items():
+                for category in item_categories:
+                    item_types.append(item_type)
+                    categories.append(category)
+
+            store = get_store()
+            if store is not None:
+                records = store.latest_unit_prices(
+                    SUPERMARKET, food_item, item_types, categories
+                )
+            else:
+                with pooled_cursor() as cur:
+                    execute(
+                        cur,
+                        "supermarkets_average_item_types_price",
+                        {
+                            "food_item": food_item,
+                            "item_types": item_types,
+                            "categories": categories,
+                        },
                     )
-                    category_filter += " OR "
-            category_filter = category_filter.rstrip(" OR ")
-
-            with get_db_connection().cursor() as cur:
-                cur.execute(
-                    f"""
-                    WITH LatestDate AS (
-                        SELECT MAX(CAST(date AS TIMESTAMP)) AS max_date
-                        FROM "Cleaned-Food-Prices"
-                        WHERE category IS NOT NULL AND LENGTH(category) > 0
-                        AND food_item = %s AND vendor_type = 'Supermarket'
-                    ),
-                    LatestRecords AS (
-                        SELECT 
-                            item_type, 
-                            category, 
-                            price, 
-                            SPLIT_PART(category, ' ', 1) AS numeric_part,
-                            SPLIT_PART(category, ' ', 2) AS unit,
-                            price / NULLIF(CAST(COALESCE(NULLIF(SPLIT_PART(category, ' ', 1), ''), '0') AS numeric), 0) AS unit_price
-                        FROM "Cleaned-Food-Prices"
-                        WHERE CAST(date AS TIMESTAMP) = (SELECT max_date FROM LatestDate)
-                            AND food_item = %s AND vendor_type = 'Supermarket'
-                            AND {category_filter}
 
-                    )
-                    SELECT item_type, AVG(unit_price) AS average_price, unit
-                    FROM LatestRecords
-                    GROUP BY item_type, unit;
-                    """,
-                    (food_item, food_item),
-                )
+                    records = cur.fetchall()
 
-                records = cur.fetchall()
+            if not records:
+                return abort(404, "No records found. Confirm query parameters.")
 
-                if not records:
-                    return abort(404, "No records found. Confirm query parameters.")
+            data = []
+            for item_type, average_price, unit in records:
+                if average_price is None:
+                    continue  # no usable quantity in the category
 
-                data = []
-                for item_type, average_price, unit in records:
-                    if average_price is None:
-                        continue  # average_price = 0
-
-                    if unit in conversion_dictionary:
-                        conversion_factor, new_unit = conversion_dictionary[unit]
-                        converted_price = (
-                            average_price * conversion_factor
-                            if average_price != 0
-                            else 0
-                        )
-                        data.append(
-                            {
-                                "item_type": item_type,
-                                "average_price": round(converted_price, 2),
-                                "unit": new_unit,
-                            }
-                        )
-                    else:
-                        data.append(
-                            {
-                                "item_type": item_type,
-                                "average_price": (
-                                    round(average_price, 2) if average_price != 0 else 0
-                                ),
-                                "unit": unit,
-                            }
-                        )
+                data.append(
+                    {
+                        "item_type": item_type,
+                        "average_price": round(float(average_price), 2),
+                        "unit": unit,
+                    }
+                )
 
         except psycopg2.Error as e:
             return abort(500, f"Database error: {str(e)}")
@@ -371,6 +299,89 @@ class AverageItemTypesPrice(Resource):
         return jsonify({"data": data})
 
 
+# http://127.0.0.1:5000/supermarkets/overview/
+@api.route("/overview/")
+@api.doc(
+    description="Returns the latest average unit price and month-on-month change of "
+    "every item_type of every food_item on the dashboard.",
+)
+class Overview(Resource):
+    """
+    Returns the latest average unit price and month-on-month change of every
+    item_type of every food_item on the dashboard, in one request.
+    """
+
+    def get(self):
+        try:
+            store = get_store()
+            cache_key = ("supermarkets/overview", store.watermark if store else None)
+            data = response_cache.get(cache_key)
+            if data is not None:
+                return jsonify({"data": data})
+
+            food_items, item_types, categories = catalog_series(
+                get_catalog(SUPERMARKET)
+            )
+            if store is not None:
+                records = store.overview(
+                    SUPERMARKET, food_items, item_types, categories
+                )
+            else:
+                with pooled_cursor() as cur:
+                    execute(
+                        cur,
+                        "supermarkets_overview",
+                        {
+                            "food_items": food_items,
+                            "item_types": item_types,
+                            "categories": categories,
+                        },
+                    )
+
+                    records = cur.fetchall()
+
+            if not records:
+                return abort(404, "No records found.")
+
+            data = format_overview(records)
+            response_cache.set(cache_key, data)
+
+        except psycopg2.Error as e:
+            return abort(500, f"Database error: {str(e)}")
+
+        return jsonify({"data": data})
+
+
+# http://127.0.0.1:5000/supermarkets/forecast/?food_item=tomato&item_type=tomato&category=1000%20g&horizon=30
+@api.route("/forecast/")
+@api.doc(
+    description="Returns the forecast daily average price of a food item, item type "
+    "and category with 80% and 95% prediction intervals.",
+    params={
+        "food_item": "Specify the food item e.g. tomato",
+        "item_type": "Specify its item_type e.g. tomato",
+        "category": "Specify the category e.g. 1000 g",
+        "horizon": "Days ahead, between 1 and 90. Default is 30.",
+    },
+)
+class Forecast(Resource):
+    """Returns the forecast daily average price of a food item, item type and category."""
+
+    def get(self):
+        food_item = request.args.get("food_item", "").lower().strip()
+        item_type = request.args.get("item_type", "").lower().strip()
+        category = request.args.get("category", "").lower().strip()
+
+        if not all([food_item, item_type, category]):
+            return abort(400, "Missing required parameters")
+
+        check = validate_supermarkets_food_item(food_item, get_catalog(SUPERMARKET))
+        if check is not None:
+            return check
+
+        return forecast_response(SUPERMARKET, food_item, item_type, category)
+
+
 # http://127.0.0.1:5000/supermarkets/monthly-average-price/?food_item=tomato&item_type=tomato&category=150%20g
 @api.route("/monthly-average-price/")
 @api.doc(
@@ -379,6 +390,7 @@ class AverageItemTypesPrice(Resource):
         "food_item": "Food item e.g. Rice",
         "item_type": "Item type e.g. Long grain",
         "category": "Category e.g. 4500 g",
+        "format": "Response layout, rows or columnar. Default is rows.",
     },
 )
 class MonthlyAverage(Resource):
@@ -393,39 +405,47 @@ class MonthlyAverage(Resource):
             if not all([food_item, item_type, category]):
                 return abort(400, "Missing required parameters")
 
-            check = validate_supermarkets_food_item(food_item, dashboard_items)
+            check = validate_supermarkets_food_item(
+                food_item, get_catalog(SUPERMARKET)
+            )
             if check is not None:
                 return check
 
-            with get_db_connection().cursor() as cur:
-                # NOTE: This query has been updated to return the values
-                # for the last 12 months. Not just the months in the current year.
-                cur.execute(
-                    """
-                    SELECT EXTRACT(MONTH FROM CAST(date AS DATE)) AS month, AVG(price) AS monthly_avg_price
-                    FROM "Cleaned-Food-Prices"
-                    WHERE food_item = %s
-                        AND item_type = %s
-                        AND category = %s
-                        AND vendor_type = 'Supermarket'
-                    GROUP BY EXTRACT(YEAR FROM CAST(date AS DATE)), EXTRACT(MONTH FROM CAST(date AS DATE))
-                    ORDER BY EXTRACT(YEAR FROM CAST(date AS DATE)) DESC, EXTRACT(MONTH FROM CAST(date AS DATE)) DESC
-                    LIMIT 12;
-                    """,
-                    (food_item, item_type, category),
+            store = get_store()
+            if store is not None:
+                monthly = store.monthly_averages(
+                    (SUPERMARKET, food_item, item_type, category)
                 )
-                records = cur.fetchall()
+                records = []
+                if monthly is not None:
+                    months, averages = (array.tolist() for array in monthly)
+                    # Newest first, like the SQL below.
+                    months = [month.month for month in months]
+                    records = list(zip(months, averages))[::-1]
+            else:
+                with pooled_cursor() as cur:
+                    # NOTE: This query has been updated to return the values
+                    # for the last 12 months. Not just the months in the current year.
+                    cur.execute(
+                        """
+                        SELECT EXTRACT(MONTH FROM CAST(date AS DATE)) AS month, AVG(price) AS monthly_avg_price
+                        FROM "Cleaned-Food-Prices"
+                        WHERE food_item = %s
+                            AND item_type = %s
+                            AND category = %s
+                            AND vendor_type = 'Supermarket'
+                        GROUP BY EXTRACT(YEAR FROM CAST(date AS DATE)), EXTRACT(MONTH FROM CAST(date AS DATE))
+                        ORDER BY EXTRACT(YEAR FROM CAST(date AS DATE)) DESC, EXTRACT(MONTH FROM CAST(date AS DATE)) DESC
+                        LIMIT 12;
+                        """,
+                        (food_item, item_type, category),
+                    )
+                    records = cur.fetchall()
 
-                if not records:
-                    return abort(404, "No records found. Confirm query parameters.")
+            if not records:
+                return abort(404, "No records found. Confirm query parameters.")
 
-                data = [
-                    {
-                        "month": int(row[0]),
-                        "monthly_avg_price": float("{:.2f}".format(row[1])),
-                    }
-                    for row in records[::-1]
-                ]
+            months, monthly_avg_prices = zip(*records[::-1])
 
         except psycopg2.Error as e:
             return abort(500, f"Database error: {str(e)}")
@@ -433,7 +453,12 @@ class MonthlyAverage(Resource):
         # except Exception as e:
         #     return abort(500, f"An unexpected error occurred: {str(e)}")
 
-        return jsonify({"data": data})
+        return render_series(
+            [int(month) for month in months],
+            monthly_avg_prices,
+            "monthly_avg_price",
+            "month",
+        )
 
 
 # http://127.0.0.1:5000/supermarkets/mom-percentage/?food_item=tomato&item_type=tomato&category=1000%20g
@@ -458,49 +483,60 @@ class MonthOnMonthPercentage(Resource):
             if not all([food_item, item_type, category]):
                 return abort(400, "Missing required parameters")
 
-            check = validate_supermarkets_food_item(food_item, dashboard_items)
+            check = validate_supermarkets_food_item(
+                food_item, get_catalog(SUPERMARKET)
+            )
             if check is not None:
                 return check
 
-            with get_db_connection().cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT EXTRACT(MONTH FROM CAST(date AS DATE)) AS month, AVG(price) AS monthly_avg_price
-                    FROM "Cleaned-Food-Prices"
-                    WHERE food_item = %s
-                        AND item_type = %s
-                        AND category = %s
-                        AND vendor_type = 'Supermarket'
-                    GROUP BY EXTRACT(YEAR FROM CAST(date AS DATE)), EXTRACT(MONTH FROM CAST(date AS DATE))
-                    ORDER BY EXTRACT(YEAR FROM CAST(date AS DATE)) DESC, EXTRACT(MONTH FROM CAST(date AS DATE)) DESC
-                    LIMIT 2;
-                    """,
-                    (food_item, item_type, category),
-                )
-
-                records = cur.fetchall()
-
-                if not records:
-                    return abort(404, "No records found. Confirm query parameters.")
-
-                (current_month, current_month_average_price), (
-                    _,
-                    previous_month_avg_price,
-                ) = records
-                percentage_change = (
-                    (current_month_average_price - previous_month_avg_price)
-                    * 100
-                    / previous_month_avg_price
-                )
-
-                data = [
-                    {
-                        "current_month": int(current_month),
-                        "current_month_average_price": current_month_average_price,
-                        "previous_month_avg_price": previous_month_avg_price,
-                        "percentage_change": round(percentage_change, 2),
-                    }
+            store = get_store()
+            if store is not None:
+                records = [
+                    (period.month, average_price)
+                    for period, average_price in store.last_two(
+                        (SUPERMARKET, food_item, item_type, category), "month"
+                    )
                 ]
+            else:
+                with pooled_cursor() as cur:
+                    cur.execute(
+                        """
+                        SELECT EXTRACT(MONTH FROM CAST(date AS DATE)) AS month, AVG(price) AS monthly_avg_price
+                        FROM "Cleaned-Food-Prices"
+                        WHERE food_item = %s
+                            AND item_type = %s
+                            AND category = %s
+                            AND vendor_type = 'Supermarket'
+                        GROUP BY EXTRACT(YEAR FROM CAST(date AS DATE)), EXTRACT(MONTH FROM CAST(date AS DATE))
+                        ORDER BY EXTRACT(YEAR FROM CAST(date AS DATE)) DESC, EXTRACT(MONTH FROM CAST(date AS DATE)) DESC
+                        LIMIT 2;
+                        """,
+                        (food_item, item_type, category),
+                    )
+
+                    records = cur.fetchall()
+
+            if not records:
+                return abort(404, "No records found. Confirm query parameters.")
+
+            (current_month, current_month_average_price), (
+                _,
+                previous_month_avg_price,
+            ) = records
+            percentage_change = (
+                (current_month_average_price - previous_month_avg_price)
+                * 100
+                / previous_month_avg_price
+            )
+
+            data = [
+                {
+                    "current_month": int(current_month),
+                    "current_month_average_price": current_month_average_price,
+                    "previous_month_avg_price": previous_month_avg_price,
+                    "percentage_change": round(percentage_change, 2),
+                }
+            ]
 
         except psycopg2.Error as e:
             return abort(500, f"Database error: {str(e)}")
@@ -533,49 +569,57 @@ class DayOverDayPercentage(Resource):
             if not all([food_item, item_type, category]):
                 return abort(400, "Missing required parameters")
 
-            check = validate_supermarkets_food_item(food_item, dashboard_items)
+            check = validate_supermarkets_food_item(
+                food_item, get_catalog(SUPERMARKET)
+            )
             if check is not None:
                 return check
 
-            with get_db_connection().cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT date, AVG(price) AS daily_avg_price
-                    FROM "Cleaned-Food-Prices"
-                    WHERE food_item = %s
-                        AND item_type = %s
-                        AND category = %s
-                        AND vendor_type = 'Supermarket'
-                    GROUP BY date
-                    ORDER BY date DESC
-                    LIMIT 2;
-                    """,
-                    (food_item, item_type, category),
-                )
-
-                records = cur.fetchall()
-
-                if not records:
-                    return abort(404, "No records found. Confirm query parameters.")
-
-                (current_day, current_day_average_price), (
-                    _,
-                    previous_day_avg_price,
-                ) = records
-                percentage_change = (
-                    (current_day_average_price - previous_day_avg_price)
-                    * 100
-                    / previous_day_avg_price
+            store = get_store()
+            if store is not None:
+                records = store.last_two(
+                    (SUPERMARKET, food_item, item_type, category), "day"
                 )
+            else:
+                with pooled_cursor() as cur:
+                    cur.execute(
+                        """
+                        SELECT date, AVG(price) AS daily_avg_price
+                        FROM "Cleaned-Food-Prices"
+                        WHERE food_item = %s
+                            AND item_type = %s
+                            AND category = %s
+                            AND vendor_type = 'Supermarket'
+                        GROUP BY date
+                        ORDER BY date DESC
+                        LIMIT 2;
+                        """,
+                        (food_item, item_type, category),
+                    )
 
-                data = [
-                    {
-                        "current_day": str(current_day),
-                        "current_day_average_price": current_day_average_price,
-                        "previous_day_avg_price": previous_day_avg_price,
-                        "percentage_change": round(percentage_change, 2),
-                    }
-                ]
+                    records = cur.fetchall()
+
+            if not records:
+                return abort(404, "No records found. Confirm query parameters.")
+
+            (current_day, current_day_average_price), (
+                _,
+                previous_day_avg_price,
+            ) = records
+            percentage_change = (
+                (current_day_average_price - previous_day_avg_price)
+                * 100
+                / previous_day_avg_price
+            )
+
+            data = [
+                {
+                    "current_day": str(current_day),
+                    "current_day_average_price": current_day_average_price,
+                    "previous_day_avg_price": previous_day_avg_price,
+                    "percentage_change": round(percentage_change, 2),
+                }
+            ]
         except psycopg2.Error as e:
             return abort(500, f"Database error: {str(e)}")
 
@@ -0,0 +1,131 @@
+import numpy as np
+
+
+RESOLUTIONS = ["day", "week", "month"]
+GRANULARITIES = ["day", "week", "month", "year"]
+
+
+def to_arrays(records):
+    """
+    Splits (date, price) records into a datetime64[D] array and a float64 array.
+    """
+    if not records:
+        return np.array([], dtype="datetime64[D]"), np.array([], dtype="float64")
+
+    dates, values = zip(*records)
+    return (
+        np.array([str(date)[:10] for date in dates], dtype="datetime64[D]"),
+        np.array(values, dtype="float64"),
+    )
+
+
+def bucket_start(dates, resolution):
+    """
+    Returns the first day of the week (Monday), month or year bucket of each date.
+    """
+    if resolution == "week":
+        days = dates.astype("int64")
+        # 1970-01-01 was a Thursday, so (days + 3) % 7 is 0 on Mondays.
+        return (days - (days + 3) % 7).astype("datetime64[D]")
+    if resolution == "month":
+        return dates.astype("datetime64[M]").astype("datetime64[D]")
+    if resolution == "year":
+        return dates.astype("datetime64[Y]").astype("datetime64[D]")
+    return dates
+
+
+def bucket_mean(dates, values, resolution):
+    """
+    Averages a series into week or month buckets, labelled by the bucket start.
+    """
+    if resolution == "day" or len(dates) == 0:
+        return dates, values
+
+    buckets, inverse = np.unique(bucket_start(dates, resolution), return_inverse=True)
+    sums = np.bincount(inverse, weights=values, minlength=len(buckets))
+    counts = np.bincount(inverse, minlength=len(buckets))
+    return buckets, sums / counts
+
+
+def lttb(dates, values, max_points):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, for every bucket in between, the point
+    forming the largest triangle with the previously kept point and the mean of
+    the next bucket. This preserves the visual shape (peaks and troughs) of the
+    series far better than plain averaging.
+    """
+    size = len(dates)
+    if max_points >= size or max_points < 3:
+        return dates, values
+
+    x = dates.astype("int64").astype("float64")
+    y = values
+
+    # Bucket boundaries for the size - 2 interior points.
+    edges = np.linspace(1, size - 1, max_points - 1).astype("int64")
+    selected = np.empty(max_points, dtype="int64")
+    selected[0], selected[-1] = 0, size - 1
+
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else size
+
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+
+    return dates[selected], values[selected]
+
+
+def downsample(dates, values, resolution="day", max_points=None):
+    """
+    Aggregates a series to `resolution` buckets and then caps it at `max_points`.
+    """
+    dates, values = bucket_mean(dates, values, resolution)
+    if max_points:
+        dates, values = lttb(dates, values, max_points)
+    return dates, values
+
+
+def period_runs(periods):
+    """
+    Returns the index where each run of equal values starts in a sorted array of
+    periods, for use with `np.ufunc.reduceat`.
+    """
+    return np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+
+
+def calendar(start, end, granularity):
+    """
+    Every day, week, month or year bucket start from the bucket of `start` to
+    the bucket of `end`.
+    """
+    first = bucket_start(np.array([start], dtype="datetime64[D]"), granularity)[0]
+    last = bucket_start(np.array([end], dtype="datetime64[D]"), granularity)[0]
+    if granularity in ("month", "year"):
+        unit = "datetime64[M]" if granularity == "month" else "datetime64[Y]"
+        periods = np.arange(first.astype(unit), last.astype(unit) + 1)
+        return periods.astype("datetime64[D]")
+    step = 7 if granularity == "week" else 1
+    return np.arange(first, last + np.timedelta64(1, "D"), step)
+
+
+def align(calendar_periods, periods, values):
+    """
+    Aligns a series onto a calendar, carrying each value forward until the next
+    one. Periods before the first value are NaN.
+    """
+    index = np.searchsorted(periods, calendar_periods, side="right") - 1
+    aligned = np.full(len(calendar_periods), np.nan)
+    known = index >= 0
+    aligned[known] = values[index[known]]
+    return aligned
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+# Multiplier taking a price per unit to a price per standard unit, and the name
+# of that standard unit, e.g. a price per g times 1000 is a price per kg.
+UNIT_NORMALIZATION = {
+    "g": (1000, "kg"),
+    "ml": (1000, "L"),
+    "pcs": (1, "pcs"),
+    "loaf": (1, "loaf"),
+    "unit": (1, "unit"),
+}
+
+
+def parse_category(category):
+    """
+    Splits a category such as "1000 g" into its quantity and unit, mirroring
+    `SPLIT_PART(category, ' ', n)`. Unparseable quantities are 0.
+    """
+    parts = (category or "").split(" ")
+    unit = parts[1] if len(parts) > 1 else ""
+    try:
+        quantity = float(parts[0])
+    except ValueError:
+        quantity = 0.0
+    return quantity, unit
+
+
+def standard_unit(unit):
+    """
+    Returns the (factor, standard unit) a unit is normalized to. Units missing
+    from the table are left as they are.
+    """
+    return UNIT_NORMALIZATION.get(unit, (1, unit))
+
+
+def standard_unit_scale(categories):
+    """
+    Returns, for every category, the multiplier turning a price for that
+    category into a price per standard unit (NaN where the quantity is not
+    usable), and the standard unit itself.
+
+    Each distinct category is parsed once and the results are broadcast back
+    to all rows, so this stays cheap for long columns of repeated categories.
+    """
+    distinct, inverse = np.unique(
+        np.asarray(categories, dtype=object), return_inverse=True
+    )
+
+    scales = np.full(len(distinct), np.nan)
+    units = np.empty(len(distinct), dtype=object)
+    for index, category in enumerate(distinct):
+        quantity, unit = parse_category(category)
+        factor, units[index] = standard_unit(unit)
+        if quantity:
+            scales[index] = factor / quantity
+
+    return scales[inverse], units[inverse]
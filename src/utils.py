@@ -1,33 +1,195 @@
 import json
-from flask import jsonify, request, abort
+import uuid
+import datetime
+import itertools
 
+import numpy as np
 
-with open("dashboard_items/nbs_dashboard.json", "r") as file:
-    nbs_dashboard = json.load(file)
+from flask import jsonify, request, abort, Response, stream_with_context
 
-with open("dashboard_items/supermarkets_dashboard.json", "r") as file:
-    supermarkets_dashboard = json.load(file)
+from src.db import borrow_connection, return_connection
+from src.timeseries import RESOLUTIONS
+
+# Number of rows pulled from a server-side cursor per round trip when streaming.
+STREAM_BATCH_SIZE = 2000
 
 
 def validate_nbs_food_item(food_item, nbs_dashboard):
     """
-    Validates that the provided food item is in the list of valid items.
+    Validates that the provided food item is in the catalog of valid items.
     """
     if food_item not in nbs_dashboard:
-        valid_items_list = ", ".join(nbs_dashboard.keys())
         return abort(
             400,
-            f"Please enter a valid food item. The valid food items are: {valid_items_list}",
+            "Please enter a valid food item. The valid food items are: "
+            f"{nbs_dashboard.valid_items}",
         )
 
 
 def validate_supermarkets_food_item(food_item, supermarkets_dashboard):
     """
-    Validates that the provided food item is in the list of valid items.
+    Validates that the provided food item is in the catalog of valid items.
     """
     if food_item not in supermarkets_dashboard:
-        valid_items_list = ", ".join(supermarkets_dashboard.keys())
         return abort(
             400,
-            f"Please enter a valid food item. The valid food items are: {valid_items_list}",
+            "Please enter a valid food item. The valid food items are: "
+            f"{supermarkets_dashboard.valid_items}",
         )
+
+
+def catalog_series(dashboard):
+    """
+    Flattens a dashboard catalog ({food_item: {item_type: [categories]}}) into
+    parallel food_item, item_type and category lists.
+    """
+    food_items, item_types, categories = [], [], []
+    for food_item, types in dashboard.items():
+        for item_type, type_categories in types.items():
+            for category in type_categories:
+                food_items.append(food_item)
+                item_types.append(item_type)
+                categories.append(category)
+    return food_items, item_types, categories
+
+
+def format_overview(records):
+    """
+    Formats (food_item, item_type, unit, price, previous_price) overview records,
+    grouped by food item.
+    """
+    data = {}
+    for food_item, item_type, unit, price, previous_price in records:
+        price = float(price)
+        previous_price = float(previous_price) if previous_price is not None else None
+        percentage_change = (
+            (price - previous_price) * 100 / previous_price if previous_price else 0
+        )
+        data.setdefault(food_item, []).append(
+            {
+                "item_type": item_type,
+                "unit": unit,
+                "average_price": round(price, 2),
+                "previous_average_price": (
+                    round(previous_price, 2) if previous_price is not None else None
+                ),
+                "percentage_change": round(percentage_change, 2),
+            }
+        )
+    return data
+
+
+def wants_stream():
+    """
+    Returns True when the client asked for a streamed (chunked) response.
+    """
+    return request.args.get("stream", "false").lower().strip() == "true"
+
+
+def stream_batches(batches, format_row):
+    """
+    Streams batches of rows as a chunked `{"data": [...]}` JSON response,
+    formatting one batch at a time.
+    """
+
+    def generate():
+        yield '{"data": ['
+        separator = ""
+        for batch in batches:
+            yield separator + ",".join(
+                json.dumps(format_row(row), sort_keys=True) for row in batch
+            )
+            separator = ","
+        yield "]}\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+def stream_records(query, params, format_row, batch_size=STREAM_BATCH_SIZE):
+    """
+    Streams the rows of a query as a chunked `{"data": [...]}` JSON response.
+
+    The rows are read with a named (server-side) cursor in batches of `batch_size`,
+    so only one batch is ever held in memory regardless of the series length.
+    Returns None when the query yields no rows, so callers can 404 as usual.
+    """
+    conn = borrow_connection()
+
+    def release():
+        cur.close()
+        conn.rollback()
+        return_connection(conn)
+
+    try:
+        cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+        cur.itersize = batch_size
+        cur.execute(query, params)
+        first_batch = cur.fetchmany(batch_size)
+    except Exception:
+        conn.rollback()
+        return_connection(conn)
+        raise
+
+    if not first_batch:
+        release()
+        return None
+
+    batches = itertools.chain(
+        [first_batch], iter(lambda: cur.fetchmany(batch_size), [])
+    )
+    response = stream_batches(batches, format_row)
+    # Runs when the server closes the response, even if the client went away
+    # before the body was ever read.
+    response.call_on_close(release)
+    return response
+
+
+def stream_arrays(dates, values, format_row, batch_size=STREAM_BATCH_SIZE):
+    """
+    Streams day and value arrays, e.g. a series from the in-memory store, like
+    `stream_records`, turning one batch at a time into (date, value) rows.
+    """
+    batches = (
+        zip(
+            np.datetime_as_string(dates[start : start + batch_size]).tolist(),
+            values[start : start + batch_size].tolist(),
+        )
+        for start in range(0, len(dates), batch_size)
+    )
+    return stream_batches(batches, format_row)
+
+
+def parse_downsampling_args():
+    """
+    Reads and validates the optional `resolution` and `max_points` query parameters.
+    """
+    resolution = request.args.get("resolution", "day").lower().strip()
+    max_points = request.args.get("max_points", "").strip()
+
+    if resolution not in RESOLUTIONS:
+        return abort(
+            400, f"Invalid resolution. Valid resolutions are: {', '.join(RESOLUTIONS)}"
+        )
+
+    if max_points and (not max_points.isdigit() or int(max_points) < 3):
+        return abort(400, "Invalid max_points. It must be an integer of at least 3.")
+
+    return resolution, int(max_points) if max_points else None
+
+
+def parse_date_range():
+    """
+    Reads and validates the optional `from` and `to` (YYYY-MM-DD) query parameters.
+    """
+    dates = []
+    for name in ("from", "to"):
+        value = request.args.get(name, "").strip()
+        try:
+            dates.append(datetime.date.fromisoformat(value) if value else None)
+        except ValueError:
+            return abort(400, f"Invalid {name} date. Use the YYYY-MM-DD format.")
+
+    start, end = dates
+    if start and end and start > end:
+        return abort(400, "Invalid date range. from must not be after to.")
+    return start, end
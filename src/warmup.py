@@ -0,0 +1,51 @@
+import os
+import gc
+import logging
+
+from src.db import reset_pool
+from src.summary_levels import reset_client
+
+
+logger = logging.getLogger(__name__)
+
+# Requests replayed before a server takes traffic, filling the price store, the
+# catalog, the anomaly monitor and the response cache of the endpoints the
+# landing page needs.
+WARM_PATHS = [
+    path.strip()
+    for path in os.getenv(
+        "WARM_PATHS",
+        "/catalog/,/nbs/overview/,/supermarkets/overview/,/anomalies/",
+    ).split(",")
+    if path.strip()
+]
+
+
+def warm(app):
+    """
+    Loads the shared state by requesting WARM_PATHS through the app. Failures
+    are logged and left for the first real request to retry.
+    """
+    client = app.test_client()
+    for path in WARM_PATHS:
+        response = client.get(path, headers={"Accept-Encoding": "identity"})
+        logger.info("Warmed %s: %s", path, response.status_code)
+
+
+def prepare_fork():
+    """
+    Called in the parent once it is warm. Closes its database connections so no
+    socket is shared with the children, and freezes the objects allocated so
+    far, so the garbage collector doesn't touch (and copy) the shared pages.
+    """
+    reset_pool()
+    gc.freeze()
+
+
+def after_fork():
+    """
+    Called in every forked worker: connections and HTTP clients can't be
+    shared across processes, so they are reopened lazily by the worker.
+    """
+    reset_pool()
+    reset_client()